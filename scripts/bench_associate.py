@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Benchmark the association of author lists when merging large papers.
+
+Generates papers with many authors (as in large collaborations), and a second
+version of each where some names are abbreviated, misspelled or reordered.
+Reports the time taken to associate the two author lists by comparing all
+pairs, and with blocking, as well as how often both give the same pairs.
+
+    python scripts/bench_associate.py --authors 1000 2000 3000
+"""
+
+import argparse
+import random
+import time
+
+from paperoni.model import Author, PaperAuthor
+from paperoni.model.merge import association_blocks, association_key, similarity
+from paperoni.utils import associate
+
+SYLLABLES = [a + b for a in "bcdfgklmnprstvz" for b in "aeiou"]
+
+
+def random_name(rng: random.Random) -> str:
+    def word():
+        return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+    return f"{word().title()} {word().title()}"
+
+
+def perturb(rng: random.Random, name: str) -> str:
+    first, last = name.split(" ", 1)
+    match rng.randrange(4):
+        case 0:
+            # Initial
+            return f"{first[0]}. {last}"
+        case 1:
+            # Typo
+            pos = rng.randrange(1, len(last))
+            return f"{first} {last[:pos]}{last[pos + 1 :]}"
+        case 2:
+            # Accents
+            return name.replace("e", "é", 1)
+        case 3:
+            return name
+
+
+def authors(names):
+    return [PaperAuthor(display_name=n, author=Author(name=n)) for n in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--authors", type=int, nargs="+", default=[1000, 2000, 3000])
+    parser.add_argument("--perturb", type=float, default=0.2, help="Perturbed fraction")
+    parser.add_argument("--swaps", type=int, default=20, help="Number of swaps")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for n in args.authors:
+        names = [random_name(rng) for _ in range(n)]
+        other = [perturb(rng, x) if rng.random() < args.perturb else x for x in names]
+        for _ in range(args.swaps):
+            i, j = rng.randrange(n), rng.randrange(n)
+            other[i], other[j] = other[j], other[i]
+        l1, l2 = authors(names), authors(other)
+
+        results = {}
+        for label, limit in [("all pairs", float("inf")), ("blocked", 10_000)]:
+            t0 = time.perf_counter()
+            results[label] = associate(
+                l1,
+                l2,
+                key=similarity,
+                threshold=0.5,
+                exact=association_key,
+                blocks=association_blocks,
+                quadratic_limit=limit,
+            )
+            print(f"authors={n}  {label}: {time.perf_counter() - t0:.2f}s")
+        agree = sum(
+            a == b for a, b in zip(results["all pairs"], results["blocked"], strict=True)
+        )
+        print(f"authors={n}  same association: {agree}/{n}")
+
+
+if __name__ == "__main__":
+    main()
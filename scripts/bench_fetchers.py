@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Benchmark the throughput of the fetchers on concurrent requests.
+
+Starts a local HTTP server that answers each request after some latency, and
+reads the same URLs concurrently with each fetcher. RequestsFetcher used to
+call requests directly in the event loop, so that concurrent requests ran one
+after the other; that behaviour is reproduced by BlockingRequestsFetcher for
+comparison.
+
+    python scripts/bench_fetchers.py --requests 200 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from paperoni.get import HTTPXFetcher, RequestsFetcher
+
+
+@dataclass
+class BlockingRequestsFetcher(RequestsFetcher):
+    async def generic(self, method, url, **kwargs):
+        return self._request(method, url, **kwargs)
+
+
+def make_server(latency: float, size: int):
+    body = b"x" * size
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run(fetcher, urls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def read(url):
+        async with semaphore:
+            return await fetcher.read(url, format="txt")
+
+    start = time.perf_counter()
+    await asyncio.gather(*[read(url) for url in urls])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05, help="Server latency")
+    parser.add_argument("--size", type=int, default=10_000, help="Response size")
+    args = parser.parse_args()
+
+    server = make_server(args.latency, args.size)
+    base = f"http://127.0.0.1:{server.server_port}"
+    urls = [f"{base}/{i}" for i in range(args.requests)]
+    fetchers = {
+        "requests (blocking)": BlockingRequestsFetcher(),
+        "requests (threads)": RequestsFetcher(threads=args.concurrency),
+        "httpx": HTTPXFetcher(),
+    }
+
+    print(
+        f"{args.requests} requests, {args.concurrency} at once,"
+        f" {args.latency * 1000:.0f}ms latency"
+    )
+    for name, fetcher in fetchers.items():
+        elapsed = asyncio.run(run(fetcher, urls, args.concurrency))
+        print(f"{name:20} {elapsed:8.2f}s {args.requests / elapsed:8.1f} req/s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Benchmark merge against generic_merge on synthetic refinement results.
+
+Generates papers, each with several partial versions like the ones returned
+by different refiners (some fields missing, some with a quality attached),
+then folds the versions of every paper together like merge_all does, once
+with the specialized merge and once with the generic one. With many
+authors, the comparison of their names takes most of the time; use
+--max-authors 0 to measure the merge of the other fields alone.
+
+    python scripts/bench_merge.py -n 2000
+"""
+
+import argparse
+import random
+import time
+from datetime import date
+
+from paperoni.model import (
+    Author,
+    DatePrecision,
+    Institution,
+    Link,
+    Paper,
+    PaperAuthor,
+    Release,
+    Venue,
+    VenueType,
+)
+from paperoni.model.merge import generic_merge, merge, qual
+
+NAMES = "smith nguyen garcia wang li zhang kim martin bernard dubois tremblay roy".split()
+
+
+def random_paper(rng: random.Random, i: int, max_authors: int) -> Paper:
+    authors = [
+        PaperAuthor(
+            display_name=(n := f"{rng.choice('ABCDEFGH')}. {rng.choice(NAMES).title()}"),
+            author=Author(name=n),
+            affiliations=[Institution(name=rng.choice(["Mila", "MIT", "McGill"]))],
+        )
+        for _ in range(rng.randint(min(1, max_authors), max_authors))
+    ]
+    release = Release(
+        venue=Venue(
+            type=VenueType.conference,
+            name=rng.choice(["NeurIPS", "ICML", "ICLR"]),
+            series="",
+            date=date(rng.randint(2015, 2025), 1, 1),
+            date_precision=DatePrecision.year,
+        ),
+        status="published",
+    )
+    return Paper(
+        title=f"Paper number {i}",
+        abstract="An abstract",
+        authors=authors,
+        releases=[release],
+        links=[Link(type="doi", link=f"10.1/{i}")],
+    )
+
+
+def version(rng: random.Random, paper: Paper) -> Paper:
+    # Partial view of the paper, as a refiner would return it
+    p = Paper(
+        title=paper.title,
+        abstract=paper.abstract if rng.random() < 0.5 else None,
+        authors=paper.authors if rng.random() < 0.8 else [],
+        releases=paper.releases if rng.random() < 0.5 else [],
+        links=[Link(type=rng.choice(["arxiv", "openalex", "doi"]), link=paper.title)],
+        info={"refined_by": {rng.choice(["a", "b", "c"]): "now"}},
+    )
+    return qual(p, rng.choice([0, 1, 2])) if rng.random() < 0.3 else p
+
+
+def run(merge_fn, groups):
+    t0 = time.perf_counter()
+    results = []
+    for first, *rest in groups:
+        for other in rest:
+            first = merge_fn(first, other)
+        results.append(first)
+    return time.perf_counter() - t0, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=2000, help="Number of papers")
+    parser.add_argument("--versions", type=int, default=6, help="Versions per paper")
+    parser.add_argument("--max-authors", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    groups = []
+    for i in range(args.n):
+        paper = random_paper(rng, i, args.max_authors)
+        groups.append([version(rng, paper) for _ in range(args.versions)])
+
+    # Warm up the dispatch caches and the generated code
+    run(merge, groups[:10])
+    run(generic_merge, groups[:10])
+
+    t_generic, generic_results = run(generic_merge, groups)
+    print(f"generic: {t_generic:.2f}s")
+    t_specialized, results = run(merge, groups)
+    print(f"specialized: {t_specialized:.2f}s")
+    print(f"speedup: {t_generic / t_specialized:.2f}x")
+    print(f"same results: {results == generic_results}")
+
+
+if __name__ == "__main__":
+    main()
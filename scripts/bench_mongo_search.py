@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Measure event loop latency while MongoCollection.search streams papers.
+
+Fills a scratch database with synthetic papers, then runs several concurrent
+full searches while a probe coroutine measures how late the event loop wakes
+it up. This is run once with per-document deserialization on the event loop
+(search_batch_size=0) and once with batched, thread-offloaded deserialization.
+
+Requires a running MongoDB server:
+
+    python scripts/bench_mongo_search.py --connection mongodb://localhost:27017
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import date
+
+from paperoni.collection.mongocoll import MongoCollection
+from paperoni.model import (
+    Author,
+    DatePrecision,
+    Institution,
+    Link,
+    Paper,
+    PaperAuthor,
+    Release,
+    Venue,
+    VenueType,
+)
+
+
+def synthetic_paper(i: int, n_authors: int = 8) -> Paper:
+    rng = random.Random(i)
+    return Paper(
+        title=f"Synthetic paper {i} on {rng.choice(['graphs', 'vision', 'language'])}",
+        abstract=" ".join(rng.choice(["lorem", "ipsum", "dolor"]) for _ in range(100)),
+        authors=[
+            PaperAuthor(
+                display_name=f"Author {i}-{j}",
+                author=Author(name=f"Author {i}-{j}"),
+                affiliations=[Institution(name=f"University {rng.randint(0, 50)}")],
+            )
+            for j in range(n_authors)
+        ],
+        releases=[
+            Release(
+                venue=Venue(
+                    type=VenueType.conference,
+                    name="Synthetic Conference",
+                    series="SC",
+                    date=date(2000 + i % 25, 1, 1),
+                    date_precision=DatePrecision.year,
+                ),
+                status="published",
+            )
+        ],
+        links=[Link(type="doi", link=f"10.0000/synthetic.{i}")],
+    )
+
+
+async def probe(stop: asyncio.Event, interval: float, lags: list[float]):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - t0 - interval)
+
+
+async def run(coll: MongoCollection, batch_size: int, concurrency: int):
+    coll.search_batch_size = batch_size
+    lags = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(stop, 0.005, lags))
+
+    async def one_search():
+        return sum([1 async for _ in coll.search()])
+
+    t0 = time.perf_counter()
+    counts = await asyncio.gather(*[one_search() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await prober
+
+    lags.sort()
+    print(
+        f"batch_size={batch_size:<5} papers={sum(counts):<7} time={elapsed:.2f}s"
+        f"  lag p50={statistics.median(lags) * 1000:.1f}ms"
+        f"  p99={lags[int(len(lags) * 0.99)] * 1000:.1f}ms"
+        f"  max={lags[-1] * 1000:.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connection", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="paperoni_bench")
+    parser.add_argument("-n", type=int, default=20_000, help="Number of papers")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    coll = MongoCollection(connection_string=args.connection, database=args.database)
+    await coll._ensure_connection()
+    if await coll.count() != args.n:
+        await coll.drop()
+        await coll.add_papers(synthetic_paper(i) for i in range(args.n))
+
+    await run(coll, 0, args.concurrency)
+    await run(coll, args.batch_size, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
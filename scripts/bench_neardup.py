@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Benchmark NearDuplicateIndex on synthetic papers.
+
+Generates papers with random titles and authors, then plants near duplicates
+of some of them (typos, changed punctuation, added subtitles). Reports the
+time taken to index everything, how many of the planted duplicates were found
+and how many spurious groups were reported. For comparison, the time a
+pairwise comparison would take is extrapolated from a small sample.
+
+    python scripts/bench_neardup.py -n 100000
+"""
+
+import argparse
+import itertools
+import random
+import time
+
+from paperoni.collection.neardup import NearDuplicateIndex
+from paperoni.model import Author, Paper, PaperAuthor
+
+WORDS = """
+    learning deep neural network networks graph graphs attention transformer
+    model models language vision image images reinforcement policy robust
+    adversarial training optimization stochastic gradient descent bayesian
+    inference variational generative diffusion representation representations
+    self supervised contrastive efficient scalable sparse causal discovery
+    federated privacy fairness molecules protein design planning control
+    agents multi task transfer few shot zero meta continual benchmark dataset
+    analysis theory convergence bounds kernel kernels embedding embeddings
+    """.split()
+
+SURNAMES = """
+    smith nguyen garcia wang li zhang kim martin bernard dubois tremblay roy
+    gagnon cote bouchard gauthier morin lavoie fortin gelinas bengio courville
+    """.split()
+
+
+def make_vocabulary(rng: random.Random, n: int = 5000) -> list[str]:
+    syllables = [a + b for a in "bcdfgklmnprstvz" for b in "aeiou"]
+    made = {
+        "".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(n)
+    }
+    return WORDS + sorted(made)
+
+
+def random_paper(rng: random.Random, i: int, vocab: list[str], cum_weights) -> Paper:
+    words = rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(5, 12))
+    title = " ".join(words)
+    authors = [
+        f"{chr(65 + rng.randrange(26))}. {rng.choice(SURNAMES).title()}{rng.randrange(1000)}"
+        for _ in range(rng.randint(1, 6))
+    ]
+    return Paper(
+        title=title.capitalize(),
+        authors=[PaperAuthor(display_name=a, author=Author(name=a)) for a in authors],
+        id=str(i),
+    )
+
+
+def perturb(rng: random.Random, paper: Paper, i: int) -> Paper:
+    title = paper.title
+    match rng.randrange(3):
+        case 0:
+            # Typo
+            pos = rng.randrange(len(title))
+            title = title[:pos] + title[pos + 1 :]
+        case 1:
+            # Punctuation and case
+            title = title.upper().replace(" ", ", ", 1) + "."
+        case 2:
+            # Subtitle
+            title = f"{title}: {rng.choice(WORDS)} {rng.choice(WORDS)}"
+    return Paper(title=title, authors=paper.authors, id=str(i))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=100_000, help="Number of papers")
+    parser.add_argument("--dups", type=float, default=0.01, help="Duplicate fraction")
+    parser.add_argument("--sample", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocab = make_vocabulary(rng)
+    # Zipf-like word frequencies, so that common words are shared by many titles
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    papers = [random_paper(rng, i, vocab, cum_weights) for i in range(args.n)]
+    planted = {}
+    for i in range(int(args.n * args.dups)):
+        original = rng.choice(papers)
+        dup = perturb(rng, original, args.n + i)
+        planted[dup.id] = original.id
+        papers.append(dup)
+    rng.shuffle(papers)
+
+    index = NearDuplicateIndex()
+    t0 = time.perf_counter()
+    index.add_all(papers)
+    elapsed = time.perf_counter() - t0
+
+    clusters = index.clusters()
+    group_of = {p.id: n for n, cluster in enumerate(clusters) for p in cluster}
+    found = sum(
+        1
+        for dup, orig in planted.items()
+        if dup in group_of and group_of[dup] == group_of.get(orig)
+    )
+    planted_ids = set(planted) | set(planted.values())
+    spurious = sum(
+        1 for cluster in clusters if not any(p.id in planted_ids for p in cluster)
+    )
+
+    print(f"papers={len(papers)}  index time={elapsed:.2f}s")
+    print(f"planted duplicates found: {found}/{len(planted)}")
+    print(f"groups={len(clusters)}  spurious groups={spurious}")
+
+    # Extrapolate the cost of comparing all pairs from a sample
+    sample = papers[: args.sample]
+    brute = NearDuplicateIndex()
+    entries = [brute._signatures(p) for p in sample]
+    brute._entries = [(p, *e) for p, e in zip(sample, entries)]
+    t0 = time.perf_counter()
+    for i, (sigs, names) in enumerate(entries):
+        for j in range(i):
+            brute._matches(sigs, names, j)
+    pairs = len(sample) * (len(sample) - 1) / 2
+    per_pair = (time.perf_counter() - t0) / pairs
+    total_pairs = len(papers) * (len(papers) - 1) / 2
+    print(f"pairwise comparison estimate: {per_pair * total_pairs:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
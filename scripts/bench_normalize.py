@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Measure search and scoring throughput with and without memoized normalization.
+
+Fills a MemCollection with synthetic papers whose authors, affiliations and
+venues are drawn from limited pools, as in a real collection, then times
+several searches and the scoring of every paper by a set of focuses. This is
+done once with the normalization functions uncached, as they were before,
+and once with their caches, after which the cache statistics are printed.
+
+    python scripts/bench_normalize.py -n 20000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import random
+import time
+from datetime import date
+from unittest.mock import patch
+
+from paperoni import utils
+from paperoni.collection import memcoll
+from paperoni.collection.memcoll import MemCollection
+from paperoni.model import (
+    Author,
+    DatePrecision,
+    Focus,
+    Focuses,
+    Institution,
+    Paper,
+    PaperAuthor,
+    Release,
+    Venue,
+    VenueType,
+    focus,
+)
+
+CACHED = [
+    "plainify",
+    "normalize_institution",
+    "normalize_name",
+    "normalize_title",
+    "normalize_venue",
+    "normalize_topic",
+]
+
+INSTITUTIONS = [
+    "Mila - Quebec AI Institute",
+    "Université de Montréal",
+    "McGill University",
+    "Polytechnique Montréal",
+    "HEC Montréal",
+    "École de technologie supérieure",
+    "University of Toronto",
+    "Vector Institute",
+    "Google DeepMind",
+    "Microsoft Research",
+]
+
+VENUES = ["NeurIPS", "ICML", "ICLR", "AAAI", "CVPR", "Nature", "arXiv"]
+
+
+def random_paper(rng: random.Random, i: int, names: list[str]) -> Paper:
+    return Paper(
+        title=f"Paper {i} on {rng.choice(['graphs', 'vision', 'language'])} modèles",
+        authors=[
+            PaperAuthor(
+                display_name=(n := rng.choice(names)),
+                author=Author(name=n),
+                affiliations=[
+                    Institution(name=rng.choice(INSTITUTIONS))
+                    for _ in range(rng.randint(0, 2))
+                ],
+            )
+            for _ in range(rng.randint(1, 8))
+        ],
+        releases=[
+            Release(
+                venue=Venue(
+                    type=VenueType.conference,
+                    name=rng.choice(VENUES),
+                    series="",
+                    date=date(rng.randint(2015, 2025), 1, 1),
+                    date_precision=DatePrecision.year,
+                ),
+                status="published",
+            )
+        ],
+        id=str(i),
+    )
+
+
+@contextlib.contextmanager
+def uncached():
+    # Rebind the names in the modules that use them to the undecorated functions
+    originals = {name: getattr(utils, name).__wrapped__ for name in CACHED}
+    with contextlib.ExitStack() as stack:
+        for module in (utils, memcoll, focus):
+            for name, fn in originals.items():
+                if hasattr(module, name):
+                    stack.enter_context(patch.object(module, name, fn))
+        yield
+
+
+async def workload(coll: MemCollection, focuses: Focuses, papers: list[Paper]):
+    timings = {}
+    queries = [
+        {"title": "vision mode"},
+        {"author": "tremblay"},
+        {"institution": "montreal"},
+        {"venue": "neurips"},
+        {"author": "=Jeanne Côté", "institution": "mila"},
+    ]
+    t0 = time.perf_counter()
+    for q in queries:
+        await coll.count(**q)
+    timings["search"] = time.perf_counter() - t0
+    # Start without cached scores
+    focuses.compile()
+    t0 = time.perf_counter()
+    for p in papers:
+        focuses.score(p)
+    timings["score"] = time.perf_counter() - t0
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=20_000, help="Number of papers")
+    parser.add_argument("--authors", type=int, default=5000, help="Distinct authors")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    first = ["Jeanne", "Éric", "François", "Yoshua", "Aaron", "Li", "Marie", "José"]
+    last = ["Côté", "Tremblay", "Gagnon", "Núñez", "Wang", "Müller", "Bouchard"]
+    names = [
+        f"{rng.choice(first)} {rng.choice(last)}{k if k else ''}"
+        for k in range(args.authors)
+    ]
+    papers = [random_paper(rng, i, names) for i in range(args.n)]
+    coll = MemCollection()
+    coll._index.index_all(papers)
+    focuses = Focuses(
+        main=[
+            Focus(type="institution", name="Mila - Quebec AI Institute", score=10),
+            *[Focus(type="author", name=n, score=1) for n in names[:200]],
+        ]
+    )
+
+    with uncached():
+        before = await workload(coll, focuses, papers)
+    for fn in utils.normalization_cache_info():
+        getattr(utils, fn).cache_clear()
+    after = await workload(coll, focuses, papers)
+
+    for key in before:
+        speedup = before[key] / after[key]
+        print(f"{key}: {before[key]:.2f}s -> {after[key]:.2f}s ({speedup:.1f}x)")
+    for name, info in utils.normalization_cache_info().items():
+        total = info.hits + info.misses
+        if total:
+            print(f"{name}: {info.hits}/{total} hits ({info.hits / total:.0%})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,14 @@
 import argparse
 import asyncio
+import contextlib
 import functools
 import itertools
 import json
 import logging
+import os
 import random
 import shlex
+import socket
 import sys
 import time
 from collections import Counter
@@ -45,20 +48,23 @@ from .client.utils import login
 from .collection.abc import PaperCollection
 from .collection.filecoll import FileCollection
 from .collection.finder import find_equivalent, paper_index
+from .collection.neardup import NearDuplicateIndex
 from .collection.remotecoll import RemoteCollection
 from .config import config
 from .dash import History
 from .discovery.paperoni_v2 import PaperoniV2
-from .display import display, print_field, terminal_width
+from .display import T, display, print_field, terminal_width
 from .fulltext.locate import URL, locate_all
 from .fulltext.pdf import PDF, CachePolicies, get_pdf
+from .get import clients
 from .heuristics import simplify_paper
 from .model import Link, Paper
-from .model.focus import Focuses, Scored, Top
+from .model.focus import FocusDiff, Focuses, FocusIndex, Scored, Top
 from .model.merge import PaperWorkingSet, merge_all, qual
 from .model.utils import should_reprocess, should_rerun
 from .refinement import fetch_all
 from .refinement.llm_normalize import normalize_paper
+from .refinement.schedule import RefineScheduler
 from .richlog import ErrorOccurred, LogEvent, Logger, ProgressiveCount, Statistic
 from .utils import (
     as_aiter,
@@ -69,6 +75,7 @@ from .utils import (
     split_include_exclude,
     url_to_id,
 )
+from .workdb import WorkDB, WorkDBTop
 
 
 def buche_available():
@@ -158,6 +165,10 @@ def norm_args(norm):
     return {which: (which in norm) for which in ("author", "venue", "institution")}
 
 
+def refine_store():
+    return config.refine.store if config.refine else None
+
+
 @dataclass
 class Productor:
     command: Annotated[
@@ -266,12 +277,22 @@ class Refine:
     # Whether to force re-running the refine
     force: bool = False
 
+    # Query the refiners again instead of reusing their stored results
+    refresh: bool = False
+
     # Output format
     format: Formatter = AutoFormatter
 
     async def run(self):
         results = [
-            p async for p in fetch_all(self.link, tags=self.tags, force=self.force)
+            p
+            async for p in fetch_all(
+                self.link,
+                tags=self.tags,
+                force=self.force,
+                store=refine_store(),
+                refresh=self.refresh or self.force,
+            )
         ]
 
         if self.norm:
@@ -331,6 +352,10 @@ class Work:
 
         async def run(self, work: "Work"):
             work_file = work.work_file or config.work_file
+            if work.db is not None:
+                work.db.configure(self.n, drop_zero=self.drop_zero, clear=self.clear)
+                print(f"Configured {work_file.resolve()} for n={self.n}")
+                return
             if work_file.exists():
                 top = deserialize(
                     Top[Scored[CommentRec[PaperWorkingSet, float]]], work_file
@@ -402,8 +427,7 @@ class Work:
                     new_score = work.focuses.score(found.value.current)
                     if new_score != found.score:
                         found.score = new_score
-                        # Might be unnecessarily expensive but we'll see
-                        work.top.resort()
+                        work.top.update(found)
                     continue
 
                 col_paper = None
@@ -513,9 +537,57 @@ class Work:
         # Whether to force re-running the refine
         force: bool = False
 
+        # Query the refiners again instead of reusing their stored results
+        refresh: bool = False
+
+        # How long the entries are reserved for this process, when the work
+        # file is a database shared with other refine processes
+        lease: timedelta = timedelta(hours=1)
+
+        # Number of seconds after which a refiner is abandoned
+        timeout: float = None
+
+        # Stop refining a paper once its score reaches this value, cancelling
+        # the refiners that are still running
+        enough: float = None
+
+        # Save the results gathered so far at this interval
+        checkpoint: timedelta = timedelta(minutes=1)
+
+        # Maximum number of papers refined at once, best first
+        jobs: int = 20
+
+        # Maximum number of refiners running at once for each refiner tag
+        # (see register_fetch), "*" counting all refiners together
+        simultaneous: dict[str, int] = field(
+            default_factory=lambda: {"*": 50, "prompt": 4}
+        )
+
+        # Stop starting new refinements after this much time
+        time_budget: timedelta = None
+
+        # Stop starting new refinements after this many refiner calls
+        request_budget: int = None
+
         async def run(self, work: "Work"):
             statuses = {}
+            if work.db is not None:
+                work.top = work.claim(self.n, self.lease)
+            store = refine_store()
+            scheduler = RefineScheduler(
+                papers=self.jobs,
+                simultaneous=self.simultaneous,
+                time_budget=self.time_budget,
+                request_budget=self.request_budget,
+            )
             it = list(itertools.islice(work.top, self.n)) if self.n else work.top
+            last_save = time.monotonic()
+
+            def maybe_checkpoint():
+                nonlocal last_save
+                if time.monotonic() - last_save >= self.checkpoint.total_seconds():
+                    work.checkpoint()
+                    last_save = time.monotonic()
 
             for i in range(self.loops):
 
@@ -532,25 +604,38 @@ class Work:
                     links.append(("title", sws.value.current.title))
                     if i == 0:
                         send(to_refine=links)
-                    async for paper in fetch_all(
+                    results = fetch_all(
                         links,
                         group=";".join([f"{type}:{link}" for type, link in links]),
                         tags=self.tags,
                         force=self.force,
                         statuses=statuses,
-                    ):
-                        send(refinement=paper)
-                        sws.value.add(paper)
+                        store=store,
+                        refresh=self.refresh or self.force,
+                        timeout=self.timeout,
+                        scheduler=scheduler,
+                    )
+                    async with contextlib.aclosing(results):
+                        async for paper in results:
+                            send(refinement=paper)
+                            sws.value.add(paper)
+                            if (
+                                self.enough is not None
+                                and work.focuses.score(sws.value) >= self.enough
+                            ):
+                                break
                     sws.score = sws.value.current.score = work.focuses.score(sws.value)
+                    work.top.update(sws)
+                    maybe_checkpoint()
                     return sws
 
-                coros = [
-                    fetch_and_add(sws, i)
-                    for sws in prog(it, name=f"refine{i + 1 if i else ''}")
-                ]
-                await asyncio.gather(*coros)
+                await scheduler.map(
+                    functools.partial(fetch_and_add, i=i),
+                    prog(it, name=f"refine{i + 1 if i else ''}"),
+                )
 
-            work.top.resort()
+            if scheduler.exhausted:
+                print("Refinement budget exhausted")
             work.save()
 
     @dataclass
@@ -732,16 +817,59 @@ class Work:
         else:
             return config.suggestions
 
+    @cached_property
+    def db(self):
+        work_file = deprox(self.work_file or config.work_file)
+        if work_file is not None and work_file.suffix in WorkDB.suffixes:
+            return WorkDB(work_file)
+        return None
+
     @cached_property
     def top(self):
         work_file = self.work_file or config.work_file
-        if not work_file.exists():
+        if not (self.db.configured if self.db is not None else work_file.exists()):
             sys.exit(
                 f"ERROR: {work_file.resolve()} does not exist. Try running\n    paperoni work configure -n N"
             )
+        if self.db is not None:
+            return WorkDBTop(self.db, rescore=self.focuses.score)
         return deserialize(Top[Scored[CommentRec[PaperWorkingSet, float]]], work_file)
 
+    def claim(self, n: int = None, lease: timedelta = timedelta(hours=1)):
+        """Reserve the n best entries of a database work file that no other
+        process reserved, and return them as a top list."""
+        owner = f"{socket.gethostname()}:{os.getpid()}:{id(self)}"
+        rows = self.db.claim(n or self.db.n, owner, lease.total_seconds())
+        return WorkDBTop(self.db, rows=rows, owner=owner, rescore=self.focuses.score)
+
+    def lock(self):
+        """Lock the work file for the duration of a command.
+
+        Database work files are not locked: each write is a transaction, and
+        concurrent changes to the same entry are merged.
+        """
+        if self.db is not None:
+            return contextlib.nullcontext()
+        wf = self.work_file or config.work_file
+        return AsyncFileLock(wf.with_suffix(".lock"), timeout=5)
+
+    def checkpoint(self):
+        """Save the work done so far, keeping the reserved entries reserved."""
+        if self.db is not None:
+            self.top.save(release=False)
+        else:
+            self.save()
+
     def save(self, top=None):
+        if self.db is not None:
+            top = self.top if top is None else top
+            top.save()
+            if top.conflicts:
+                logging.warning(
+                    f"{len(top.conflicts)} removed entries were kept, because"
+                    " another process modified or reserved them"
+                )
+            return
         wfile = deprox(self.work_file or config.work_file)
         wfile.parent.mkdir(exist_ok=True, parents=True)
         dump(
@@ -752,9 +880,7 @@ class Work:
 
     async def run(self):
         __trace__ = f"command:{type(self.command).__name__}"  # noqa: F841
-        wf = self.work_file or config.work_file
-        lf = wf.with_suffix(".lock")
-        async with AsyncFileLock(lf, timeout=5):
+        async with self.lock():
             return await self.command.run(self)
 
 
@@ -816,32 +942,10 @@ class Coll:
         # Number of papers to skip from the first one
         offset: int = 0
 
-        async def run(self, coll: "Coll") -> list[Paper]:
-            include_flags, exclude_flags = split_include_exclude(self.flags)
-            papers = [
-                expand_paper_links(p) if self.expand_links else p
-                async for p in coll.collection.search(
-                    paper_id=self.paper_id,
-                    title=self.title,
-                    author=self.author,
-                    institution=self.institution,
-                    venue=self.venue,
-                    topic=self.topic,
-                    start_date=self.start_date,
-                    end_date=self.end_date,
-                    status=self.status,
-                    include_flags=set(include_flags),
-                    exclude_flags=set(exclude_flags),
-                    limit=self.limit,
-                    offset=self.offset,
-                )
-            ]
-            await self.format(as_aiter(papers))
-            return papers
-
-        async def count(self, coll: "Coll") -> int:
+        def search_options(self) -> dict:
+            """Return the filters to pass to the collection's search or count."""
             include_flags, exclude_flags = split_include_exclude(self.flags)
-            return await coll.collection.count(
+            return dict(
                 paper_id=self.paper_id,
                 title=self.title,
                 author=self.author,
@@ -855,6 +959,21 @@ class Coll:
                 exclude_flags=set(exclude_flags),
             )
 
+        async def run(self, coll: "Coll") -> list[Paper]:
+            papers = [
+                expand_paper_links(p) if self.expand_links else p
+                async for p in coll.collection.search(
+                    **self.search_options(),
+                    limit=self.limit,
+                    offset=self.offset,
+                )
+            ]
+            await self.format(as_aiter(papers))
+            return papers
+
+        async def count(self, coll: "Coll") -> int:
+            return await coll.collection.count(**self.search_options())
+
     @dataclass
     class Import:
         """Import papers from a file."""
@@ -1042,6 +1161,47 @@ class Coll:
                 common, force=True
             )
 
+    @dataclass
+    class Dedupe:
+        """Find near-duplicate papers in the collection, and optionally merge them."""
+
+        # Minimum similarity of the titles, between 0 and 1
+        title_threshold: float = 0.6
+
+        # Minimum similarity of the authors, between 0 and 1
+        author_threshold: float = 0.5
+
+        # Merge each group of duplicates into its first paper. Only the papers
+        # that are all near duplicates of each other are grouped then.
+        merge: bool = False
+
+        async def run(self, coll: "Coll"):
+            index = NearDuplicateIndex(
+                title_threshold=self.title_threshold,
+                author_threshold=self.author_threshold,
+            )
+            total = await coll.collection.count()
+            async for paper in coll.collection.search():
+                index.add(paper)
+                send(progress=("Indexed papers", len(index), total))
+
+            clusters = index.clusters(strict=self.merge)
+            for cluster in clusters:
+                print(T.bold_cyan(f"{len(cluster)} papers:"))
+                for paper in cluster:
+                    print(f"  [{paper.id}] {paper.title}")
+                if self.merge:
+                    merged = replace(merge_all(cluster), id=cluster[0].id)
+                    await coll.collection.add_papers(
+                        [merged], force=True, ignore_exclusions=True
+                    )
+                    await coll.collection.delete_ids([p.id for p in cluster[1:]])
+
+            n = sum(len(cluster) for cluster in clusters)
+            verb = "Merged" if self.merge else "Found"
+            print(f"{verb} {n} papers in {len(clusters)} groups of near duplicates")
+            return clusters
+
     @dataclass
     class Operate:
         """Operate over the paper collection."""
@@ -1050,13 +1210,31 @@ class Coll:
         # [positional]
         operation: Referenced[object]
 
+        # Number of worker processes to operate with (0: in this process)
+        # [alias: -j]
+        jobs: int = 0
+
+        # Number of papers per chunk, each chunk is committed when done
+        chunk_size: int = 1000
+
+        # File to record progress into, run again with the same file to resume
+        checkpoint: Path = None
+
         async def run(self, coll: "Coll"):
-            results = await coll.collection.operate(self.operation)
+            if self.jobs or self.checkpoint:
+                results = await coll.collection.operate_chunked(
+                    self.operation,
+                    jobs=self.jobs,
+                    chunk_size=self.chunk_size,
+                    checkpoint=self.checkpoint,
+                )
+            else:
+                results = await coll.collection.operate(self.operation)
             print(f"Modified {len(results)} papers")
             return results
 
     # Command to execute
-    command: TaggedUnion[Search, Import, Export, Drop, Validate, Diff, Operate]
+    command: TaggedUnion[Search, Import, Export, Drop, Validate, Diff, Dedupe, Operate]
 
     # Collection string. Can be a remote collection URL or a path.
     # [alias: -c]
@@ -1110,8 +1288,12 @@ class Focus:
         # [alias: -t]
         timespan: timedelta = timedelta(weeks=52)
 
+        # Rescore the papers affected by the new focuses
+        rescore: bool = False
+
         async def run(self, focus: "Focus"):
             focuses = focus.focuses or config.focuses
+            before = Focuses(main=list(focuses.main), auto=list(focuses.auto))
             start_date = datetime.now() - self.timespan
             start_date = start_date.date().replace(month=1, day=1)
             focuses.update(
@@ -1119,10 +1301,31 @@ class Focus:
                 config.autofocus,
             )
             focuses.save()
+            if self.rescore:
+                await focus.rescore(focuses, before.diff(focuses))
             return focuses
 
+    @dataclass
+    class Rescore:
+        """Rescore the papers affected by changes to the focuses."""
+
+        # Focus file the current scores were computed with
+        # [positional]
+        previous: Path
+
+        async def run(self, focus: "Focus"):
+            focuses = focus.focuses or config.focuses
+            diff = deserialize(Focuses, self.previous).diff(focuses)
+            for f in diff.added:
+                print(T.bold_green("+"), type(f).encode(f))
+            for f in diff.removed:
+                print(T.bold_red("-"), type(f).encode(f))
+            for old, new in diff.changed:
+                print(T.bold_yellow("~"), type(old).encode(old), "->", new.score)
+            await focus.rescore(focuses, diff)
+
     # Command to execute
-    command: TaggedUnion[AutoFocus]
+    command: TaggedUnion[AutoFocus, Rescore]
 
     # List of focuses
     # [option: -f]
@@ -1139,6 +1342,53 @@ class Focus:
         else:
             return config.collection
 
+    async def rescore(self, focuses: Focuses, diff: FocusDiff):
+        """Rescore the papers of the collection and of the work file that diff
+        may affect, with the given focuses."""
+        if not diff:
+            print("No focus changes affect the scores")
+            return
+
+        # Only fetch the papers with the authors and institutions of the diff.
+        # The institution search also matches inside words, so the index then
+        # keeps the papers that the focuses actually match.
+        candidates = {}
+        for t, name in diff.keys():
+            if t == "author":
+                query = {"author": f"={name}"}
+            elif t == "institution":
+                query = {"institution": name}
+            else:
+                continue
+            async for p in self.collection.search(**query):
+                candidates[p.id] = p
+        index = FocusIndex()
+        for paper_id, p in candidates.items():
+            index.add(paper_id, p)
+        rescored = []
+        for paper_id in index.affected(diff):
+            p = candidates[paper_id]
+            if (score := focuses.score(p)) != p.score:
+                rescored.append(replace(p, score=score))
+        await self.collection.add_papers(rescored, force=True, ignore_exclusions=True)
+        print(f"Rescored {len(rescored)} papers in the collection")
+
+        work = Work(command=None)
+        work_file = work.work_file or config.work_file
+        if work_file and work_file.exists():
+            async with work.lock():
+                entries = list(work.top.entries)
+                index = FocusIndex()
+                for i, sws in enumerate(entries):
+                    index.add(i, sws.value.current)
+                affected = index.affected(diff)
+                for i in affected:
+                    sws = entries[i]
+                    sws.score = sws.value.current.score = focuses.score(sws.value)
+                    work.top.update(sws)
+                work.save()
+            print(f"Rescored {len(affected)} papers in the work file")
+
     async def run(self):
         await self.command.run(self)
 
@@ -1510,6 +1760,13 @@ def enable_dash():
             dash["prompt"] = History(values)
 
 
+async def _run(command):
+    try:
+        await command.run()
+    finally:
+        await clients.aclose()
+
+
 def main():
     with outsight:
         parser = argparse.ArgumentParser(add_help=False)
@@ -1518,7 +1775,7 @@ def main():
         if args.config:
             add_overlay(Path(args.config))
         command = cli(field="paperoni.cli", type=PaperoniInterface, argv=remaining)
-        asyncio.run(command.run())
+        asyncio.run(_run(command))
 
 
 if __name__ == "__main__":
@@ -1,7 +1,14 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from datetime import date, datetime
-from typing import AsyncGenerator, Callable, Iterable
+from pathlib import Path
+from typing import AsyncGenerator, Callable, Iterable, Literal
 
+import gifnoc
+from serieux import deserialize, dump, serialize
 from serieux.features.registered import Referenced
 
 from ..model.classes import Paper
@@ -21,6 +28,55 @@ _id_types = {
 }
 
 
+@dataclass
+class ChangeEvent:
+    # Position of the event in the collection's change feed
+    seq: int
+    # Kind of change
+    op: Literal["add", "update", "delete", "exclude", "unexclude", "drop"]
+    # ID of the paper, or the exclusion string for exclude/unexclude
+    paper_id: str = None
+    # Version of the paper after the change
+    version: datetime = None
+
+
+class ChangeFeedExpired(Exception):
+    """Some of the requested changes are no longer retained by the feed.
+
+    Consumers should resynchronize from a full read of the collection.
+    """
+
+
+@dataclass
+class OperateCheckpoint:
+    # IDs of the papers to operate on, split in chunks
+    chunks: list[list[str]]
+    # Indexes of the chunks that have been committed
+    done: set[int] = field(default_factory=set)
+
+    def save(self, path: Path):
+        tmp = path.with_stem(f"{path.stem}.tmp")
+        dump(OperateCheckpoint, self, dest=tmp)
+        tmp.replace(path)
+
+
+# Operator used by _operate_chunk in worker processes, set by _init_worker
+_worker_operator = None
+
+
+def _init_worker(operator: str, sources: list):
+    global _worker_operator
+    from .. import config  # noqa: F401
+
+    gifnoc.global_registry.set_sources(*sources)
+    _worker_operator = deserialize(Referenced[object], operator)
+
+
+def _operate_chunk(papers: list[Paper], operator=None) -> list[Paper]:
+    operator = operator or _worker_operator
+    return [r.new for p in papers if (r := operator(p)).changed]
+
+
 @dataclass
 class PaperCollection:
     operations: list[Referenced[object]] = field(default_factory=list)
@@ -104,6 +160,141 @@ class PaperCollection:
                 edits.append(result.new)
         return await self.add_papers(edits, force=True, ignore_exclusions=True)
 
+    async def operate_chunked(
+        self,
+        operator: Callable[[Paper], OperationResult],
+        jobs: int = 0,
+        chunk_size: int = 1000,
+        checkpoint: Path = None,
+        lookups: int = 32,
+        **search_options,
+    ) -> list[str]:
+        """Operate over every paper in the dataset, one chunk at a time.
+
+        Each chunk is committed as soon as it is processed. If jobs > 0, chunks
+        are processed by that many worker processes, which requires operator to
+        be a pure function of the paper that can be referenced as module:name.
+        If a checkpoint file is given, progress is recorded into it, and running
+        again with the same file resumes an interrupted run. The file is deleted
+        once all chunks are done. At most lookups papers are fetched at once.
+        """
+        if checkpoint and checkpoint.exists():
+            ckpt = deserialize(OperateCheckpoint, checkpoint)
+        else:
+            ids = [p.id async for p in self.search(**search_options)]
+            ckpt = OperateCheckpoint(
+                chunks=[ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)]
+            )
+            if checkpoint:
+                ckpt.save(checkpoint)
+
+        if jobs > 0:
+            # Forking a process that runs threads can deadlock, so the workers
+            # are spawned, and get the operator by reference along with the
+            # sources of the active configuration
+            reference = serialize(Referenced[object], operator)
+            if deserialize(Referenced[object], reference) is not operator:
+                raise TypeError(
+                    f"{operator!r} must be reachable as {reference} to run in workers"
+                )
+            current = gifnoc.global_registry.current()
+            pool = ProcessPoolExecutor(
+                jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(reference, current.sources if current else []),
+            )
+            loop = asyncio.get_running_loop()
+
+            def run(papers):
+                return loop.run_in_executor(pool, _operate_chunk, papers)
+
+        else:
+            pool = None
+
+            async def run(papers):
+                return _operate_chunk(papers, operator)
+
+        # Keep the workers busy while chunks are being loaded and committed
+        semaphore = asyncio.Semaphore(max(jobs, 1) * 2)
+        lookup_semaphore = asyncio.Semaphore(lookups)
+        modified = []
+
+        async def find(paper_id):
+            async with lookup_semaphore:
+                return await self.find_by_id(paper_id)
+
+        async def process(i):
+            async with semaphore:
+                papers = await asyncio.gather(
+                    *[find(paper_id) for paper_id in ckpt.chunks[i]]
+                )
+                edits = await run([p for p in papers if p is not None])
+                modified.extend(
+                    await self.add_papers(edits, force=True, ignore_exclusions=True)
+                )
+            ckpt.done.add(i)
+            if checkpoint:
+                ckpt.save(checkpoint)
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for i in range(len(ckpt.chunks)):
+                    if i not in ckpt.done:
+                        tg.create_task(process(i))
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        if checkpoint:
+            checkpoint.unlink()
+        return modified
+
+    async def last_seq(self) -> int:
+        """Return the sequence number of the latest change."""
+        raise NotImplementedError()
+
+    async def _changes_since(self, since: int) -> list[ChangeEvent]:
+        raise NotImplementedError()
+
+    async def changes(
+        self, since: int = 0, timeout: float = 0, poll_interval: float = 0.5
+    ) -> AsyncGenerator[ChangeEvent, None]:
+        """Yield the changes made after sequence number ``since``, in order.
+
+        If there are none yet, wait up to ``timeout`` seconds for some to
+        happen. Raises ChangeFeedExpired if changes after ``since`` were
+        dropped from the feed.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            events = await self._changes_since(since)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                break
+            await self._wait_for_change(min(remaining, poll_interval))
+        for event in events:
+            yield event
+
+    def _change_waiters(self) -> set[asyncio.Event]:
+        return self.__dict__.setdefault("_waiters", set())
+
+    async def _wait_for_change(self, timeout: float):
+        # Changes made by this process wake us up early; changes made by other
+        # processes are picked up when the timeout expires.
+        waiter = asyncio.Event()
+        self._change_waiters().add(waiter)
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except TimeoutError:
+            pass
+        finally:
+            self._change_waiters().discard(waiter)
+
+    def _notify_change(self):
+        for waiter in self._change_waiters():
+            waiter.set()
+
     async def search(
         self,
         # Paper ID
@@ -15,7 +15,7 @@ from ..utils import (
     split_include_exclude,
     to_sync,
 )
-from .abc import PaperCollection
+from .abc import ChangeEvent, ChangeFeedExpired, PaperCollection
 from .finder import Index, find_equivalent, paper_indexers
 
 
@@ -42,6 +42,8 @@ class PaperIndex(Index[Paper]):
     last_id: int = -1
     indexers: dict[str, Any] = field(default_factory=lambda: paper_indexers)
     exclusions: set[str] = field(default_factory=set)
+    seq: int = 0
+    journal: list[ChangeEvent] = field(default_factory=list)
 
     def next_id(self) -> str:
         return str(uuid4())
@@ -61,6 +63,8 @@ class PaperIndex(Index[Paper]):
             "_last_id": serialize(int, obj.last_id, ctx),
             "_papers": serialize(list[Paper], list(obj), ctx),
             "_exclusions": serialize(set[str], obj.exclusions, ctx),
+            "_seq": serialize(int, obj.seq, ctx),
+            "_journal": serialize(list[ChangeEvent], obj.journal, ctx),
         }
 
     @classmethod
@@ -68,6 +72,8 @@ class PaperIndex(Index[Paper]):
         rval = cls(
             last_id=deserialize(int, obj["_last_id"]),
             exclusions=deserialize(set[str], obj["_exclusions"]),
+            seq=deserialize(int, obj.get("_seq", 0)),
+            journal=deserialize(list[ChangeEvent], obj.get("_journal", []), ctx),
         )
         rval.index_all(deserialize(list[Paper], obj["_papers"], ctx))
         return rval
@@ -75,23 +81,52 @@ class PaperIndex(Index[Paper]):
 
 @dataclass
 class MemCollection(PaperCollection):
+    # Number of most recent changes kept in the change feed
+    journal_size: int = 10_000
+
     def __post_init__(self):
         self._index = PaperIndex()
 
+    def _record(self, op: str, paper_id: str = None, version: datetime = None):
+        idx = self._index
+        idx.seq += 1
+        idx.journal.append(
+            ChangeEvent(seq=idx.seq, op=op, paper_id=paper_id, version=version)
+        )
+        if len(idx.journal) > self.journal_size:
+            del idx.journal[: len(idx.journal) - self.journal_size]
+        self._notify_change()
+
+    async def last_seq(self) -> int:
+        return self._index.seq
+
+    async def _changes_since(self, since: int) -> list[ChangeEvent]:
+        idx = self._index
+        if since >= idx.seq:
+            return []
+        journal = idx.journal
+        if not journal or journal[0].seq > since + 1:
+            raise ChangeFeedExpired(f"Changes after #{since} are no longer available")
+        return journal[since - journal[0].seq + 1 :]
+
     async def exclusions(self) -> set[str]:
         return self._index.exclusions
 
     async def add_exclusions(self, exclusions: list[str]) -> None:
         """Add exclusion strings."""
         for exclusion in exclusions:
-            self._index.exclusions.add(exclusion)
+            if exclusion not in self._index.exclusions:
+                self._index.exclusions.add(exclusion)
+                self._record("exclude", exclusion)
         if exclusions:
             await self.commit()
 
     async def remove_exclusions(self, exclusions: list[str]) -> None:
         """Remove exclusion strings."""
         for exclusion in exclusions:
-            self._index.exclusions.discard(exclusion)
+            if exclusion in self._index.exclusions:
+                self._index.exclusions.discard(exclusion)
+                self._record("unexclude", exclusion)
         if exclusions:
             await self.commit()
 
@@ -135,6 +170,7 @@ class MemCollection(PaperCollection):
                     # Replace existing paper
                     self._index.remove(paper)
                 self._index.index(p)
+                self._record("update" if paper else "add", p.id, p.version)
 
         finally:
             if added_ids:
@@ -148,6 +184,7 @@ class MemCollection(PaperCollection):
             for i in ids:
                 if paper := self._index.find("id", i):
                     self._index.remove(paper)
+                    self._record("delete", paper.id)
                     deleted += 1
         finally:
             if deleted:
@@ -171,6 +208,7 @@ class MemCollection(PaperCollection):
         self._index.last_index = -1
         self._index.exclusions.clear()
         self._index.indexes = {k: {} for k in self._index.indexes}
+        self._record("drop")
         await self.commit()
 
     async def search(
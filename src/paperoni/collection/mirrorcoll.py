@@ -0,0 +1,152 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncGenerator, Iterable
+
+from serieux import TaggedSubclass
+
+from ..model.classes import Paper
+from .abc import ChangeEvent, ChangeFeedExpired, PaperCollection
+from .memcoll import MemCollection
+
+
+@dataclass(kw_only=True)
+class MirrorCollection(PaperCollection):
+    """Serve reads from an in-memory replica of another collection.
+
+    The replica is loaded in full on first use, then kept up to date by tailing
+    the primary's change feed. Writes go to the primary, after which the
+    replica is synchronized immediately, so that a process always sees its
+    own writes.
+    """
+
+    # Collection that holds the data and receives the writes
+    primary: TaggedSubclass[PaperCollection]
+    # Number of seconds a read may go without checking the primary for changes
+    sync_interval: float = 5.0
+
+    def __post_init__(self):
+        self._replica: MemCollection = None
+        self._seq = 0
+        self._synced_at = -float("inf")
+        self._lock = asyncio.Lock()
+
+    async def sync(self) -> None:
+        """Bring the replica up to date with the primary."""
+        async with self._lock:
+            try:
+                if self._replica is None:
+                    await self._reload()
+                else:
+                    await self._catch_up()
+            except ChangeFeedExpired:
+                await self._reload()
+            self._synced_at = time.monotonic()
+
+    async def _maybe_sync(self):
+        if (
+            self._replica is None
+            or time.monotonic() - self._synced_at >= self.sync_interval
+        ):
+            await self.sync()
+
+    async def _reload(self):
+        # Read the position first: changes made during the load are replayed
+        # on the next sync, which is harmless since applying them is idempotent
+        seq = await self.primary.last_seq()
+        replica = MemCollection()
+        replica._index.index_all([p async for p in self.primary.search()])
+        replica._index.exclusions.update(await self.primary.exclusions())
+        self._replica = replica
+        self._seq = seq
+
+    async def _catch_up(self):
+        while events := [e async for e in self.primary.changes(since=self._seq)]:
+            await self._apply(events)
+            self._seq = events[-1].seq
+
+    async def _apply(self, events: list[ChangeEvent]):
+        if any(e.op == "drop" for e in events):
+            raise ChangeFeedExpired("The primary collection was dropped")
+
+        idx = self._replica._index
+        for e in events:
+            if e.op == "exclude":
+                idx.exclusions.add(e.paper_id)
+            elif e.op == "unexclude":
+                idx.exclusions.discard(e.paper_id)
+
+        # Only the latest state of each paper matters, so fetch it once
+        ids = list(
+            dict.fromkeys(
+                e.paper_id for e in events if e.op in ("add", "update", "delete")
+            )
+        )
+        papers = await asyncio.gather(*[self.primary.find_by_id(i) for i in ids])
+        for paper_id, paper in zip(ids, papers):
+            if paper is not None:
+                idx.replace(paper)
+            elif old := idx.find("id", paper_id):
+                idx.remove(old)
+
+    async def last_seq(self) -> int:
+        return await self.primary.last_seq()
+
+    async def changes(
+        self, since: int = 0, timeout: float = 0, poll_interval: float = 0.5
+    ) -> AsyncGenerator[ChangeEvent, None]:
+        async for event in self.primary.changes(
+            since=since, timeout=timeout, poll_interval=poll_interval
+        ):
+            yield event
+
+    async def add_exclusions(self, exclusions: list[str]) -> None:
+        await self.primary.add_exclusions(exclusions)
+        await self.sync()
+
+    async def remove_exclusions(self, exclusions: list[str]) -> None:
+        await self.primary.remove_exclusions(exclusions)
+        await self.sync()
+
+    async def add_papers(
+        self, papers: Iterable[Paper], force=False, ignore_exclusions=False
+    ) -> list[int | str]:
+        ids = await self.primary.add_papers(
+            papers, force=force, ignore_exclusions=ignore_exclusions
+        )
+        await self.sync()
+        return ids
+
+    async def delete_ids(self, ids: list[str]) -> int:
+        deleted = await self.primary.delete_ids(ids)
+        await self.sync()
+        return deleted
+
+    async def drop(self) -> None:
+        await self.primary.drop()
+        await self.sync()
+
+    async def exclusions(self) -> set[str]:
+        await self._maybe_sync()
+        return await self._replica.exclusions()
+
+    async def is_excluded(self, s: str):
+        await self._maybe_sync()
+        return await self._replica.is_excluded(s)
+
+    async def find_paper(self, paper: Paper) -> Paper | None:
+        await self._maybe_sync()
+        return await self._replica.find_paper(paper)
+
+    async def find_by_id(self, paper_id: str) -> Paper | None:
+        await self._maybe_sync()
+        return await self._replica.find_by_id(paper_id)
+
+    async def search(self, **search_options) -> AsyncGenerator[Paper, None]:
+        await self._maybe_sync()
+        async for paper in self._replica.search(**search_options):
+            yield paper
+
+    async def count(self, **search_options) -> int:
+        await self._maybe_sync()
+        return await self._replica.count(**search_options)
@@ -1,3 +1,5 @@
+import asyncio
+import time
 from dataclasses import replace
 from datetime import date, datetime
 from re import escape
@@ -10,7 +12,8 @@ from motor.motor_asyncio import (
     AsyncIOMotorDatabase,
 )
 from ovld import Medley, call_next
-from pymongo.errors import DuplicateKeyError
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import CollectionInvalid
 from serieux import Context, Serieux
 from serieux.features.encrypt import Secret
 
@@ -28,7 +31,7 @@ from ..utils import (
     split_include_exclude,
     to_sync,
 )
-from .abc import PaperCollection
+from .abc import ChangeEvent, ChangeFeedExpired, PaperCollection
 from .finder import extract_latest
 
 
@@ -79,6 +82,10 @@ class MongoSerieux(Medley):
 srx = (Serieux + MongoSerieux)()
 
 
+def _deserialize_batch(docs: list[dict]) -> list[Paper]:
+    return [srx.deserialize(Paper, doc) for doc in docs]
+
+
 @dataclass
 class MongoCollection(PaperCollection):
     """Async MongoDB implementation of PaperCollection using motor."""
@@ -88,12 +95,29 @@ class MongoCollection(PaperCollection):
     database: str = "paperoni"
     collection: str = "papers"
     exclusions_collection: str = "exclusions"
+    # Capped collection holding the change feed
+    changes_collection: str = "changes"
+    # Collection holding the change feed's sequence counter
+    counters_collection: str = "counters"
+    # Maximum number of changes retained in the change feed
+    changes_max: int = 100_000
+    # Seconds after which a hole in the sequence numbers of the change feed is
+    # considered to be a write that failed, rather than one in progress
+    changes_gap_timeout: float = 60
+    # Number of documents to fetch per round trip in search. When > 0, each
+    # batch is deserialized in a worker thread while the next one is fetched,
+    # so that large searches do not hog the event loop. When 0, documents are
+    # deserialized one by one on the event loop.
+    search_batch_size: int = 0
 
     def __post_init__(self):
         self._client: AsyncIOMotorClient = None
         self._database: AsyncIOMotorDatabase = None
         self._collection: AsyncIOMotorCollection = None
         self._exclusions: AsyncIOMotorCollection = None
+        self._changes: AsyncIOMotorCollection = None
+        self._counters: AsyncIOMotorCollection = None
+        self._changes_ready = False
 
     async def _ensure_connection(self):
         """Ensure MongoDB connection is established."""
@@ -102,6 +126,8 @@ class MongoCollection(PaperCollection):
             self._database = self._client[self.database]
             self._collection = self._database[self.collection]
             self._exclusions = self._database[self.exclusions_collection]
+            self._changes = self._database[self.changes_collection]
+            self._counters = self._database[self.counters_collection]
 
             if self.create_indexes:
                 # Create indexes for efficient searching
@@ -145,6 +171,85 @@ class MongoCollection(PaperCollection):
         # Index on exclusions
         await self._exclusions.create_index("link", unique=True)
 
+    async def _ensure_changes(self):
+        """Create the capped change feed collection if it does not exist."""
+        if self._changes_ready:
+            return
+        names = await self._database.list_collection_names()
+        if self.changes_collection not in names:
+            try:
+                await self._database.create_collection(
+                    self.changes_collection,
+                    capped=True,
+                    # Events are small, 256 bytes each is a generous upper bound
+                    size=self.changes_max * 256,
+                    max=self.changes_max,
+                )
+            except CollectionInvalid:
+                # Created concurrently by another process
+                pass
+        self._changes_ready = True
+
+    async def _record(self, changes: list[tuple[str, str, datetime]]):
+        """Append (op, paper_id, version) entries to the change feed."""
+        if not changes:
+            return
+        await self._ensure_changes()
+        counter = await self._counters.find_one_and_update(
+            {"_id": self.changes_collection},
+            {"$inc": {"seq": len(changes)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        first = counter["seq"] - len(changes) + 1
+        now = time.time()
+        await self._changes.insert_many(
+            {
+                "_id": first + i,
+                "op": op,
+                "paper_id": paper_id,
+                "version": version,
+                "time": now,
+            }
+            for i, (op, paper_id, version) in enumerate(changes)
+        )
+        self._notify_change()
+
+    async def last_seq(self) -> int:
+        await self._ensure_connection()
+        counter = await self._counters.find_one({"_id": self.changes_collection})
+        return counter["seq"] if counter else 0
+
+    async def _changes_since(self, since: int) -> list[ChangeEvent]:
+        await self._ensure_connection()
+        if since >= await self.last_seq():
+            return []
+        oldest = await self._changes.find_one({}, sort=[("_id", 1)])
+        if oldest is None or oldest["_id"] > since + 1:
+            raise ChangeFeedExpired(f"Changes after #{since} are no longer available")
+        # Sequence numbers are allocated before the events are inserted, so a
+        # concurrent writer may still be inserting an earlier event than the
+        # ones that are visible. Stop at the first hole, unless the events
+        # after it are too old for that to be the case.
+        events = []
+        expected = since + 1
+        async for doc in self._changes.find({"_id": {"$gt": since}}).sort("_id", 1):
+            if (
+                doc["_id"] != expected
+                and time.time() - doc.get("time", 0) < self.changes_gap_timeout
+            ):
+                break
+            events.append(
+                ChangeEvent(
+                    seq=doc["_id"],
+                    op=doc["op"],
+                    paper_id=doc.get("paper_id"),
+                    version=doc.get("version"),
+                )
+            )
+            expected = doc["_id"] + 1
+        return events
+
     async def exclusions(self) -> set[str]:
         """Get the set of excluded paper identifiers."""
         await self._ensure_connection()
@@ -156,20 +261,28 @@ class MongoCollection(PaperCollection):
         if not exclusions:
             return
         await self._ensure_connection()
-        try:
-            await self._exclusions.insert_many(
-                ({"link": x} for x in exclusions), ordered=False
-            )
-        except DuplicateKeyError:
-            # Some exclusions already exist, that's fine
-            pass
+        exclusions = list(dict.fromkeys(exclusions))
+        result = await self._exclusions.bulk_write(
+            [
+                UpdateOne({"link": x}, {"$setOnInsert": {"link": x}}, upsert=True)
+                for x in exclusions
+            ],
+            ordered=False,
+        )
+        # Only the exclusions that were not already there are changes
+        added = [exclusions[i] for i in sorted(result.upserted_ids)]
+        await self._record([("exclude", x, None) for x in added])
 
     async def remove_exclusions(self, exclusions: list[str]) -> None:
         """Remove exclusion strings."""
         if not exclusions:
             return
         await self._ensure_connection()
-        await self._exclusions.delete_many({"link": {"$in": exclusions}})
+        removed = []
+        for x in dict.fromkeys(exclusions):
+            if (await self._exclusions.delete_one({"link": x})).deleted_count:
+                removed.append(x)
+        await self._record([("unexclude", x, None) for x in removed])
 
     async def is_excluded(self, s: str):
         """Return whether a link is excluded."""
@@ -185,33 +298,42 @@ class MongoCollection(PaperCollection):
         if not ignore_exclusions:
             papers = await to_sync(self.filter_exclusions(papers))
 
-        for p in papers:
-            p = self.prepare(p)
-
-            # Handle existing papers
-            existing_paper: Paper = None
-            if existing_paper := await self._collection.find_one({"_id": ObjectId(p.id)}):
-                if not force:
-                    existing_paper = srx.deserialize(Paper, existing_paper)
-                    if existing_paper.version > p.version:
-                        # Paper has been updated since last time it was fetched.
-                        # Do not replace it.
-                        continue
-                p.version = datetime.now()
-                await self._collection.replace_one(
-                    {"_id": ObjectId(p.id)}, srx.serialize(Paper, p)
-                )
-
-            elif p.id is not None and not force:
-                raise ValueError(f"Paper with ID {p.id} not found in collection")
-
-            else:
-                p.version = datetime.now()
-                # assert not await self._collection.find_one({"_id": p.id})
-                result = await self._collection.insert_one(srx.serialize(Paper, p))
-                p = replace(p, id=str(result.inserted_id))
-
-            added_ids.append(p.id)
+        changes = []
+        try:
+            for p in papers:
+                p = self.prepare(p)
+
+                # Handle existing papers
+                existing_paper: Paper = None
+                if existing_paper := await self._collection.find_one(
+                    {"_id": ObjectId(p.id)}
+                ):
+                    if not force:
+                        existing_paper = srx.deserialize(Paper, existing_paper)
+                        if existing_paper.version > p.version:
+                            # Paper has been updated since last time it was fetched.
+                            # Do not replace it.
+                            continue
+                    p.version = datetime.now()
+                    await self._collection.replace_one(
+                        {"_id": ObjectId(p.id)}, srx.serialize(Paper, p)
+                    )
+                    changes.append(("update", p.id, p.version))
+
+                elif p.id is not None and not force:
+                    raise ValueError(f"Paper with ID {p.id} not found in collection")
+
+                else:
+                    p.version = datetime.now()
+                    # assert not await self._collection.find_one({"_id": p.id})
+                    result = await self._collection.insert_one(srx.serialize(Paper, p))
+                    p = replace(p, id=str(result.inserted_id))
+                    changes.append(("add", p.id, p.version))
+
+                added_ids.append(p.id)
+
+        finally:
+            await self._record(changes)
 
         return added_ids
 
@@ -247,9 +369,12 @@ class MongoCollection(PaperCollection):
     async def delete_ids(self, ids: list[int]) -> int:
         """Delete papers by ID."""
         await self._ensure_connection()
-        result = await self._collection.delete_many(
-            {"_id": {"$in": [ObjectId(i) for i in ids]}}
-        )
+        query = {"_id": {"$in": [ObjectId(i) for i in ids]}}
+        existing = [
+            str(doc["_id"]) async for doc in self._collection.find(query, {"_id": 1})
+        ]
+        result = await self._collection.delete_many(query)
+        await self._record([("delete", i, None) for i in existing])
         return result.deleted_count
 
     async def drop(self) -> None:
@@ -257,10 +382,14 @@ class MongoCollection(PaperCollection):
         await self._ensure_connection()
         await self._collection.delete_many({})
         await self._exclusions.delete_many({})
+        await self._record([("drop", None, None)])
         self._client = None
         self._database = None
         self._collection = None
         self._exclusions = None
+        self._changes = None
+        self._counters = None
+        self._changes_ready = False
 
     async def _build_query(
         self,
@@ -399,8 +528,34 @@ class MongoCollection(PaperCollection):
         if limit > 0:
             cursor = cursor.limit(limit)
 
-        async for doc in cursor:
-            yield srx.deserialize(Paper, doc)
+        if self.search_batch_size > 0:
+            async for paper in self._search_batched(cursor, self.search_batch_size):
+                yield paper
+        else:
+            async for doc in cursor:
+                yield srx.deserialize(Paper, doc)
+
+    async def _search_batched(self, cursor, batch_size: int):
+        """Yield papers from cursor, deserializing batches in a worker thread.
+
+        The next batch is fetched from the server while the current one is
+        being deserialized.
+        """
+        cursor = cursor.batch_size(batch_size)
+        docs = await cursor.to_list(batch_size)
+        pending = None
+        try:
+            while docs:
+                pending = asyncio.ensure_future(cursor.to_list(batch_size))
+                for paper in await asyncio.to_thread(_deserialize_batch, docs):
+                    yield paper
+                docs = await pending
+                pending = None
+        finally:
+            if pending is not None:
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+            await cursor.close()
 
     async def count(
         self,
@@ -0,0 +1,209 @@
+import random
+import re
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import cache
+from typing import Iterable
+
+from ..model.classes import Paper
+from ..utils import plainify, quick_author_similarity
+
+# Added to the values borrowed from another bin when densifying a signature,
+# once per bin skipped, so that they do not collide with the values of that bin
+_DENSIFY_OFFSET = 2**32
+
+# Separates a title from its subtitle
+_subtitle_sep = re.compile(r"\s*(?::|\s-{1,2}\s|—)\s*")
+
+
+def title_shingles(title: str, size: int = 4) -> set[str]:
+    """Return the set of character n-grams of the title, ignoring punctuation."""
+    t = re.sub(r"[^a-z0-9]", "", plainify(title or ""))
+    if len(t) <= size:
+        return {t}
+    return {t[i : i + size] for i in range(len(t) - size + 1)}
+
+
+@cache
+def _probes(num_perm: int) -> list[list[int]]:
+    # For each bin, the order in which to look at other bins to fill it when it
+    # is empty. It is random so that neighbouring bins do not all borrow from
+    # the same bin, which would make their values correlated.
+    rng = random.Random(num_perm)
+    return [rng.sample(range(num_perm), num_perm) for _ in range(num_perm)]
+
+
+def minhash(shingles: Iterable[str], num_perm: int) -> tuple[int, ...]:
+    """Compute a MinHash signature of num_perm values for the shingles.
+
+    This uses one permutation hashing: each shingle is hashed once, the hash
+    picks a bin and each bin keeps its minimum. Empty bins borrow the value of
+    a non-empty bin (densification), so that the fraction of positions on which
+    two signatures agree estimates the Jaccard similarity of the shingles.
+    """
+    bins = [None] * num_perm
+    for s in shingles:
+        h = zlib.crc32(s.encode())
+        b, v = h % num_perm, h // num_perm
+        if bins[b] is None or v < bins[b]:
+            bins[b] = v
+    if all(v is None for v in bins):
+        return (0,) * num_perm
+    sig = list(bins)
+    for i, v in enumerate(bins):
+        if v is None:
+            for attempt, j in enumerate(_probes(num_perm)[i], 1):
+                if bins[j] is not None:
+                    sig[i] = bins[j] + attempt * _DENSIFY_OFFSET
+                    break
+    return tuple(sig)
+
+
+@dataclass
+class NearDuplicateIndex:
+    """Index papers to find those that are near duplicates of each other.
+
+    Titles are compared through MinHash signatures of their character shingles,
+    which are split in bands and hashed into buckets (locality-sensitive
+    hashing). Two papers are candidates if they share a bucket, and duplicates
+    if their titles and their authors are similar enough. Finding the
+    duplicates of a paper therefore costs about the same regardless of the
+    size of the index.
+
+    A title with a subtitle is also indexed without it, so that it can match
+    the same title with a different subtitle or none at all.
+    """
+
+    # Number of values in each MinHash signature
+    num_perm: int = 96
+    # Number of LSH bands, must divide num_perm. More bands find more
+    # candidates with lower similarity, at the cost of more comparisons.
+    bands: int = 16
+    # Size of the character shingles of the titles
+    shingle_size: int = 4
+    # Minimum estimated Jaccard similarity of the titles' shingles
+    title_threshold: float = 0.6
+    # Minimum similarity of the authors' last names (see quick_author_similarity)
+    author_threshold: float = 0.5
+
+    def __post_init__(self):
+        if self.num_perm % self.bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self._rows = self.num_perm // self.bands
+        self._buckets: dict[tuple, list[int]] = defaultdict(list)
+        self._entries: list[tuple[Paper, list[tuple[int, ...]], list[str]]] = []
+        self._parents: list[int] = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _bands(self, sig: tuple[int, ...]):
+        r = self._rows
+        for b in range(self.bands):
+            yield (b, *sig[b * r : (b + 1) * r])
+
+    def _signatures(self, paper: Paper):
+        titles = [paper.title or ""]
+        head = _subtitle_sep.split(titles[0], 1)[0]
+        # Short heads like "Transformers: ..." are too generic to be matched on
+        if head != titles[0] and len(head.split()) >= 3:
+            titles.append(head)
+        sigs = [
+            minhash(title_shingles(t, self.shingle_size), self.num_perm) for t in titles
+        ]
+        names = [a.display_name for a in paper.authors]
+        return sigs, names
+
+    def _matches(self, sigs, names, idx: int) -> bool:
+        _, sigs2, names2 = self._entries[idx]
+        same = max(
+            sum(a == b for a, b in zip(sig, sig2)) for sig in sigs for sig2 in sigs2
+        )
+        if same < self.title_threshold * self.num_perm:
+            return False
+        if names and names2:
+            return quick_author_similarity(names, names2) >= self.author_threshold
+        return True
+
+    def _find_indexes(self, sigs, names) -> list[int]:
+        seen = set()
+        results = []
+        for sig in sigs:
+            for key in self._bands(sig):
+                for idx in self._buckets.get(key, ()):
+                    if idx not in seen:
+                        seen.add(idx)
+                        if self._matches(sigs, names, idx):
+                            results.append(idx)
+        return results
+
+    def find(self, paper: Paper) -> list[Paper]:
+        """Return the indexed papers that are near duplicates of the paper."""
+        found = self._find_indexes(*self._signatures(paper))
+        return [self._entries[i][0] for i in found]
+
+    def add(self, paper: Paper) -> list[Paper]:
+        """Index the paper and return its near duplicates among the papers
+        previously indexed."""
+        sigs, names = self._signatures(paper)
+        found = self._find_indexes(sigs, names)
+        idx = len(self._entries)
+        self._entries.append((paper, sigs, names))
+        self._parents.append(idx)
+        for key in {key for sig in sigs for key in self._bands(sig)}:
+            self._buckets[key].append(idx)
+        for other in found:
+            self._union(idx, other)
+        return [self._entries[i][0] for i in found]
+
+    def add_all(self, papers: Iterable[Paper]):
+        for paper in papers:
+            self.add(paper)
+
+    def _root(self, idx: int) -> int:
+        parents = self._parents
+        while parents[idx] != idx:
+            parents[idx] = parents[parents[idx]]
+            idx = parents[idx]
+        return idx
+
+    def _union(self, a: int, b: int):
+        ra, rb = self._root(a), self._root(b)
+        if ra != rb:
+            # The earliest paper stays at the root
+            self._parents[max(ra, rb)] = min(ra, rb)
+
+    def clusters(self, strict: bool = False) -> list[list[Paper]]:
+        """Return the groups of near duplicates, in the order they were added.
+
+        Near duplicates are grouped transitively: if A matches B and B matches
+        C, then A, B and C are in the same group even if A does not match C.
+        If strict is True, the groups are split so that all the papers in a
+        group match each other: each paper joins the first group whose papers
+        it all matches.
+        """
+        groups = defaultdict(list)
+        for idx in range(len(self._entries)):
+            groups[self._root(idx)].append(idx)
+        groups = list(groups.values())
+        if strict:
+            groups = sorted(
+                (sub for group in groups for sub in self._split(group)),
+                key=lambda group: group[0],
+            )
+        return [
+            [self._entries[i][0] for i in group] for group in groups if len(group) > 1
+        ]
+
+    def _split(self, group: list[int]) -> list[list[int]]:
+        subgroups = []
+        for idx in group:
+            _, sigs, names = self._entries[idx]
+            for sub in subgroups:
+                if all(self._matches(sigs, names, other) for other in sub):
+                    sub.append(idx)
+                    break
+            else:
+                subgroups.append([idx])
+        return subgroups
@@ -7,9 +7,9 @@ from fastapi import HTTPException
 from serieux import deserialize
 from serieux.features.encrypt import Secret
 
-from ..get import Fetcher, RequestsFetcher
+from ..get import ERRORS, Fetcher, RequestsFetcher
 from ..model.classes import Paper
-from .abc import PaperCollection
+from .abc import ChangeEvent, ChangeFeedExpired, PaperCollection
 
 
 @dataclass(kw_only=True)
@@ -70,6 +70,33 @@ class RemoteCollection(PaperCollection):
     async def drop(self) -> None:
         raise NotImplementedError()
 
+    async def _read_changes(self, since: int, timeout: float, limit: int) -> dict:
+        try:
+            return await self.fetch.read(
+                f"{self.endpoint}/changes",
+                format="json",
+                cache_into=None,
+                headers=self.headers,
+                params={"since": since, "timeout": timeout, "limit": limit},
+                # Leave the server enough time to answer the long poll
+                timeout=timeout + 60,
+            )
+        except ERRORS as exc:
+            if getattr(exc.response, "status_code", None) == 410:
+                raise ChangeFeedExpired(exc.response.text) from exc
+            raise
+
+    async def last_seq(self) -> int:
+        return (await self._read_changes(0, 0, 0))["last_seq"]
+
+    async def changes(
+        self, since: int = 0, timeout: float = 0, poll_interval: float = 0.5
+    ) -> AsyncGenerator[ChangeEvent, None]:
+        # The server does the waiting
+        resp = await self._read_changes(since, timeout, 1000)
+        for event in deserialize(list[ChangeEvent], resp.get("results", [])):
+            yield event
+
     def _build_params(
         self,
         paper_id: int = None,
@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from datetime import timedelta
 from functools import cached_property
 from pathlib import Path
 from tempfile import NamedTemporaryFile
@@ -14,9 +15,11 @@ from serieux.features.filebacked import FileProxy
 from paperoni.discovery.openreview_cfg import OpenReviewConfig
 
 from .collection.abc import PaperCollection
-from .get import Fetcher, RequestsFetcher
+from .fulltext.locatecache import LocatorCache
+from .get import DownloadLimiter, Fetcher, RequestsFetcher
 from .model.focus import AutoFocus, Focuses
 from .prompt import GenAIPrompt, Prompt
+from .refinestore import RefineStore
 
 
 class Keys(dict):
@@ -36,6 +39,31 @@ class Meta[T](Keys[str, T]):
 @dataclass
 class Refine:
     prompt: TaggedSubclass[Prompt] = field(default_factory=GenAIPrompt)
+    # Results of the refiners, reused by later refine runs
+    store: RefineStore = None
+
+
+@dataclass
+class Fulltext:
+    # Preference for each source of PDFs, by the info of its URL (e.g.
+    # "doi.crossref") or the part before the dot (e.g. "doi"). Candidates are
+    # ranked by preference plus the fraction of their source's past downloads
+    # that succeeded, so the preference dominates. Unlisted sources get 0.
+    preference: dict[str, float] = field(
+        default_factory=lambda: {
+            "arxiv": 3,
+            "openreview": 3,
+            "mlr": 3,
+            "pdf.official": 2,
+            "pdf": 1,
+        }
+    )
+    # Maximum number of downloads raced at once
+    race: int = 3
+    # How long to wait for a download before starting the next one
+    stagger: timedelta = timedelta(seconds=3)
+    # Download links found for each ref, reused by later lookups
+    locator_cache: LocatorCache = None
 
 
 @dataclass(kw_only=True)
@@ -65,6 +93,14 @@ class Server:
     protocol: Literal["http", "https"] = "http"
     max_results: int = 200
     enable_operate: bool = False
+    # Number of papers the operate endpoint applies an operation to between commits
+    operate_chunk_size: int = 500
+    # Maximum number of papers the operate endpoint examines for a simulation
+    operate_sample_size: int = 10_000
+    # How long the progress of a finished operate job can be queried
+    operate_jobs_ttl: timedelta = timedelta(hours=1)
+    # Maximum number of finished operate jobs that are kept
+    operate_jobs_max: int = 100
     auth: OAuthManager = None
     assets: Path = None
     ssl: SSLConfig = None
@@ -89,6 +125,8 @@ class PaperoniConfig:
     mailto: str = ""
     api_keys: Keys[str, Secret[str]] = field(default_factory=Keys)
     fetch: TaggedSubclass[Fetcher] = field(default_factory=RequestsFetcher)
+    downloads: DownloadLimiter = field(default_factory=DownloadLimiter)
+    fulltext: Fulltext = field(default_factory=Fulltext)
     focuses: Focuses @ FileProxy(refresh=True) = field(default_factory=Focuses)
     autofocus: AutoFocus = field(default_factory=AutoFocus)
     autovalidate: AutoValidate = field(default_factory=AutoValidate)
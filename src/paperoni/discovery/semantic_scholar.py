@@ -264,6 +264,20 @@ class SemanticScholar(Discoverer):
             await self._evaluate(f"paper/{paper_id}", fields=",".join(fields))
         )
 
+    async def papers(self, paper_ids, fields=PAPER_FIELDS):
+        """Fetch many papers in one request, with None for those not found."""
+        jdata = await config.fetch.read_retry(
+            "https://api.semanticscholar.org/graph/v1/paper/batch",
+            method="post",
+            params={"fields": ",".join(fields)},
+            json={"ids": list(paper_ids)},
+            headers={"x-api-key": self.api_key and str(self.api_key)},
+            format="json",
+        )
+        if not isinstance(jdata, list):
+            raise QueryError(jdata.get("error") if jdata else "Received bad JSON")
+        return [None if data is None else self._wrap_paper(data) for data in jdata]
+
     async def paper_authors(self, paper_id, fields=PAPER_AUTHORS_FIELDS, **params):
         async for author in self._list(
             f"paper/{paper_id}/authors", fields=fields, **params
@@ -1,3 +1,4 @@
+import asyncio
 from dataclasses import dataclass, field
 from typing import Literal
 
@@ -140,10 +141,69 @@ async def locate_all(ref: str):
 
 
 @ovld
-async def locate_all(typ: str, link: str):
+async def locate_all(typ: str, link: str, refresh: bool = False):
+    # The locators all run before the first link is given, so that what they
+    # found is cached even if the caller does not look at all the links
+    ref = f"{typ}:{link}"
+    found, exceptions = await locate_concurrently([ref], refresh=refresh)
+    for _, url in found:
+        yield url
+    if len(exceptions) == 1:
+        raise exceptions[0]
+    elif exceptions:
+        raise ExceptionGroup(f"Some locators failed for {ref}", exceptions)
+
+
+def _describe(exc: Exception) -> str:
+    return f"{type(exc).__name__}: {exc}"
+
+
+async def locate_concurrently(refs: list[str], refresh: bool = False):
+    """Run all the locators of all the refs at once.
+
+    Returns the (ref, URL) pairs in the order locate_all would give them,
+    without duplicate URLs, and the exceptions raised by the locators. The
+    locator cache is used for the refs it has, unless refresh is True.
+    """
+
+    async def run(f):
+        return [url async for url in f()]
+
+    cache = config.fulltext.locator_cache
+    cached = {}
+    jobs = []
+    for ref in refs:
+        if (
+            cache is not None
+            and not refresh
+            and (urls := await asyncio.to_thread(cache.get, ref)) is not None
+        ):
+            cached[ref] = urls
+            continue
+        typ, link = ref.split(":", 1)
+        jobs.extend((ref, f) for f in find_download_links.resolve_all(typ, link))
+    results = await asyncio.gather(*[run(f) for _, f in jobs], return_exceptions=True)
+
+    located = {ref: ([], []) for ref in refs if ref not in cached}
+    exceptions = []
+    for (ref, _), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            exceptions.append(result)
+            located[ref][1].append(_describe(result))
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            located[ref][0].extend(result)
+    if cache is not None:
+        for ref, (urls, errors) in located.items():
+            await asyncio.to_thread(cache.put, ref, urls, errors=errors)
+
     seen = set()
-    for f in find_download_links.resolve_all(typ, link):
-        async for url in f():
+    found = []
+    for ref in refs:
+        urls = cached[ref] if ref in cached else located[ref][0]
+        for url in urls:
             if url.url not in seen:
                 seen.add(url.url)
-                yield url
+                found.append((ref, url))
+    return found, exceptions
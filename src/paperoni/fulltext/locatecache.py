@@ -0,0 +1,149 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+
+from serieux import deserialize, serialize
+
+from ..sqlite import connect
+
+_schema = """
+CREATE TABLE IF NOT EXISTS locations (
+    ref TEXT PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    urls TEXT NOT NULL,
+    errors TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    url TEXT PRIMARY KEY,
+    ref TEXT,
+    timestamp REAL NOT NULL,
+    success INTEGER NOT NULL,
+    error TEXT
+);
+"""
+
+
+@dataclass
+class LocatorCache:
+    """Persistent cache of the download links found for each ref.
+
+    The links found by the locators are reused until they are older than the
+    TTL. Refs for which no link was found are cached as well, for a shorter
+    time, so that they are not looked up over and over. The links of a ref for
+    which a locator failed are incomplete, so they are recorded along with the
+    errors, but never reused. The outcome of the downloads of the links is
+    also recorded. Expired entries are removed when the cache is opened.
+
+    The methods can be called from several threads, e.g. with
+    asyncio.to_thread, so that the event loop does not wait on the disk.
+    """
+
+    # SQLite database file
+    file: Path
+    # How long the links found for a ref are reused
+    ttl: timedelta = timedelta(days=30)
+    # How long the absence of links for a ref is reused
+    not_found_ttl: timedelta = timedelta(days=7)
+
+    def __post_init__(self):
+        self._conn = None
+        # Reentrant, since opening the connection purges the cache
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.file, _schema)
+            self.purge()
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def ttl_for(self, found: bool) -> timedelta:
+        return self.ttl if found else self.not_found_ttl
+
+    def get(self, ref: str) -> list | None:
+        """Return the URLs stored for ref, or None if absent, expired or
+        incomplete because a locator failed."""
+        from .locate import URL
+
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT timestamp, urls, errors FROM locations WHERE ref = ?", (ref,)
+            ).fetchone()
+            if row is None:
+                return None
+            timestamp, urls, errors = row
+            if json.loads(errors):
+                return None
+            urls = deserialize(list[URL], json.loads(urls))
+            if time.time() - timestamp > self.ttl_for(found=bool(urls)).total_seconds():
+                return None
+            return urls
+
+    def put(self, ref: str, urls: list, errors: list[str] = ()):
+        """Record the URLs found for ref, and the errors of the locators."""
+        from .locate import URL
+
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO locations (ref, timestamp, urls, errors)"
+                " VALUES (?, ?, ?, ?)",
+                (
+                    ref,
+                    time.time(),
+                    json.dumps(serialize(list[URL], list(urls))),
+                    json.dumps(list(errors)),
+                ),
+            )
+
+    def record(self, url: str, ref: str, success: bool, error: str = None):
+        """Record the outcome of the download of url."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO outcomes (url, ref, timestamp, success, error)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (url, ref, time.time(), int(success), error),
+            )
+
+    def outcome(self, url: str) -> tuple[bool, str | None] | None:
+        """Return whether the last download of url succeeded, and its error."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT success, error FROM outcomes WHERE url = ?", (url,)
+            ).fetchone()
+            return None if row is None else (bool(row[0]), row[1])
+
+    def purge(self) -> int:
+        """Remove the expired entries and return how many were removed.
+
+        The outcomes of the downloads are removed once they are older than
+        the TTL, too.
+        """
+        with self._lock:
+            now = time.time()
+            removed = 0
+            for ref, timestamp, urls in self.conn.execute(
+                "SELECT ref, timestamp, urls FROM locations"
+            ).fetchall():
+                ttl = self.ttl_for(found=urls != "[]")
+                if now - timestamp > ttl.total_seconds():
+                    self.conn.execute("DELETE FROM locations WHERE ref = ?", (ref,))
+                    removed += 1
+            self.conn.execute(
+                "DELETE FROM outcomes WHERE timestamp < ?",
+                (now - self.ttl.total_seconds(),),
+            )
+            return removed
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0]
@@ -1,11 +1,15 @@
+import asyncio
 import hashlib
+import json
+import os
 import shutil
 from dataclasses import dataclass
+from pathlib import Path
 
 from serieux import dump, load
 
 from ..config import config
-from .locate import URL, locate_all
+from .locate import URL, locate_concurrently
 
 
 @dataclass
@@ -35,6 +39,38 @@ class Info:
     ref: str = None
 
 
+class SourceStats:
+    """Number of downloads that succeeded and were attempted, per source."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.counts = json.loads(path.read_text()) if path.exists() else {}
+
+    def success_rate(self, source: str) -> float:
+        succeeded, attempted = self.counts.get(source, (0, 0))
+        # A source that was never tried starts at 1/2
+        return (succeeded + 1) / (attempted + 2)
+
+    def record(self, source: str, success: bool):
+        counts = self.counts.setdefault(source, [0, 0])
+        counts[0] += int(success)
+        counts[1] += 1
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.counts, indent=2))
+        os.replace(tmp, self.path)
+
+
+_source_stats: dict[Path, SourceStats] = {}
+
+
+def source_stats() -> SourceStats:
+    path = (config.data_path / "pdf" / "sources.json").resolve()
+    if path not in _source_stats:
+        _source_stats[path] = SourceStats(path)
+    return _source_stats[path]
+
+
 @dataclass
 class PDF:
     source: URL
@@ -74,6 +110,7 @@ class PDF:
             await config.fetch.download_retry(
                 url=self.source.url,
                 filename=self.pdf_path,
+                limiter=config.downloads,
             )
             if not self.pdf_path.exists() or not self.pdf_path.is_file():
                 raise Exception(f"Downloaded file does not exist: {self.pdf_path}")
@@ -84,6 +121,7 @@ class PDF:
                         f"File at {self.pdf_path} is not a valid PDF (missing %PDF- header)"
                     )
             self.success = True
+            await self.record_outcome()
             return self.pdf_path
         except Exception as exc:
             self.error = ErrorData(
@@ -91,10 +129,19 @@ class PDF:
                 message=str(exc),
             )
             self.success = False
+            await self.record_outcome()
             raise
         finally:
             self.dump()
 
+    async def record_outcome(self):
+        source_stats().record(self.source.info, self.success)
+        if (cache := config.fulltext.locator_cache) is not None:
+            error = None if self.success else f"{self.error.type}: {self.error.message}"
+            await asyncio.to_thread(
+                cache.record, self.source.url, self.ref, self.success, error
+            )
+
     async def fulltext(self, cache_policy: CachePolicy = CachePolicies.USE):
         if not cache_policy.use or not self.success or not self.pdf_path.exists():
             if not cache_policy.download:
@@ -106,26 +153,94 @@ class PDF:
             return self.pdf_path
 
 
+async def rank(candidates: list[PDF]) -> list[PDF]:
+    """Sort candidates by preference of their source and past success rate.
+
+    A candidate whose last download failed comes after the candidates of the
+    same preference.
+    """
+    preference = config.fulltext.preference
+    stats = source_stats()
+    failed = set()
+    if (cache := config.fulltext.locator_cache) is not None:
+
+        def last_failed():
+            return {
+                p.source.url
+                for p in candidates
+                if (outcome := cache.outcome(p.source.url)) is not None and not outcome[0]
+            }
+
+        failed = await asyncio.to_thread(last_failed)
+
+    def score(p: PDF):
+        info = p.source.info
+        pref = preference.get(info, preference.get(info.split(".")[0], 0))
+        return pref + stats.success_rate(info) - (p.source.url in failed)
+
+    # sorted is stable, so ties stay in the order of the refs
+    return sorted(candidates, key=score, reverse=True)
+
+
+async def race(candidates: list[PDF], cache_policy: CachePolicy, exceptions: list):
+    """Return the first candidate whose fulltext is obtained.
+
+    Candidates are tried in order. The next one starts when one fails, or when
+    none finished within the stagger delay, up to config.fulltext.race at
+    once. When one succeeds, the others are cancelled; their partial downloads
+    are kept, to be resumed later. The exceptions are added to exceptions.
+    """
+    remaining = iter(candidates)
+    running: dict[asyncio.Task, PDF] = {}
+    stagger = config.fulltext.stagger.total_seconds()
+
+    def start():
+        if (p := next(remaining, None)) is None:
+            return False
+        running[asyncio.create_task(p.fulltext(cache_policy=cache_policy))] = p
+        return True
+
+    more = start()
+    try:
+        while running:
+            can_start = more and len(running) < config.fulltext.race
+            done, _ = await asyncio.wait(
+                running,
+                timeout=stagger if can_start else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                # Nothing finished in time, give the next candidate a chance
+                more = start()
+                continue
+            # If several finished at once, prefer the best ranked
+            for task in sorted(done, key=lambda t: candidates.index(running[t])):
+                p = running.pop(task)
+                if task.exception() is None:
+                    return p
+                exceptions.append(task.exception())
+                more = more and start()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+    return None
+
+
 async def get_pdf(refs, cache_policy: CachePolicy = CachePolicies.USE):
     if isinstance(refs, str):
         refs = [refs]
 
+    found, exceptions = await locate_concurrently(refs, refresh=not cache_policy.use)
+    candidates = await rank([PDF(url, ref=ref).load() for ref, url in found])
+
     if cache_policy.use and not cache_policy.best:
-        urls = [(url, ref) for ref in refs async for url in locate_all(ref)]
-        for url, ref in urls:
-            if (p := PDF(url, ref=ref).load()).success:
+        for p in candidates:
+            if p.success:
                 return p
 
-    exceptions = []
-    for ref in refs:
-        async for url in locate_all(ref):
-            p = PDF(url, ref=ref).load()
-            try:
-                await p.fulltext(cache_policy=cache_policy)
-                return p
-            except Exception as exc:
-                exceptions.append(exc)
-                continue
+    if p := await race(candidates, cache_policy, exceptions):
+        return p
 
     if exceptions:
         raise ExceptionGroup("No fulltext found for any reference", exceptions)
@@ -1,21 +1,23 @@
 import asyncio
+import hashlib
 import json
 import os
 import re
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from functools import cached_property
+from functools import cached_property, partial
 from pathlib import Path
 from typing import Literal
 from urllib.parse import urlparse
 
 import chardet
-import hishel
 import httpx
 import requests
 from fake_useragent import UserAgent
-from hishel.httpx import AsyncCacheClient
 from outsight import send
 from ovld import ovld
 from requests import Session
@@ -23,6 +25,9 @@ from serieux import TaggedSubclass
 from serieux.features.encrypt import Secret
 from tenacity import retry, stop_after_delay, wait_exponential, wait_random
 
+from .httpcache import ResponseCache, cache_lifetime
+from .ratelimit import Circuit, HostUnavailable, RateLimit, TokenBucket, retry_delay
+
 ERRORS = (httpx.HTTPStatusError, requests.RequestException)
 ua = UserAgent()
 
@@ -79,19 +84,211 @@ def _giveup(exc):
     return status_code not in (403, 429)
 
 
+class IncompleteDownload(IOError):
+    """Raised when a download ends before the whole file was received."""
+
+
+def _should_retry_download(exc):
+    if isinstance(
+        exc, (IncompleteDownload, httpx.TransportError, requests.ConnectionError)
+    ):
+        return True
+    return not _giveup(exc)
+
+
+_backoff = wait_exponential(multiplier=1, exp_base=2) + wait_random(0, 0.5)
+
+# Number of seconds after which read_retry and download_retry give up
+RETRY_BUDGET = 30
+
+
+def _wait(retry_state):
+    # Wait as long as the server asks, if it does
+    exc = retry_state.outcome.exception()
+    response = getattr(exc, "response", None)
+    delay = retry_delay(getattr(response, "headers", None))
+    if delay is None:
+        return _backoff(retry_state)
+    # The stop condition is only checked before sleeping, so a server that asks
+    # us to come back in a day must fail now rather than after a day
+    if delay > RETRY_BUDGET - retry_state.seconds_since_start:
+        raise HostUnavailable(
+            f"Giving up on {getattr(response, 'url', 'the request')}:"
+            f" the server asks to wait {delay:.0f}s"
+        ) from exc
+    return delay
+
+
+def _request_key(method, url, kwargs):
+    kwargs = dict(kwargs)
+    if headers := kwargs.get("headers"):
+        kwargs["headers"] = {k: v for k, v in headers.items() if v is not None}
+    return (method.lower(), url, json.dumps(kwargs, sort_keys=True, default=str))
+
+
+def _content_range_total(content_range: str, start: int) -> int | None:
+    # Content-Range looks like "bytes 100-999/1000", or "bytes 100-999/*"
+    m = re.fullmatch(r"bytes (\d+)-\d+/(\d+|\*)", (content_range or "").strip())
+    if not m or int(m.group(1)) != start:
+        raise IOError(f"Unexpected Content-Range for a resumed download: {content_range}")
+    return None if m.group(2) == "*" else int(m.group(2))
+
+
+def _file_digest(path: Path, algorithm: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, algorithm).hexdigest()
+
+
+def _read_validator(path: Path) -> str | None:
+    # Value for the If-Range header of a resumed download
+    try:
+        return json.loads(path.read_text())["validator"]
+    except OSError, ValueError, KeyError, TypeError:
+        return None
+
+
+def _write_validator(path: Path, headers):
+    # Weak ETags cannot be used in If-Range
+    etag = headers.get("etag")
+    validator = etag if etag and not etag.startswith("W/") else None
+    validator = validator or headers.get("last-modified")
+    if validator:
+        path.write_text(json.dumps({"validator": validator}))
+    else:
+        path.unlink(missing_ok=True)
+
+
+# Lock for each file being downloaded, so that two downloads to the same file
+# do not write to the same .part file
+_download_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+    weakref.WeakValueDictionary()
+)
+
+
+@dataclass
+class DownloadLimiter:
+    """Limits on the downloads done by the process.
+
+    A download takes a slot for its whole duration, and waits after each
+    chunk to keep the combined bandwidth of all downloads under the limit.
+    """
+
+    # Maximum number of downloads at once
+    simultaneous: int = 4
+    # Maximum combined bandwidth of the downloads, in bytes per second
+    bandwidth: float = None
+
+    def __post_init__(self):
+        self._semaphore = None
+        self._loop = None
+        self._bucket = None
+        if self.bandwidth:
+            self._bucket = TokenBucket(
+                RateLimit(rate=self.bandwidth, burst=self.bandwidth)
+            )
+
+    def slot(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.simultaneous)
+            self._loop = loop
+        return self._semaphore
+
+    async def throttle(self, nbytes: int):
+        if self._bucket is not None:
+            await self._bucket.acquire(nbytes)
+
+
+# Limits on the downloads, unless Fetcher.download is given others
+downloads = DownloadLimiter()
+
+
 class Fetcher:
+    """Base class for the fetchers.
+
+    Concurrent identical reads (same method, URL and arguments) are
+    coalesced: the first one is sent, and the others wait for its result
+    instead of sending their own. The number of requests sent and coalesced
+    is kept in the stats attribute. Other requests return response objects,
+    which the callers could not share safely, so they are not coalesced.
+    """
+
     async def generic(self, method, url, stream=False, **kwargs):
         raise NotImplementedError()
 
+    @property
+    def stats(self) -> dict[str, int]:
+        if "_stats" not in self.__dict__:
+            self._stats = {"requests": 0, "coalesced": 0}
+        return self._stats
+
+    async def _single_flight(self, method, url, kwargs, make):
+        """Return the result of make(), shared with identical requests in flight."""
+        if "_inflight" not in self.__dict__:
+            self._inflight = {}
+        loop = asyncio.get_running_loop()
+        key = _request_key(method, url, kwargs)
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not loop:
+            self.stats["requests"] += 1
+            task = loop.create_task(make())
+            self._inflight[key] = task
+
+            def done(t):
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+                # If all the callers were cancelled, nobody else will retrieve
+                # the exception, and asyncio would log it as never retrieved
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(done)
+        else:
+            self.stats["coalesced"] += 1
+            send(coalesced=url)
+        # A caller that is cancelled must not cancel the request for the others
+        return await asyncio.shield(task)
+
     async def head(self, url, **kwargs):
         return await self.generic("head", url, **kwargs)
 
     async def get(self, url, **kwargs):
         return await self.generic("get", url, **kwargs)
 
-    async def download(self, url, filename, **kwargs):
-        """Download the given url into the given filename (async)."""
-
+    async def download(
+        self,
+        url,
+        filename,
+        checksum: str = None,
+        limiter: DownloadLimiter = None,
+        **kwargs,
+    ):
+        """Download the given url into the given filename (async).
+
+        The data is written to filename.part, which is renamed to filename once
+        the download is complete and verified, so that an interrupted download
+        never leaves a truncated file behind. If filename.part exists, the
+        download resumes where it stopped, if the server supports it and the
+        file did not change since (according to its ETag or Last-Modified
+        header, which are kept in filename.part.json). Downloads to the same
+        filename wait for each other.
+
+        Arguments:
+            url: The URL to download.
+            filename: Where to save the file.
+            checksum: Expected digest of the file, as "algorithm:hexdigest",
+                e.g. "sha256:9f86d08...".
+            limiter: Limits on the downloads that run at once and on their
+                bandwidth (defaults to the global limiter, downloads).
+        """
+        filename = Path(filename)
+        key = str(filename.resolve())
+        if (lock := _download_locks.get(key)) is None:
+            lock = _download_locks[key] = asyncio.Lock()
+        async with lock:
+            await self._download(url, filename, checksum, limiter or downloads, kwargs)
+
+    async def _download(self, url, filename, checksum, limiter, kwargs):
         async def aiter(response, chunk_size: int):
             # Works with httpx async (aiter_bytes)
             iter_fn = getattr(response, "aiter_bytes", None)
@@ -102,37 +299,103 @@ class Fetcher:
                 # Fallback for sync-style responses
                 iter_fn = getattr(response, "iter_bytes", None) or response.iter_content
                 it = iter_fn(chunk_size=chunk_size)
-                try:
-                    while True:
-                        yield next(it)
-                except StopIteration:
-                    pass
+                # Reading from the socket blocks, so it is done in a thread
+                while (chunk := await asyncio.to_thread(next, it, None)) is not None:
+                    yield chunk
+
+        part = filename.with_name(filename.name + ".part")
+        validator_file = filename.with_name(filename.name + ".part.json")
+        start = part.stat().st_size if part.exists() else 0
+        # Without a validator, we cannot know if the partial data is from the
+        # same version of the file, so the download starts over
+        validator = _read_validator(validator_file) if start else None
+        request_kwargs = kwargs
+        if validator:
+            headers = {
+                **kwargs.get("headers", {}),
+                "Range": f"bytes={start}-",
+                "If-Range": validator,
+            }
+            request_kwargs = {**kwargs, "headers": headers}
+        else:
+            start = 0
 
         print(f"Downloading {url}")
-        async with await self.get(url, stream=True, **kwargs) as r:
-            r.raise_for_status()
-            total = int(r.headers.get("content-length") or 1024**2)
-            sofar = 0
-            with open(filename, "wb") as f:
-                async for chunk in aiter(r, chunk_size=max(total // 100, 1)):
-                    f.write(chunk)
-                    f.flush()
-                    sofar += len(chunk)
-                    send(progress=(Path(url).name, sofar, total))
+        async with limiter.slot():
+            async with await self.get(url, stream=True, **request_kwargs) as r:
+                if start and r.status_code == 416:
+                    # The partial file does not fit the file, start over
+                    part.unlink()
+                    validator_file.unlink(missing_ok=True)
+                    restart = True
+                else:
+                    restart = False
+                    r.raise_for_status()
+                    if start and r.status_code == 206:
+                        content_range = r.headers.get("content-range")
+                        total = _content_range_total(content_range, start)
+                    else:
+                        # The server sent the whole file
+                        start = 0
+                        length = r.headers.get("content-length")
+                        total = int(length) if length else None
+                        _write_validator(validator_file, r.headers)
+                    if r.headers.get("content-encoding", "identity") != "identity":
+                        # The length is that of the encoded data
+                        total = None
+                    sofar = start
+                    with open(part, "ab" if start else "wb", buffering=1024**2) as f:
+                        async for chunk in aiter(r, chunk_size=64 * 1024):
+                            f.write(chunk)
+                            sofar += len(chunk)
+                            send(progress=(Path(url).name, sofar, total or sofar))
+                            await limiter.throttle(len(chunk))
+
+        if restart:
+            return await self._download(url, filename, checksum, limiter, kwargs)
+        if total is not None and sofar != total:
+            raise IncompleteDownload(
+                f"Incomplete download of {url}: got {sofar} of {total} bytes"
+            )
+        if checksum:
+            algorithm, expected = checksum.split(":", 1)
+            digest = await asyncio.to_thread(_file_digest, part, algorithm)
+            if digest != expected.lower():
+                part.unlink()
+                validator_file.unlink(missing_ok=True)
+                raise IOError(f"Checksum mismatch for {url}: {algorithm}:{digest}")
+        os.replace(part, filename)
+        validator_file.unlink(missing_ok=True)
         print(f"Saved {filename}")
 
     @retry(
-        wait=wait_exponential(multiplier=1, exp_base=2) + wait_random(0, 0.5),
-        stop=stop_after_delay(30),
-        retry=lambda retry_state: not _giveup(retry_state.outcome.exception()),
+        wait=_wait,
+        stop=stop_after_delay(RETRY_BUDGET),
+        # Downloads that were cut are retried, and resume where they stopped
+        retry=lambda retry_state: _should_retry_download(retry_state.outcome.exception()),
         reraise=True,
     )
     async def download_retry(self, *args, **kwargs):
         return await self.download(*args, **kwargs)
 
     async def read(
-        self, url, format=None, cache_into=None, cache_expiry: timedelta = None, **kwargs
+        self,
+        url,
+        format=None,
+        cache_into=None,
+        cache_expiry: timedelta = None,
+        method="get",
+        **kwargs,
     ):
+        """Fetch url and parse its content in the given format.
+
+        If cache_into is given, the content is also written to that file, and
+        read from it instead of fetched while it is younger than cache_expiry.
+        These files are separate from the ResponseCache of CachedFetcher:
+        they work with any fetcher, and the callers choose where they go,
+        keep them next to their own data, and delete them to refresh them.
+        """
+
         def is_cache_valid(path: Path, expiry: timedelta):
             if not path.exists():
                 return False
@@ -141,13 +404,16 @@ class Fetcher:
             mtime = datetime.fromtimestamp(os.path.getmtime(path))
             return (datetime.now() - mtime) < expiry
 
+        async def read_text():
+            resp = await self.generic(method, url, **kwargs)
+            send(url=url, params=kwargs.get("params", {}), response=resp)
+            resp.raise_for_status()
+            return resp.text
+
         if cache_into and is_cache_valid(cache_into, cache_expiry):
             content = cache_into.read_text()
         else:
-            resp = await self.get(url, **kwargs)
-            send(url=url, params=kwargs.get("params", {}), response=resp)
-            resp.raise_for_status()
-            content = resp.text
+            content = await self._single_flight(method, url, kwargs, read_text)
 
             if cache_into:
                 cache_into.parent.mkdir(parents=True, exist_ok=True)
@@ -156,8 +422,8 @@ class Fetcher:
         return parse(content, format)
 
     @retry(
-        wait=wait_exponential(multiplier=1, exp_base=2) + wait_random(0, 0.5),
-        stop=stop_after_delay(30),
+        wait=_wait,
+        stop=stop_after_delay(RETRY_BUDGET),
         retry=lambda retry_state: not _giveup(retry_state.outcome.exception()),
         reraise=True,
     )
@@ -165,16 +431,71 @@ class Fetcher:
         return await self.read(*args, **kwargs)
 
 
+class ClientPool:
+    """Pool of the httpx clients of the process.
+
+    Fetchers with the same connection settings share a client, and thus its
+    connections, on each event loop. The clients must be closed with aclose()
+    before the event loop ends, which the CLI and the web app do on exit.
+
+    The stats attribute counts the requests sent and the connections opened,
+    to see how often connections are reused.
+    """
+
+    def __init__(self):
+        self._clients: dict[tuple, httpx.AsyncClient] = {}
+        self.stats = {"requests": 0, "connections": 0, "tls_handshakes": 0}
+
+    def get(self, settings: tuple, make) -> httpx.AsyncClient:
+        """Return the client for settings on the current loop, made with make()."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        # The clients of closed loops cannot be used or closed anymore
+        for key in [k for k in self._clients if k[0] is not None and k[0].is_closed()]:
+            del self._clients[key]
+        if (client := self._clients.get((loop, settings))) is None:
+            client = self._clients[loop, settings] = make()
+        return client
+
+    async def trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            self.stats["connections"] += 1
+        elif event == "connection.start_tls.complete":
+            self.stats["tls_handshakes"] += 1
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Fraction of the requests that reused a connection."""
+        requests = self.stats["requests"]
+        return (
+            max(requests - self.stats["connections"], 0) / requests if requests else 0.0
+        )
+
+    async def aclose(self):
+        """Close the clients of the current loop."""
+        loop = asyncio.get_running_loop()
+        for key in [k for k in self._clients if k[0] is loop]:
+            await self._clients.pop(key).aclose()
+
+
+clients = ClientPool()
+
+
 @dataclass
 class HTTPXFetcher(Fetcher):
     user_agent: str = None
     timeout: int = 60
     verify: bool = True
-
-    # [serieux: ignore]
-    _client: httpx.AsyncClient = None
-    # [serieux: ignore]
-    _client_loop = None
+    # Use HTTP/2 with the servers that support it (requires the h2 package)
+    http2: bool = False
+    # Maximum number of connections open at once
+    max_connections: int = 100
+    # Maximum number of idle connections kept alive
+    max_keepalive: int = 20
+    # How long idle connections are kept alive
+    keepalive_expiry: timedelta = timedelta(seconds=30)
 
     def __post_init__(self):
         if self.user_agent is not None:
@@ -185,26 +506,37 @@ class HTTPXFetcher(Fetcher):
 
     @property
     def client(self):
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = None
-        if self._client is None or self._client_loop is not loop:
-            self._client = httpx.AsyncClient(
-                follow_redirects=True,
-                default_encoding=detect_encoding,
-                verify=self.verify,
-            )
-            self._client_loop = loop
-        return self._client
+        settings = (
+            self.verify,
+            self.http2,
+            self.max_connections,
+            self.max_keepalive,
+            self.keepalive_expiry,
+        )
+        return clients.get(settings, self._make_client)
+
+    def _make_client(self):
+        return httpx.AsyncClient(
+            follow_redirects=True,
+            default_encoding=detect_encoding,
+            verify=self.verify,
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry.total_seconds(),
+            ),
+        )
 
     async def generic(self, method, url, stream=False, headers={}, **kwargs):
         kwargs.setdefault("timeout", self.timeout)
+        kwargs["extensions"] = {"trace": clients.trace, **kwargs.get("extensions", {})}
         headers = {k: v for k, v in headers.items() if v is not None}
         if self.user_agent:
             headers["User-Agent"] = self.user_agent
         if headers:
             kwargs["headers"] = headers
+        clients.stats["requests"] += 1
         if stream:
             return self.client.stream(method.upper(), url, **kwargs)
         return await getattr(self.client, method)(url, **kwargs)
@@ -212,8 +544,17 @@ class HTTPXFetcher(Fetcher):
 
 @dataclass
 class RequestsFetcher(Fetcher):
+    """Fetcher that uses requests, in a pool of threads.
+
+    Requests is sync-only, so each request runs in a thread, so that it does
+    not block the event loop. Sessions are not thread-safe, so each thread has
+    its own, which keeps its connections alive between requests.
+    """
+
     user_agent: str = None
     timeout: int = 60
+    # Maximum number of requests running at once
+    threads: int = 16
 
     def __post_init__(self):
         if self.user_agent is not None:
@@ -223,23 +564,45 @@ class RequestsFetcher(Fetcher):
                 pass
 
     @cached_property
-    def session(self):
+    def executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.threads, thread_name_prefix=type(self).__name__
+        )
+
+    @cached_property
+    def _local(self) -> threading.local:
+        return threading.local()
+
+    @property
+    def session(self) -> Session:
+        """Session of the current thread."""
+        if (session := getattr(self._local, "session", None)) is None:
+            session = self._local.session = self.make_session()
+        return session
+
+    def make_session(self) -> Session:
         return Session()
 
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    def _request(self, method, url, **kwargs):
+        return getattr(self.session, method.lower())(url, **kwargs)
+
     async def generic(self, method, url, stream=False, **kwargs):
-        # Requests is sync-only, so we just call the sync version
         kwargs.setdefault("timeout", self.timeout)
         if self.user_agent:
             headers = kwargs.setdefault("headers", {})
             headers["UserAgent"] = headers["User-Agent"] = self.user_agent
         if stream:
             return self._astream_context(method, url, **kwargs)
-        return getattr(self.session, method)(url, **kwargs)
+        return await self._run(self._request, method, url, **kwargs)
 
     @asynccontextmanager
     async def _astream_context(self, method, url, **kwargs):
         kwargs["stream"] = True
-        response = getattr(self.session, method.lower())(url, **kwargs)
+        response = await self._run(self._request, method, url, **kwargs)
         try:
             yield response
         finally:
@@ -248,43 +611,70 @@ class RequestsFetcher(Fetcher):
 
 @dataclass
 class CachedFetcher(HTTPXFetcher):
+    """Fetcher that caches the responses in a ResponseCache.
+
+    Successful GET, HEAD and POST requests are cached, except streamed ones.
+    The cache is stored next to cache_path, with a .responses.db suffix.
+
+    A response is reused for as long as its Cache-Control max-age or its
+    Expires header says, but at most for expire_after. A response whose
+    headers do not say is reused for expire_after, or not cached at all if
+    expire_after is None. Responses marked no-store or no-cache are never
+    cached.
+    """
+
     cache_path: Path = None
     expire_after: timedelta = None
+    # Maximum size of the cache on disk, in bytes
+    max_size: int = 2 * 1024**3
 
-    def _cache_policy(self):
-        return hishel.SpecificationPolicy(
-            cache_options=hishel.CacheOptions(
-                shared=False,
-                supported_methods=["GET", "HEAD", "POST"],
-                allow_stale=True,
-            )
+    @cached_property
+    def cache(self) -> ResponseCache | None:
+        if not self.cache_path:
+            return None
+        return ResponseCache(
+            file=Path(f"{self.cache_path}.responses.db"),
+            max_size=self.max_size,
+            expire_after=self.expire_after,
         )
 
-    @property
-    def client(self):
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = None
-        if self._client is None or self._client_loop is not loop:
-            if not self.cache_path:
-                self._client = httpx.AsyncClient(
-                    follow_redirects=True, default_encoding=detect_encoding
-                )
-            else:
-                ttl = self.expire_after.total_seconds() if self.expire_after else None
-                storage = hishel.AsyncSqliteStorage(
-                    database_path=str(self.cache_path) + ".db",
-                    default_ttl=ttl,
-                )
-                self._client = AsyncCacheClient(
-                    storage=storage,
-                    follow_redirects=True,
-                    default_encoding=detect_encoding,
-                    policy=self._cache_policy(),
-                )
-            self._client_loop = loop
-        return self._client
+    def _ttl(self, response) -> timedelta | None:
+        lifetime = cache_lifetime(response.headers)
+        if lifetime is None:
+            return self.expire_after
+        ttl = timedelta(seconds=lifetime)
+        return ttl if self.expire_after is None else min(ttl, self.expire_after)
+
+    async def generic(self, method, url, stream=False, **kwargs):
+        if stream or self.cache is None or method.upper() not in ("GET", "HEAD", "POST"):
+            return await super().generic(method, url, stream=stream, **kwargs)
+        key = self.cache.key(*_request_key(method, url, kwargs))
+        if (cached := await asyncio.to_thread(self.cache.get, key)) is not None:
+            return httpx.Response(
+                status_code=cached.status,
+                headers=cached.headers,
+                content=cached.content,
+                request=httpx.Request(method.upper(), cached.url),
+                default_encoding=detect_encoding,
+            )
+        response = await super().generic(method, url, **kwargs)
+        if response.is_success and (ttl := self._ttl(response)):
+            # The content is stored decoded, so the encoding headers no longer apply
+            headers = {
+                k: v
+                for k, v in response.headers.items()
+                if k not in ("content-encoding", "content-length", "transfer-encoding")
+            }
+            await asyncio.to_thread(
+                self.cache.put,
+                key,
+                url=str(response.url),
+                status=response.status_code,
+                headers=headers,
+                content=response.content,
+                ttl=ttl,
+            )
+        return response
 
 
 @dataclass
@@ -297,8 +687,7 @@ class BannedFetcher(Fetcher):
 class CloudFlareFetcher(RequestsFetcher):
     delay: int = 10
 
-    @cached_property
-    def session(self):
+    def make_session(self):
         import cloudscraper
 
         return cloudscraper.create_scraper(delay=self.delay)
@@ -337,12 +726,36 @@ class SequenceFetcher(Fetcher):
 
 @dataclass
 class RulesFetcher(Fetcher):
+    """Dispatch each request to a fetcher according to rules on its URL.
+
+    Requests to each host can be limited in concurrency (simultaneous) and
+    in rate (rates). The rate adapts to what the host says: a 429 or 503
+    response halves it, and a Retry-After or X-RateLimit-Reset header pauses
+    the host for as long as it asks, up to max_pause. A host that asks for a
+    longer pause, or that fails too many times in a row, is skipped for a
+    while, and requests to it raise HostUnavailable right away instead of
+    waiting.
+    """
+
     rules: dict[re.Pattern, str]
     fetchers: dict[str, TaggedSubclass[Fetcher]]
     simultaneous: dict[str, int] = field(default_factory=dict)
+    # Rate limit for each hostname, "*" for the other hosts
+    rates: dict[str, RateLimit] = field(default_factory=dict)
+    # Skip a host after this many consecutive failures (0 to never skip)
+    breaker_threshold: int = 5
+    # How long to skip a host before trying it again
+    breaker_cooldown: timedelta = timedelta(minutes=1)
+    # Longest pause a host can ask for. Requests to a host that asks for a
+    # longer one raise HostUnavailable until then, instead of waiting.
+    max_pause: timedelta = timedelta(minutes=1)
 
     # [serieux: ignore]
     _semaphores: dict[str, asyncio.Semaphore] = field(default_factory=dict, repr=False)
+    # [serieux: ignore]
+    _buckets: dict[str, TokenBucket] = field(default_factory=dict, repr=False)
+    # [serieux: ignore]
+    _circuits: dict[str, Circuit] = field(default_factory=dict, repr=False)
 
     def _get_semaphore(self, hostname: str) -> asyncio.Semaphore | None:
         """Get or create a semaphore for the given hostname."""
@@ -356,6 +769,72 @@ class RulesFetcher(Fetcher):
 
         return self._semaphores[hostname]
 
+    def _get_bucket(self, hostname: str) -> TokenBucket | None:
+        """Get or create a token bucket for the given hostname."""
+        if hostname not in self._buckets:
+            limit = self.rates.get(hostname, None) or self.rates.get("*", None)
+            if limit is None:
+                return None
+            self._buckets[hostname] = TokenBucket(limit)
+
+        return self._buckets[hostname]
+
+    def _get_circuit(self, hostname: str) -> Circuit:
+        if hostname not in self._circuits:
+            self._circuits[hostname] = Circuit(
+                threshold=self.breaker_threshold,
+                cooldown=self.breaker_cooldown.total_seconds(),
+            )
+        return self._circuits[hostname]
+
+    async def _send(self, f, hostname, method, url, **kwargs):
+        circuit = self._get_circuit(hostname)
+        if circuit.open:
+            send(circuit_open=hostname)
+            raise HostUnavailable(f"Skipping {url}: {hostname} is unavailable")
+        bucket = self._get_bucket(hostname)
+        if bucket is not None:
+            await bucket.acquire()
+        try:
+            response = await f.generic(method, url, **kwargs)
+        except ERRORS as exc:
+            response = exc.response
+            if response is None:
+                circuit.failure()
+                raise
+            self._observe(circuit, bucket, response)
+            raise
+        except Exception:
+            circuit.failure()
+            raise
+        if not kwargs.get("stream", False):
+            self._observe(circuit, bucket, response)
+        return response
+
+    def _observe(self, circuit, bucket, response):
+        status = response.status_code
+        delay = retry_delay(response.headers)
+        # A host that asks us to come back later is up, unlike one that errors
+        if status >= 500 and delay is None:
+            circuit.failure()
+        else:
+            circuit.success()
+        if delay is not None and delay > self.max_pause.total_seconds():
+            # Holding back every request to the host for that long would stall
+            # the callers, so they fail until then instead
+            circuit.trip(delay)
+            return
+        if bucket is None:
+            return
+        if status in (429, 503):
+            bucket.slow_down()
+            bucket.pause(1 / bucket.rate if delay is None else delay)
+        elif delay is not None:
+            # The host says we have no requests left until the reset
+            bucket.pause(delay)
+        else:
+            bucket.speed_up()
+
     async def generic(self, method, url, **kwargs):
         for pattern, fetcher_key in self.rules.items():
             if pattern.search(url):
@@ -363,7 +842,7 @@ class RulesFetcher(Fetcher):
                 hostname = urlparse(url).hostname or ""
                 if (semaphore := self._get_semaphore(hostname)) is not None:
                     async with semaphore:
-                        return await f.generic(method, url, **kwargs)
+                        return await self._send(f, hostname, method, url, **kwargs)
                 else:
-                    return await f.generic(method, url, **kwargs)
+                    return await self._send(f, hostname, method, url, **kwargs)
         raise ValueError(f"No fetcher rule matches URL: {url}")
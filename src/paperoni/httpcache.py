@@ -0,0 +1,310 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+from .sqlite import Transaction, connect
+
+_schema = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    stored INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    ttl REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_hash ON entries (hash);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+
+def cache_lifetime(headers) -> float | None:
+    """Return how many seconds a response can be reused, according to its headers.
+
+    This is 0 if Cache-Control says not to store the response, the max-age
+    of Cache-Control if it has one, or else the time left until Expires.
+    None means that the headers do not say.
+    """
+    directives = {}
+    for directive in headers.get("cache-control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+    if "no-store" in directives or "no-cache" in directives:
+        return 0.0
+    if "max-age" in directives:
+        try:
+            return max(float(directives["max-age"]), 0.0)
+        except ValueError:
+            return 0.0
+    if (expires := headers.get("expires")) is not None:
+        try:
+            when = parsedate_to_datetime(expires).timestamp()
+            now = parsedate_to_datetime(headers["date"]).timestamp()
+        except KeyError:
+            now = time.time()
+        except TypeError, ValueError:
+            # An invalid Expires means that the response is already expired
+            return 0.0
+        return max(when - now, 0.0)
+    return None
+
+
+@dataclass
+class CachedResponse:
+    # URL that was requested
+    url: str
+    # HTTP status code
+    status: int
+    # Response headers
+    headers: dict[str, str]
+    # Response body
+    content: bytes
+    # When the response was fetched (unix time)
+    fetched: float
+
+
+@dataclass
+class ResponseCache:
+    """Cache of HTTP responses, with bodies stored by content.
+
+    The index maps each request to the sha256 hash of the body it got, along
+    with the status, headers, fetch time and TTL of the response. Bodies are
+    compressed with zstd and stored once per hash, so that identical payloads
+    fetched from different URLs take space only once.
+
+    When the compressed bodies take more than max_size bytes, the bodies that
+    were least recently used are evicted, along with the requests that point
+    to them. Their size is counted when the cache is opened and kept up to
+    date as bodies are added and removed; it is counted again before
+    evicting, in case other processes removed some.
+
+    The methods can be called from several threads, e.g. with
+    asyncio.to_thread, so that the event loop does not wait on the disk.
+    """
+
+    # SQLite database file
+    file: Path
+    # Maximum total size of the compressed bodies, in bytes
+    max_size: int = 2 * 1024**3
+    # How long responses are reused, by default (None for forever)
+    expire_after: timedelta = None
+    # zstd compression level
+    level: int = 3
+
+    def __post_init__(self):
+        self._conn = None
+        self._lock = threading.Lock()
+        # Total size of the compressed bodies, as far as we know
+        self._stored = None
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stored": 0,
+            "deduplicated": 0,
+            "evicted": 0,
+            # Body bytes that did not have to be fetched again
+            "bytes_saved": 0,
+        }
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.file, _schema)
+            self._stored = self._count_stored()
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Hash the given description of a request into a key for the index."""
+        data = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key: str) -> CachedResponse | None:
+        """Return the response stored for key, or None if absent or expired."""
+        with self._lock:
+            now = time.time()
+            row = self.conn.execute(
+                "SELECT e.url, e.status, e.headers, e.fetched, e.ttl, b.data"
+                " FROM entries e JOIN blobs b ON b.hash = e.hash WHERE e.key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or (row[4] is not None and now - row[3] > row[4]):
+                self.stats["misses"] += 1
+                return None
+            url, status, headers, fetched, _, data = row
+            self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            content = _decompress(data)
+            self.stats["hits"] += 1
+            self.stats["bytes_saved"] += len(content)
+            return CachedResponse(
+                url=url,
+                status=status,
+                headers=json.loads(headers),
+                content=content,
+                fetched=fetched,
+            )
+
+    def put(
+        self,
+        key: str,
+        url: str,
+        status: int,
+        headers: dict[str, str],
+        content: bytes,
+        ttl: timedelta = None,
+    ):
+        """Store a response under key, replacing the previous one."""
+        with self._lock:
+            ttl = ttl if ttl is not None else self.expire_after
+            hash = hashlib.sha256(content).hexdigest()
+            now = time.time()
+            try:
+                with Transaction(self.conn) as conn:
+                    if conn.execute(
+                        "SELECT 1 FROM blobs WHERE hash = ?", (hash,)
+                    ).fetchone():
+                        self.stats["deduplicated"] += 1
+                    else:
+                        data = _compress(content, self.level)
+                        conn.execute(
+                            "INSERT INTO blobs (hash, size, stored, data) VALUES (?, ?, ?, ?)",
+                            (hash, len(content), len(data), data),
+                        )
+                        self._stored += len(data)
+                    previous = conn.execute(
+                        "SELECT hash FROM entries WHERE key = ?", (key,)
+                    ).fetchone()
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries"
+                        " (key, url, hash, status, headers, fetched, ttl, accessed)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            key,
+                            url,
+                            hash,
+                            status,
+                            json.dumps(dict(headers)),
+                            now,
+                            None if ttl is None else ttl.total_seconds(),
+                            now,
+                        ),
+                    )
+                    if previous and previous[0] != hash:
+                        self._drop_orphans([previous[0]])
+                    self.stats["stored"] += 1
+                    self._evict()
+            except BaseException:
+                # The changes to the size of the bodies were rolled back
+                self._stored = self._count_stored()
+                raise
+
+    def _count_stored(self) -> int:
+        (total,) = self.conn.execute(
+            "SELECT COALESCE(SUM(stored), 0) FROM blobs"
+        ).fetchone()
+        return total
+
+    def _drop_orphans(self, hashes: list[str]):
+        for hash in hashes:
+            row = self.conn.execute(
+                "DELETE FROM blobs WHERE hash = ?"
+                " AND NOT EXISTS (SELECT 1 FROM entries WHERE entries.hash = blobs.hash)"
+                " RETURNING stored",
+                (hash,),
+            ).fetchone()
+            if row is not None:
+                self._stored -= row[0]
+
+    def _evict(self):
+        if self._stored <= self.max_size:
+            return
+        total = self._stored = self._count_stored()
+        if total <= self.max_size:
+            return
+        # A body was last used when any of the requests that point to it was
+        rows = self.conn.execute(
+            "SELECT b.hash, b.stored FROM blobs b JOIN entries e ON e.hash = b.hash"
+            " GROUP BY b.hash ORDER BY MAX(e.accessed), b.hash"
+        ).fetchall()
+        evicted = []
+        for hash, stored in rows:
+            if total <= self.max_size:
+                break
+            evicted.append((hash,))
+            total -= stored
+        self.conn.executemany("DELETE FROM entries WHERE hash = ?", evicted)
+        self.conn.executemany("DELETE FROM blobs WHERE hash = ?", evicted)
+        self._stored = total
+        self.stats["evicted"] += len(evicted)
+
+    def purge(self) -> int:
+        """Remove the expired responses and return how many were removed."""
+        with self._lock:
+            with Transaction(self.conn) as conn:
+                removed = conn.execute(
+                    "DELETE FROM entries WHERE ttl IS NOT NULL AND fetched + ttl < ?",
+                    (time.time(),),
+                ).rowcount
+                conn.execute(
+                    "DELETE FROM blobs"
+                    " WHERE NOT EXISTS (SELECT 1 FROM entries WHERE entries.hash = blobs.hash)"
+                )
+            self._stored = self._count_stored()
+            return removed
+
+    def usage(self) -> dict[str, int]:
+        """Return the number of entries and bodies and the space they take.
+
+        size is the total size of the bodies of all entries, as if each was
+        stored uncompressed, and stored is the space they actually take.
+        """
+        with self._lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(b.size), 0)"
+                " FROM entries e JOIN blobs b ON b.hash = e.hash"
+            ).fetchone()
+            blobs, stored = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(stored), 0) FROM blobs"
+            ).fetchone()
+            return {"entries": entries, "blobs": blobs, "size": size, "stored": stored}
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def _compress(content: bytes, level: int) -> bytes:
+    from compression import zstd
+
+    return zstd.compress(content, level=level)
+
+
+def _decompress(data: bytes) -> bytes:
+    from compression import zstd
+
+    return zstd.decompress(data)
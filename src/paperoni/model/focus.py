@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+from collections import defaultdict
 from dataclasses import dataclass, field, replace
-from heapq import heapify, heappush, heappushpop
+from heapq import heapify
 from typing import Counter, Iterable, Literal
 
 from outsight import send
@@ -9,6 +10,7 @@ from ovld import ovld
 from serieux.features.comment import CommentProxy
 
 from ..utils import (
+    AhoCorasick,
     mostly_latin,
     normalize_institution,
     normalize_name,
@@ -50,6 +52,42 @@ class Focus:
         )
 
 
+# Maximum number of entries in each of the caches of Focuses
+_SCORE_CACHE_SIZE = 100_000
+
+
+def focus_key(f: Focus) -> tuple[str, str]:
+    """Return the (type, normalized name) under which a focus is indexed."""
+    match f.type.split("_")[0]:
+        case "author":
+            return (f.type, normalize_name(f.name))
+        case "institution":
+            return (f.type, normalize_institution(f.name))
+        case _:
+            raise ValueError(f"Invalid focus type: {f.type}")
+
+
+@dataclass
+class FocusDiff:
+    # Focuses that were added
+    added: list[Focus] = field(default_factory=list)
+    # Focuses that were removed
+    removed: list[Focus] = field(default_factory=list)
+    # Focuses whose score or drive_discovery changed, as (before, after)
+    changed: list[tuple[Focus, Focus]] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def keys(self) -> set[tuple[str, str]]:
+        """Return the keys of the focuses that change scores."""
+        return {
+            *map(focus_key, self.added),
+            *map(focus_key, self.removed),
+            *(focus_key(new) for old, new in self.changed if old.score != new.score),
+        }
+
+
 def combine(scores):
     return sum(scores)
 
@@ -66,51 +104,115 @@ class Focuses:
         self.score_index = {}
         self.focuses = list(self.main + self.auto)
         for f in self.focuses:
-            match f.type.split("_")[0]:
-                case "author":
-                    self.score_index[(f.type, normalize_name(f.name))] = f.score
-                case "institution":
-                    self.score_index[(f.type, normalize_institution(f.name))] = f.score
-                case _:
-                    raise ValueError(f"Invalid focus type: {f.type}")
+            self.score_index[focus_key(f)] = f.score
+        # Institution focuses also match inside longer affiliation names, e.g.
+        # "Mila" in "Montreal Institute for Learning Algorithms (Mila)"
+        self.institution_matcher = AhoCorasick(
+            {
+                name: (name, score)
+                for (t, name), score in self.score_index.items()
+                if t == "institution"
+            }
+        )
+        # Scores of papers and authors, keyed by the fields that determine them
+        self._paper_scores = {}
+        self._author_scores = {}
+        self._institution_matches = {}
 
     def __iter__(self):
         return iter(self.focuses)
 
+    @staticmethod
+    def _author_key(p: PaperAuthor):
+        return (p.display_name, tuple([aff.name for aff in p.affiliations]))
+
+    @staticmethod
+    def _cache(cache: dict, key, value):
+        if len(cache) >= _SCORE_CACHE_SIZE:
+            # Evict the oldest entry
+            del cache[next(iter(cache))]
+        cache[key] = value
+
     @ovld
     def score(self, p: PaperWorkingSet):
         return self.score(p.current)
 
     @ovld
     def score(self, p: Paper):
-        if not mostly_latin(p.title):
-            result = 0.0
-        else:
-            scores = [self.score(author) for author in p.authors]
-            result = combine(scores)
+        author_keys = [self._author_key(a) for a in p.authors]
+        key = (p.title, tuple(author_keys))
+        result = self._paper_scores.get(key)
+        if result is None:
+            if not mostly_latin(p.title):
+                result = 0.0
+            else:
+                scores = [
+                    self._author_score(author, akey)
+                    for author, akey in zip(p.authors, author_keys)
+                ]
+                result = combine(scores)
+            self._cache(self._paper_scores, key, result)
         send(score=result)
         return result
 
     @ovld
     def score(self, p: PaperAuthor):
+        return self._author_score(p, self._author_key(p))
+
+    @ovld
+    def score(self, p: CommentProxy):
+        return self.score(p._obj)
+
+    def _author_score(self, p: PaperAuthor, key):
+        result = self._author_scores.get(key)
+        if result is None:
+            result = self._score_author(p)
+            self._cache(self._author_scores, key, result)
+        return result
+
+    def _institution_scores(self, name: str):
+        scores = self._institution_matches.get(name)
+        if scores is None:
+            if ("institution", name) in self.score_index:
+                scores = [self.score_index["institution", name]]
+            else:
+                matches = self.institution_matcher.find_words(name)
+                # Each focus counts once, even if it occurs several times
+                scores = [score for _, score in {value for _, _, value in matches}]
+            self._cache(self._institution_matches, name, scores)
+        return scores
+
+    def _score_author(self, p: PaperAuthor):
         name_score = self.score_index.get(("author", normalize_name(p.display_name)), 0.0)
         iscores = 0.0
         recognized_institution = False
         for aff in p.affiliations:
             for name in split_institution(aff.name):
-                iscore = self.score_index.get(
-                    ("institution", normalize_institution(name)), None
-                )
-                if iscore is not None:
+                for iscore in self._institution_scores(normalize_institution(name)):
                     iscores += iscore
                     recognized_institution = True
         if p.affiliations and not recognized_institution:
             return 0.0
         return name_score + iscores
 
-    @ovld
-    def score(self, p: CommentProxy):
-        return self.score(p._obj)
+    def diff(self, other: "Focuses") -> FocusDiff:
+        """Return the changes needed to go from these focuses to other.
+
+        Focuses are identified by their type and normalized name.
+        """
+        before = {focus_key(f): f for f in self.focuses}
+        after = {focus_key(f): f for f in other.focuses}
+        return FocusDiff(
+            added=[f for k, f in after.items() if k not in before],
+            removed=[f for k, f in before.items() if k not in after],
+            changed=[
+                (f, after[k])
+                for k, f in before.items()
+                if k in after
+                and (f.score, f.drive_discovery)
+                != (after[k].score, after[k].drive_discovery)
+            ],
+        )
 
     def top(self, papers, n, drop_zero=True):
         t = Top(n, drop_zero=drop_zero)
@@ -162,6 +264,40 @@ class Focuses:
         self.compile()
 
 
+class FocusIndex:
+    """Inverted index from the author names and affiliations of papers to
+    the papers, to find those whose score may be changed by a FocusDiff."""
+
+    def __init__(self):
+        self.authors = defaultdict(set)
+        self.institutions = defaultdict(set)
+
+    def add(self, key, paper: Paper):
+        """Index the paper under the given key, for example its id."""
+        for author in paper.authors:
+            self.authors[normalize_name(author.display_name)].add(key)
+            for aff in author.affiliations:
+                for name in split_institution(aff.name):
+                    self.institutions[normalize_institution(name)].add(key)
+
+    def affected(self, diff: FocusDiff) -> set:
+        """Return the keys of the papers whose score may change with diff."""
+        results = set()
+        institutions = {}
+        for t, name in diff.keys():
+            if t == "author":
+                results.update(self.authors.get(name, ()))
+            elif t == "institution":
+                institutions[name] = name
+        if institutions:
+            # Same matching as Focuses.score, but over the affiliations
+            matcher = AhoCorasick(institutions)
+            for name, keys in self.institutions.items():
+                if matcher.find_words(name):
+                    results.update(keys)
+        return results
+
+
 @dataclass
 class AuthorFocusPolicy:
     score: int
@@ -182,23 +318,74 @@ class Scored[T]:
 
 @dataclass
 class Top[T]:
+    """Keep the n entries with the highest scores.
+
+    Entries are kept in a binary min-heap (the lowest entry is evicted first)
+    along with the position of each entry in the heap, so that an entry
+    whose score changed can be moved in O(log n) with update(). The sorted
+    order is computed once and reused until the next change.
+    """
+
     n: int
     entries: list[T] = field(default_factory=list)
     drop_zero: bool = True
 
     def __post_init__(self):
         xs, self.entries = self.entries, []
+        self._positions = {}
+        self._sorted = None
         self.add_all(xs)
 
+    def _set(self, i, x):
+        self.entries[i] = x
+        self._positions[id(x)] = i
+
+    # _siftdown and _siftup are the same as in heapq, but record positions
+
+    def _siftdown(self, startpos, pos):
+        heap = self.entries
+        x = heap[pos]
+        while pos > startpos:
+            parentpos = (pos - 1) >> 1
+            parent = heap[parentpos]
+            if x < parent:
+                self._set(pos, parent)
+                pos = parentpos
+                continue
+            break
+        self._set(pos, x)
+
+    def _siftup(self, pos):
+        heap = self.entries
+        endpos = len(heap)
+        startpos = pos
+        x = heap[pos]
+        childpos = 2 * pos + 1
+        while childpos < endpos:
+            rightpos = childpos + 1
+            if rightpos < endpos and not heap[childpos] < heap[rightpos]:
+                childpos = rightpos
+            self._set(pos, heap[childpos])
+            pos = childpos
+            childpos = 2 * pos + 1
+        self._set(pos, x)
+        self._siftdown(startpos, pos)
+
     def add(self, x):
         if self.drop_zero and self._is_zero(x):
             return False
-        if len(self.entries) >= self.n:
-            replaced = heappushpop(self.entries, x)
-            return replaced is not x
+        heap = self.entries
+        if len(heap) >= self.n:
+            if not heap or not heap[0] < x:
+                return False
+            del self._positions[id(heap[0])]
+            self._set(0, x)
+            self._siftup(0)
         else:
-            heappush(self.entries, x)
-            return True
+            heap.append(x)
+            self._siftdown(0, len(heap) - 1)
+        self._sorted = None
+        return True
 
     def add_all(self, elems):
         count = 0
@@ -207,21 +394,59 @@ class Top[T]:
                 count += 1
         return count
 
+    def __contains__(self, x):
+        return id(x) in self._positions
+
+    def update(self, x):
+        """Move x to its place after its score changed.
+
+        Returns False if x is not in the top list, or if it was removed
+        because its score is now zero.
+        """
+        if x not in self:
+            return False
+        if self.drop_zero and self._is_zero(x):
+            self.discard(x)
+            return False
+        pos = self._positions[id(x)]
+        self._siftdown(0, pos)
+        if self._positions[id(x)] == pos:
+            self._siftup(pos)
+        self._sorted = None
+        return True
+
+    def discard(self, x):
+        """Remove x from the top list, if it is there."""
+        pos = self._positions.pop(id(x), None)
+        if pos is None:
+            return
+        last = self.entries.pop()
+        if pos < len(self.entries):
+            self._set(pos, last)
+            self._siftdown(0, pos)
+            if self._positions[id(last)] == pos:
+                self._siftup(pos)
+        self._sorted = None
+
     def discard_all(self, elems):
-        ids = {id(e) for e in elems}
-        self.entries = [e for e in self.entries if id(e) not in ids]
-        heapify(self.entries)
+        for elem in elems:
+            self.discard(elem)
 
     def resort(self):
+        """Restore the order after the scores of many entries changed."""
         if self.drop_zero:
             self.entries = [e for e in self.entries if not self._is_zero(e)]
         heapify(self.entries)
+        self._positions = {id(x): i for i, x in enumerate(self.entries)}
+        self._sorted = None
 
     def __len__(self):
         return len(self.entries)
 
     def __iter__(self):
-        yield from sorted(self.entries, reverse=True)
+        if self._sorted is None:
+            self._sorted = sorted(self.entries, reverse=True)
+        return iter(self._sorted)
 
     @staticmethod
     def _is_zero(x):
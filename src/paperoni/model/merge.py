@@ -1,11 +1,15 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
+from datetime import date, datetime
 from difflib import SequenceMatcher
+from enum import Enum
 from numbers import Number
+from types import NoneType, UnionType
+from typing import Literal, Union, get_args, get_origin, get_type_hints
 
-from ovld import Dataclass, call_next, ovld, recurse
+from ovld import Code, Dataclass, call_next, code_generator, ovld, recurse
 from serieux.features.comment import CommentProxy
 
-from ..utils import associate, plainify
+from ..utils import associate, normalize_institution, normalize_name, plainify
 from .classes import Institution, Paper, PaperAuthor
 
 
@@ -91,8 +95,43 @@ def merge(x: dict, y: dict, qx: Number, qy: Number):
 
 
 @ovld
+@code_generator
 def merge(x: Dataclass, y: Dataclass, qx: Number, qy: Number):
-    return type(x)(**recurse(vars(x), vars(y), qx, qy))
+    # x and y are the types of the arguments here. The generated code does the
+    # same thing as generic_merge below, but the merge of each field is chosen
+    # from its annotation, so that it does not have to be dispatched on.
+    generic = Code("return $cls(**$merge(vars(x), vars(y), qx, qy))", cls=x, merge=merge)
+    if x is not y or not all(f.init for f in fields(x)):
+        return generic
+    try:
+        hints = get_type_hints(x)
+    except Exception:
+        hints = {}
+    stmts = [
+        # Attributes that are not fields would be passed to the constructor
+        Code(f"if len(vars(x)) != {len(fields(x))} or len(vars(y)) != {len(fields(x))}:"),
+        [generic],
+        "if qx < qy:",
+        ["x, y, qx, qy = y, x, qy, qx"],
+    ]
+    args = []
+    for i, f in enumerate(fields(x)):
+        t = hints.get(f.name, object)
+        stmts.append(f"a, b = x.{f.name}, y.{f.name}")
+        if plain := _plain_types(t):
+            expr = "(b if a is None else a) if type(a) in $plain and type(b) in $plain"
+        elif t is list or get_origin(t) is list:
+            expr = "$merge_lists(a, b, qx, qy) if type(a) is list and type(b) is list"
+        elif t is set or get_origin(t) is set:
+            expr = "a | b if type(a) is set and type(b) is set"
+        else:
+            expr = None
+        fallback = "$merge(a, b, qx, qy)"
+        expr = f"{expr} else {fallback}" if expr else fallback
+        stmts.append(Code(f"v{i} = {expr}", plain=plain, merge_lists=_merge_lists))
+        args.append(f"{f.name}=v{i}")
+    stmts.append(Code(f"return $cls({', '.join(args)})", cls=x))
+    return Code(stmts, merge=merge)
 
 
 @ovld
@@ -118,7 +157,14 @@ def merge(
     x: list, y: list, qx: Number, qy: Number, et: type[PaperAuthor] | type[Institution]
 ):
     results = []
-    ass = associate(x, y, key=similarity, threshold=0.5)
+    ass = associate(
+        x,
+        y,
+        key=similarity,
+        threshold=0.5,
+        exact=association_key,
+        blocks=association_blocks,
+    )
     extra = y[:]
     for x1, x2 in ass:
         merged = recurse(x1, x2, qx, qy) if x2 is not None else x1
@@ -135,6 +181,47 @@ def merge(x: list, y: list, qx: Number, qy: Number, et: type[object]):
     return x + [a for a in y if a not in x]
 
 
+# Types of values that merge as a whole, picking the one with the best quality
+_plain = (str, int, float, bool, date, datetime, NoneType)
+
+
+def _plain_types(t) -> frozenset[type] | None:
+    """Return the types a field annotated with t can hold, if they are all
+    plain values. None is always included, since it is a common default."""
+    if t is None or t in _plain or (isinstance(t, type) and issubclass(t, Enum)):
+        return frozenset({NoneType, t or NoneType})
+    origin = get_origin(t)
+    if origin is Literal:
+        types = {type(v) for v in get_args(t)}
+        return frozenset({NoneType, *types}) if types <= set(_plain) else None
+    if origin is Union or origin is UnionType:
+        options = [_plain_types(arg) for arg in get_args(t)]
+        return None if None in options else frozenset().union(*options)
+    return None
+
+
+def _merge_lists(x: list, y: list, qx: Number, qy: Number):
+    # Same as merge(x: list, y: list, ...) when qx >= qy
+    if not x:
+        return y
+    elif not y:
+        return x
+    first = x[0]
+    if isinstance(first, CommentProxy):
+        first = first._obj
+    return merge(x, y, qx, qy, type(first))
+
+
+@merge.variant
+def generic_merge(x: Dataclass, y: Dataclass, qx: Number, qy: Number):
+    """Merge dataclasses field by field through dispatch.
+
+    This is how merge behaves, without specialized code for each dataclass.
+    It serves as a reference to test and benchmark merge against.
+    """
+    return type(x)(**recurse(vars(x), vars(y), qx, qy))
+
+
 @ovld(priority=1)
 def similarity(a: CommentProxy, b: object):
     return recurse(a._obj, b)
@@ -162,6 +249,36 @@ def similarity(a: str, b: str):
     return SequenceMatcher(a=a, b=b).ratio()
 
 
+@ovld(priority=1)
+def association_key(a: CommentProxy):
+    return recurse(a._obj)
+
+
+@ovld
+def association_key(a: PaperAuthor):
+    return normalize_name(a.display_name)
+
+
+@ovld
+def association_key(a: Institution):
+    return normalize_institution(a.name)
+
+
+@association_key.variant
+def association_blocks(a: PaperAuthor):
+    # Last name, or first initial and start of the last name to tolerate typos
+    # in the last name. Names that share neither will not be compared.
+    parts = plainify(a.display_name).split()
+    if not parts:
+        return []
+    return [parts[-1], f"{parts[0][0]}/{parts[-1][:2]}"]
+
+
+@association_key.variant
+def association_blocks(a: Institution):
+    return [w for w in plainify(a.name).split() if len(w) > 3]
+
+
 def merge_all(entries):
     if not entries:
         return None
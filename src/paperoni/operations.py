@@ -1,6 +1,7 @@
 import textwrap
 from dataclasses import dataclass, replace
 from datetime import date, datetime
+from functools import update_wrapper, wraps
 from types import SimpleNamespace
 from typing import Callable
 
@@ -63,12 +64,15 @@ class FlagSetter:
 
 def flag_setter(true_flag: str, false_flag: str = None):
     def deco(fn):
-        return FlagSetter(fn, true_flag=true_flag, false_flag=false_flag)
+        # Keep the name of fn so that the setter can be referenced as module:name
+        setter = FlagSetter(fn, true_flag=true_flag, false_flag=false_flag)
+        return update_wrapper(setter, fn)
 
     return deco
 
 
 def operation(fn):
+    @wraps(fn)
     def deco(p: Paper):
         new = fn(p)
         return OperationResult(
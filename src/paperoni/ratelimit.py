@@ -0,0 +1,141 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+
+class HostUnavailable(Exception):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+
+@dataclass
+class RateLimit:
+    # Average number of requests per second
+    rate: float
+    # Number of requests that can be sent at once after a pause
+    burst: int = 1
+
+
+def retry_delay(headers) -> float | None:
+    """Return how many seconds the server asks us to wait, if it does.
+
+    Looks at the Retry-After header, then at the X-RateLimit-Reset header if
+    X-RateLimit-Remaining says that no request is left.
+    """
+    if headers is None:
+        return None
+    if (value := headers.get("retry-after")) is not None:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+        except TypeError, ValueError:
+            return None
+        return max(when.timestamp() - time.time(), 0.0)
+    remaining = headers.get("x-ratelimit-remaining")
+    reset = headers.get("x-ratelimit-reset")
+    if remaining is not None and reset is not None:
+        try:
+            if float(remaining) > 0:
+                return None
+            reset = float(reset)
+        except ValueError:
+            return None
+        # Some servers give a timestamp, others a number of seconds
+        return max(reset - time.time(), 0.0) if reset > 1e9 else reset
+    return None
+
+
+class TokenBucket:
+    """Token bucket that spaces out the requests sent to a host.
+
+    Tokens come back at the configured rate, up to burst tokens, and each
+    request takes one. When the server says to slow down, the rate is halved
+    and the bucket is paused for as long as the server asks; it then comes
+    back to the configured rate progressively as requests succeed.
+    """
+
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self.rate = limit.rate
+        self.tokens = float(limit.burst)
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.tokens + (now - self._updated) * self.rate, float(self.limit.burst)
+        )
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        """Take amount tokens, waiting until they are available.
+
+        An amount larger than the burst is taken as soon as the bucket is
+        full, and the tokens that are missing delay the next acquisitions.
+        """
+        needed = min(amount, self.limit.burst)
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.paused_until:
+                wait = self.paused_until - now
+            elif self.tokens >= needed:
+                self.tokens -= amount
+                return
+            else:
+                wait = (needed - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def slow_down(self):
+        self.rate = max(self.rate / 2, self.limit.rate / 16)
+
+    def speed_up(self):
+        self.rate = min(self.rate + self.limit.rate / 16, self.limit.rate)
+
+
+class Circuit:
+    """Circuit breaker for one host.
+
+    After threshold consecutive failures, the circuit opens and requests to
+    the host fail right away for cooldown seconds. The next request after
+    that is let through: if it fails, the circuit opens again, otherwise it
+    closes. The circuit can also be opened for a given time with trip().
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.open_for = cooldown
+
+    @property
+    def open(self) -> bool:
+        return (
+            self.opened_at is not None
+            and time.monotonic() - self.opened_at < self.open_for
+        )
+
+    def trip(self, seconds: float):
+        """Open the circuit for at least the given number of seconds."""
+        self.opened_at = time.monotonic()
+        self.open_for = max(seconds, self.cooldown)
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.threshold and self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self.open_for = self.cooldown
@@ -1,5 +1,5 @@
 from . import aggregators, dblp, doi, llm_html, llm_pdf, pubmed, title
-from .fetch import fetch_all, register_fetch
+from .fetch import fetch_all, register_batch_fetch, register_fetch
 
 __all__ = [
     "aggregators",
@@ -10,5 +10,6 @@ __all__ = [
     "pubmed",
     "title",
     "fetch_all",
+    "register_batch_fetch",
     "register_fetch",
 ]
@@ -1,34 +1,77 @@
+import re
 from typing import Literal
 
 from ..config import config
 from ..discovery.openalex import WORK_TYPES, OpenAlexQueryManager
 from ..discovery.semantic_scholar import SemanticScholar
 from ..get import ERRORS
-from .fetch import register_fetch
+from .fetch import each_link, register_batch_fetch, rejected
 
+_openalex_id = re.compile(r"W\d+")
 
-@register_fetch(tags={"extra"})
-async def semantic_scholar(typ: Literal["semantic_scholar"], link: str):
+
+@register_batch_fetch(tags={"extra"}, size=100)
+async def semantic_scholar(typ: Literal["semantic_scholar"], links: list[str]):
     """Fetch from Semantic Scholar by paper ID."""
 
+    ss = SemanticScholar()
     try:
-        return await SemanticScholar().paper(link)
-    except ERRORS as exc:  # pragma: no cover
-        if exc.response.status_code == 404:
-            return None
-        else:
+        papers = await ss.papers(links)
+    except ERRORS as exc:
+        if not rejected(exc):
+            raise
+    else:
+        return dict(zip(links, papers))
+
+    # Some ID in the batch was rejected, fetch them one by one
+    async def fetch_one(paper_id):
+        try:
+            return await ss.paper(paper_id)
+        except ERRORS as exc:
+            if exc.response is not None and exc.response.status_code == 404:
+                return None
             raise
 
+    return await each_link(fetch_one, links)
 
-@register_fetch(tags={"extra"})
-async def openalex(typ: Literal["openalex"], link: str):
+
+@register_batch_fetch(tags={"extra"}, size=50)
+async def openalex(typ: Literal["openalex"], links: list[str]):
     """Fetch from OpenAlex by work ID."""
 
     qm = OpenAlexQueryManager(mailto=config.mailto, work_types=WORK_TYPES)
 
-    async for paper in qm.works(
-        filter=f"ids.openalex:{link}",
-        data_version="2",
-        limit=1,
-    ):
-        return paper
+    async def fetch(by_id):
+        results = {}
+        async for paper in qm.works(
+            filter=f"ids.openalex:{'|'.join(by_id)}",
+            data_version="2",
+            limit=len(by_id),
+        ):
+            if (
+                link := by_id.get(paper.info["discovered_by"]["openalex"].upper())
+            ) is not None:
+                results[link] = paper
+        return results
+
+    # Links may be full URLs, like https://openalex.org/W2741809807. Links that
+    # are not work IDs cannot be found, and would break the filter.
+    by_id = {}
+    for link in links:
+        if _openalex_id.fullmatch(work_id := link.rsplit("/", 1)[-1].upper()):
+            by_id[work_id] = link
+    if not by_id:
+        return {}
+
+    try:
+        return await fetch(by_id)
+    except ERRORS as exc:
+        if not rejected(exc):
+            raise
+
+    # Some ID in the batch was rejected, fetch them one by one
+    async def fetch_one(work_id):
+        return (await fetch({work_id: work_id})).get(work_id)
+
+    results = await each_link(fetch_one, list(by_id))
+    return {by_id[work_id]: result for work_id, result in results.items()}
@@ -1,6 +1,8 @@
+import re
 from datetime import date
 from types import SimpleNamespace
 from typing import Literal
+from urllib.parse import quote
 
 from ovld.dependent import StartsWith
 
@@ -19,22 +21,18 @@ from ..model import (
     Venue,
     VenueType,
 )
-from .fetch import register_fetch
+from .fetch import each_link, register_batch_fetch, register_fetch, rejected
 from .formats import paper_from_crossref, paper_from_jats
 
+# DOIs that can be put in a Crossref filter, which separates values with
+# commas and has no way to escape them
+_filterable_doi = re.compile(r"10\.\d{4,9}/[^\s,]+")
 
-@register_fetch
-async def crossref(typ: Literal["doi"], link: str):
-    """Fetch from CrossRef."""
-
-    doi = link
-    if "arXiv" in doi:
-        # We know it's not indexed here
-        return None
 
+async def _crossref_one(doi: str):
     try:
         data = await config.fetch.read_retry(
-            f"https://api.crossref.org/v1/works/{doi}", format="json"
+            f"https://api.crossref.org/v1/works/{quote(doi)}", format="json"
         )
     except ERRORS as exc:  # pragma: no cover
         if exc.response.status_code == 404:
@@ -45,8 +43,45 @@ async def crossref(typ: Literal["doi"], link: str):
     if data["status"] != "ok":  # pragma: no cover
         raise Exception("Request failed", data)
 
-    data = SimpleNamespace(**data["message"])
-    return await paper_from_crossref(data)
+    return await paper_from_crossref(SimpleNamespace(**data["message"]))
+
+
+@register_batch_fetch(size=20, version=2)
+async def crossref(typ: Literal["doi"], links: list[str]):
+    """Fetch from CrossRef."""
+
+    # We know arXiv papers are not indexed there
+    dois = [doi for doi in links if "arXiv" not in doi]
+    by_doi = {doi.lower(): doi for doi in dois if _filterable_doi.fullmatch(doi)}
+    # The DOIs that cannot be filtered on are fetched one by one
+    single = [doi for doi in dois if doi.lower() not in by_doi]
+
+    results = {}
+    if by_doi:
+        try:
+            data = await config.fetch.read_retry(
+                "https://api.crossref.org/v1/works",
+                params={
+                    "filter": ",".join(f"doi:{doi}" for doi in by_doi),
+                    "rows": len(by_doi),
+                },
+                format="json",
+            )
+        except ERRORS as exc:
+            if not rejected(exc):
+                raise
+            # Some DOI in the batch was rejected, so that only its own lookup
+            # fails, fetch them one by one
+            single = dois
+        else:
+            if data["status"] != "ok":  # pragma: no cover
+                raise Exception("Request failed", data)
+            for item in data["message"]["items"]:
+                if (doi := by_doi.get(item["DOI"].lower())) is not None:
+                    results[doi] = await paper_from_crossref(SimpleNamespace(**item))
+
+    results.update(await each_link(_crossref_one, single))
+    return results
 
 
 @register_fetch
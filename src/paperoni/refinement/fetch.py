@@ -1,11 +1,17 @@
 import asyncio
+import functools
 import inspect
-from dataclasses import dataclass, replace
-from typing import Callable
+from contextlib import nullcontext
+from dataclasses import dataclass, field, replace
+from typing import Awaitable, Callable
 
 from ovld import ovld
 
+from ..get import ERRORS
+from ..ratelimit import HostUnavailable
+from ..refinestore import MISSING, RefineStore
 from ..utils import soft_fail, url_to_id
+from .schedule import BudgetExhausted, RefineScheduler
 
 
 @ovld
@@ -13,10 +19,15 @@ async def fetch(typ: str, link: str):
     return None
 
 
-def register_fetch(f=None, *, tags=None):
+def register_fetch(f=None, *, tags=None, version=1, timeout=None):
     def decorator(f):
         assert inspect.iscoroutinefunction(f), "Registered fetch function must be async"
         f.description = f.__name__
+        # Change the version to invalidate the results kept in the RefineStore
+        f.version = version
+        # Number of seconds after which the refiner is abandoned, if it is
+        # lower than the timeout given to fetch_all
+        f.timeout = timeout
         f.tags = tags or {"normal"}
         f.tags.add(f.__name__)
         fetch.register(f)
@@ -28,6 +39,121 @@ def register_fetch(f=None, *, tags=None):
         return decorator(f)
 
 
+@dataclass
+class Batcher:
+    """Group the links requested within a short window into one call."""
+
+    # Function called with a type and a list of links, which returns a dict
+    # from link to paper (links that are missing were not found)
+    func: Callable[[str, list[str]], Awaitable[dict]]
+    # Maximum number of links in a batch
+    size: int = 50
+    # Number of seconds to wait for more links before calling func
+    window: float = 0.05
+
+    # Links waiting for a call, by event loop and type
+    _pending: dict = field(default_factory=dict, repr=False)
+    _timers: dict = field(default_factory=dict, repr=False)
+    _tasks: set = field(default_factory=set, repr=False)
+
+    async def get(self, typ: str, link: str):
+        loop = asyncio.get_running_loop()
+        key = (loop, typ)
+        fut = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((link, fut))
+        if len(batch) >= self.size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await fut
+
+    def _flush(self, key):
+        if (timer := self._timers.pop(key, None)) is not None:
+            timer.cancel()
+        # Requests that were cancelled while waiting are dropped
+        batch = [
+            (link, fut) for link, fut in self._pending.pop(key, []) if not fut.done()
+        ]
+        if batch:
+            task = asyncio.ensure_future(self._run(key[1], batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, typ, batch):
+        links = list(dict.fromkeys(link for link, _ in batch))
+        try:
+            results = await self.func(typ, links)
+        except Exception as exc:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        for link, fut in batch:
+            if not fut.done():
+                result = results.get(link)
+                if isinstance(result, Exception):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+
+def rejected(exc: Exception) -> bool:
+    """Return whether exc is an HTTP error for a request the server rejected.
+
+    These are the 4xx errors, except 429, which only means to wait.
+    """
+    response = getattr(exc, "response", None)
+    return (
+        isinstance(exc, ERRORS)
+        and response is not None
+        and 400 <= response.status_code < 500
+        and response.status_code != 429
+    )
+
+
+async def each_link(f: Callable[[str], Awaitable], links: list[str]) -> dict:
+    """Call f on each link, for a batch refiner that cannot batch them.
+
+    The errors are returned in place of the results, so that they are only
+    raised for their own link.
+    """
+    results = await asyncio.gather(*[f(link) for link in links], return_exceptions=True)
+    return dict(zip(links, results))
+
+
+def register_batch_fetch(f=None, *, size=50, window=0.05, **kwargs):
+    """Register a refiner that handles many links of the same type at once.
+
+    f is called as f(typ, links) and returns a dict from link to paper. The
+    refiner that is registered takes one link, like the others, but the links
+    requested within window seconds of each other, up to size of them, are
+    given to f together, so that refining many papers costs a few requests.
+    An exception raised by f is raised for all the links, but f can also put
+    an exception in the dict in place of a paper, to raise it for one link.
+    """
+
+    def decorator(f):
+        assert inspect.iscoroutinefunction(f), "Registered fetch function must be async"
+        batcher = Batcher(f, size=size, window=window)
+        typ_param = next(iter(inspect.signature(f).parameters))
+
+        @functools.wraps(f)
+        async def fetch_one(typ, link):
+            return await batcher.get(typ, link)
+
+        # The signature is used for dispatch, so it must not be taken from f
+        del fetch_one.__wrapped__
+        fetch_one.__annotations__ = {"typ": f.__annotations__[typ_param], "link": str}
+        fetch_one.batcher = batcher
+        return register_fetch(fetch_one, **kwargs)
+
+    if f is None:
+        return decorator
+    else:
+        return decorator(f)
+
+
 @dataclass
 class AllOf:
     exprs: list
@@ -89,7 +215,32 @@ async def _call(f: Callable, *args, force: bool = False, **kwargs) -> tuple:
 #         FOR EACH link IN sws.value.links:
 #             IF refine(link, tags=tags)
 #                 BREAK
-async def fetch_all(links, group="composite", statuses=None, tags=None, force=False):
+async def fetch_all(
+    links,
+    group="composite",
+    statuses=None,
+    tags=None,
+    force=False,
+    store: RefineStore = None,
+    refresh=False,
+    timeout=None,
+    scheduler: RefineScheduler = None,
+):
+    """Run the refiners that apply to the links and yield the papers found.
+
+    The refiners run concurrently and the papers are yielded as soon as they
+    are found, so that a slow refiner does not hold back the others. A
+    refiner that takes more than timeout seconds (or its own, lower, timeout)
+    is abandoned. When the caller stops iterating, e.g. because it has
+    enough information, the refiners that are still running are cancelled.
+
+    If a store is given, the results it holds are yielded instead of running
+    their refiners again, unless refresh is True, and new results are added
+    to it.
+
+    If a scheduler is given, each refiner waits for a slot before it runs,
+    and is skipped if the scheduler's budget ran out.
+    """
     statuses = statuses or {}
     tags = tags or {"normal"}
 
@@ -106,15 +257,34 @@ async def fetch_all(links, group="composite", statuses=None, tags=None, force=Fa
         else:
             links.append(link)
 
-    funcs = [(group, (links,), fetch.resolve_all(links))]
+    # Group refiners are stored under all their links, since the group name is
+    # the same for all papers
+    group_key = ",".join(sorted(f"{type}:{link}" for type, link in links))
+    funcs = [(group, group_key, (links,), fetch.resolve_all(links))]
     for type, link in links:
-        funcs.append((f"{type}:{link}", (type, link), fetch.resolve_all(type, link)))
+        key = f"{type}:{link}"
+        funcs.append((key, key, (type, link), fetch.resolve_all(type, link)))
 
-    async def go(key, name, nk, args, f):
+    async def go(key, store_key, name, nk, args, f):
         __trace__ = f"refine:{key}"  # noqa: F841
         with soft_fail(f"Refinement of {key}"):
             try:
-                paper = await _call(f.func, *args, force=force)
+                version = getattr(f.func, "version", None)
+                paper = MISSING
+                if store is not None and not refresh:
+                    paper = await asyncio.to_thread(store.get, name, store_key, version)
+                if paper is MISSING:
+                    ftags = getattr(f.func, "tags", {"normal"})
+                    limits = [t for t in (timeout, getattr(f.func, "timeout", None)) if t]
+                    async with (
+                        scheduler.slot(ftags) if scheduler else nullcontext(),
+                        asyncio.timeout(min(limits, default=None)),
+                    ):
+                        paper = await _call(f.func, *args, force=force)
+                    if store is not None:
+                        await asyncio.to_thread(
+                            store.put, name, store_key, version, paper
+                        )
                 if paper is not None:
                     statuses[nk] = "found"
                     return replace(
@@ -124,13 +294,20 @@ async def fetch_all(links, group="composite", statuses=None, tags=None, force=Fa
                     )
                 else:
                     statuses[nk] = "not_found"
+            except BudgetExhausted, HostUnavailable:
+                # It may run again in a later call
+                statuses.pop(nk, None)
+                return None
+            except TimeoutError:
+                statuses[nk] = "timeout"
+                raise
             except Exception:
                 statuses[nk] = "error"
                 raise
 
     tasks = []
 
-    for key, args, fs in funcs:
+    for key, store_key, args, fs in funcs:
         for f in fs:
             if not _test_tags(getattr(f.func, "tags", {"normal"}), tags):
                 continue
@@ -139,10 +316,20 @@ async def fetch_all(links, group="composite", statuses=None, tags=None, force=Fa
             if nk in statuses:
                 continue
             statuses[nk] = "pending"
-            coro = go(key, name, nk, args, f)
-            tasks.append(asyncio.create_task(coro))
+            coro = go(key, store_key, name, nk, args, f)
+            tasks.append((nk, asyncio.create_task(coro)))
 
-    for task in tasks:
-        result = await task
-        if result is not None:
-            yield result
+    try:
+        for next_done in asyncio.as_completed([task for _, task in tasks]):
+            result = await next_done
+            if result is not None:
+                yield result
+    finally:
+        cancelled = []
+        for nk, task in tasks:
+            if not task.done():
+                task.cancel()
+                cancelled.append(task)
+                # It may run again in a later call
+                statuses.pop(nk, None)
+        await asyncio.gather(*cancelled, return_exceptions=True)
@@ -1,20 +1,34 @@
+import re
 from typing import Literal
 
 from ..config import config
 from ..model import Link
-from .fetch import register_fetch
+from .fetch import register_batch_fetch
 from .formats import paper_from_jats
 
 
-@register_fetch
-async def pubmed(typ: Literal["pmc"], link: str):
-    pmc_id = link
+def _pmc_number(pmc_id: str):
+    return re.sub(r"^PMC", "", pmc_id.strip(), flags=re.IGNORECASE)
+
+
+@register_batch_fetch(size=50, version=2)
+async def pubmed(typ: Literal["pmc"], links: list[str]):
+    by_number = {_pmc_number(link): link for link in links}
     soup = await config.fetch.read_retry(
-        # PubMed Central OAI-PMH API : https://pmc.ncbi.nlm.nih.gov/tools/oai/
-        f"https://pmc.ncbi.nlm.nih.gov/api/oai/v1/mh/?verb=GetRecord&identifier=oai:pubmedcentral.nih.gov:{pmc_id}&metadataPrefix=pmc_fm",
+        # E-utilities efetch: https://www.ncbi.nlm.nih.gov/books/NBK25499/#chapter4.EFetch
+        "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi",
+        params={"db": "pmc", "id": ",".join(by_number), "retmode": "xml"},
         format="xml",
     )
-    return paper_from_jats(
-        soup,
-        links=[Link(type="pmc", link=pmc_id)],
-    )
+    results = {}
+    for article in soup.select("pmc-articleset > article"):
+        ids = article.select('article-meta > article-id[pub-id-type^="pmc"]')
+        for node in ids:
+            if (pmc_id := by_number.get(_pmc_number(node.text))) is not None:
+                # Only the front matter, as the OAI-PMH pmc_fm format gives
+                front = article.select_one("front") or article
+                results[pmc_id] = paper_from_jats(
+                    front, links=[Link(type="pmc", link=pmc_id)]
+                )
+                break
+    return results
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Awaitable, Callable, Iterable
+
+
+class BudgetExhausted(Exception):
+    """Raised when a refiner is about to start after the budget ran out."""
+
+
+@dataclass
+class RefineScheduler:
+    """Bound the refinement work done at once and in total.
+
+    Papers are refined a few at a time, in the order they are given (best
+    first), and each refiner call takes a slot for each of its tags that has
+    a limit, plus one of the "*" slots. Once the time or request budget is
+    spent, no new paper or refiner is started, so that the caller can save
+    what was gathered so far.
+    """
+
+    # Maximum number of papers refined at once
+    papers: int = 20
+    # Maximum number of refiners running at once for each tag, "*" counting
+    # all refiners together
+    simultaneous: dict[str, int] = field(default_factory=dict)
+    # Stop starting new work after this much time
+    time_budget: timedelta = None
+    # Stop starting new work after this many refiner calls
+    request_budget: int = None
+
+    def __post_init__(self):
+        self._semaphores = {
+            tag: asyncio.Semaphore(limit) for tag, limit in self.simultaneous.items()
+        }
+        self._started = time.monotonic()
+        self.requests = 0
+
+    @property
+    def exhausted(self) -> bool:
+        if self.request_budget is not None and self.requests >= self.request_budget:
+            return True
+        return (
+            self.time_budget is not None
+            and time.monotonic() - self._started >= self.time_budget.total_seconds()
+        )
+
+    @asynccontextmanager
+    async def slot(self, tags: set[str]):
+        """Wait for a slot to run a refiner with the given tags.
+
+        Raises BudgetExhausted if the budget ran out, including while waiting.
+        """
+        # Always acquire in the same order, to avoid deadlocks
+        names = sorted(tag for tag in tags if tag in self._semaphores)
+        if "*" in self._semaphores:
+            names.append("*")
+        acquired = []
+        try:
+            for name in names:
+                await self._semaphores[name].acquire()
+                acquired.append(self._semaphores[name])
+            if self.exhausted:
+                raise BudgetExhausted()
+            self.requests += 1
+            yield
+        finally:
+            for sem in acquired:
+                sem.release()
+
+    async def map[T](self, fn: Callable[[T], Awaitable], items: Iterable[T]):
+        """Call fn on each item, at most `papers` at a time, in order."""
+        it = iter(items)
+
+        async def worker():
+            for item in it:
+                if self.exhausted:
+                    return
+                await fn(item)
+
+        await asyncio.gather(*[worker() for _ in range(max(self.papers, 1))])
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+
+from serieux import deserialize, serialize
+
+from .model.classes import Paper
+from .sqlite import connect
+
+_schema = """
+CREATE TABLE IF NOT EXISTS results (
+    address TEXT PRIMARY KEY,
+    refiner TEXT NOT NULL,
+    query TEXT NOT NULL,
+    version TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    paper TEXT
+);
+CREATE INDEX IF NOT EXISTS results_refiner ON results (refiner, timestamp);
+"""
+
+# Marks a lookup that found nothing in the store
+MISSING = object()
+
+
+@dataclass
+class RefineStore:
+    """Persistent store of the results of the refiners.
+
+    Results are addressed by a hash of the refiner's name, the link or query
+    it was given and the refiner's version, so that changing a refiner's
+    version invalidates its results. A refiner that found nothing is recorded
+    as well, so that it is not asked again. Results are reused until they are
+    older than the refiner's TTL.
+    """
+
+    # SQLite database file
+    file: Path
+    # How long results are reused, by default
+    default_ttl: timedelta = timedelta(days=30)
+    # How long results are reused, for specific refiners
+    ttl: dict[str, timedelta] = field(default_factory=dict)
+    # How long the absence of a result is reused, at most
+    not_found_ttl: timedelta = timedelta(days=1)
+
+    def __post_init__(self):
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.file, _schema)
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def address(refiner: str, query: str, version) -> str:
+        key = json.dumps([refiner, query, str(version)])
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def ttl_for(self, refiner: str, found: bool = True) -> timedelta:
+        if not found and self.not_found_ttl is not None:
+            return min(self.not_found_ttl, self.ttl_for(refiner))
+        return self.ttl.get(refiner, self.default_ttl)
+
+    def get(self, refiner: str, query: str, version=None) -> Paper | None:
+        """Return the stored result of the refiner for the query.
+
+        Returns None if the refiner found nothing, and MISSING if there is no
+        result in the store or if it expired.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT timestamp, paper FROM results WHERE address = ?",
+                (self.address(refiner, query, version),),
+            ).fetchone()
+        if row is None:
+            return MISSING
+        timestamp, data = row
+        ttl = self.ttl_for(refiner, found=data is not None)
+        if time.time() - timestamp > ttl.total_seconds():
+            return MISSING
+        return None if data is None else deserialize(Paper, json.loads(data))
+
+    def put(self, refiner: str, query: str, version, paper: Paper | None):
+        """Record the result of the refiner for the query."""
+        data = None if paper is None else json.dumps(serialize(Paper, paper))
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results"
+                " (address, refiner, query, version, timestamp, paper)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self.address(refiner, query, version),
+                    refiner,
+                    query,
+                    str(version),
+                    time.time(),
+                    data,
+                ),
+            )
+
+    def purge(self) -> int:
+        """Remove the expired results and return how many were removed."""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            refiners = [
+                r for (r,) in self.conn.execute("SELECT DISTINCT refiner FROM results")
+            ]
+            for refiner in refiners:
+                for found in (True, False):
+                    ttl = self.ttl_for(refiner, found=found)
+                    removed += self.conn.execute(
+                        "DELETE FROM results WHERE refiner = ? AND timestamp < ?"
+                        f" AND paper IS {'NOT ' if found else ''}NULL",
+                        (refiner, now - ttl.total_seconds()),
+                    ).rowcount
+        return removed
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
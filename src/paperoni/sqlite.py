@@ -0,0 +1,37 @@
+import sqlite3
+from pathlib import Path
+
+
+def connect(file: Path, schema: str, timeout: float = 30) -> sqlite3.Connection:
+    """Open the SQLite database in file, creating it with schema if needed.
+
+    The database uses write-ahead logging, so that readers do not block the
+    writer. Transactions are started explicitly, with Transaction. The
+    connection can be used from other threads, but not by two at once.
+    """
+    file.parent.mkdir(exist_ok=True, parents=True)
+    conn = sqlite3.connect(
+        file, timeout=timeout, isolation_level=None, check_same_thread=False
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(schema)
+    return conn
+
+
+class Transaction:
+    """Write transaction, committed on exit or rolled back on an exception.
+
+    BEGIN IMMEDIATE takes the write lock right away, so that a transaction
+    that reads and then writes does not fail halfway.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, typ, value, tb):
+        self.conn.execute("ROLLBACK" if typ else "COMMIT")
@@ -1,8 +1,11 @@
+import asyncio
+import functools
 import inspect
 import itertools
 import logging
 import re
 import unicodedata
+from collections import deque
 from types import FrameType, TracebackType
 
 from outsight import send
@@ -183,6 +186,13 @@ def mostly_latin(s: str, threshold: float = 0.9) -> bool:
     return good / total >= threshold
 
 
+# The normalization functions are called over and over on the same names,
+# titles and venues when searching, indexing, scoring and merging, so their
+# results are memoized. lru_cache is thread-safe and counts hits and misses.
+normalization_cache = functools.lru_cache(maxsize=100_000)
+
+
+@normalization_cache
 def plainify(name):
     name = unidecode(name).lower()
     name = re.sub(string=name, pattern="[()-]", repl=" ")
@@ -190,19 +200,55 @@ def plainify(name):
     return name
 
 
-def associate(l1, l2, key, threshold=0):
+def associate(l1, l2, key, threshold=0, exact=None, blocks=None, quadratic_limit=10_000):
+    """Pair each element of l1 with the most similar element of l2, if any.
+
+    Pairs are made greedily by decreasing key(x1, x2), ignoring those at or
+    below the threshold. Returns a list of (x1, x2 or None) for all x1 in l1.
+
+    Comparing all pairs is quadratic, so if the lists have more than
+    quadratic_limit pairs and blocks is given, the candidates are narrowed down:
+    elements with the same exact(x) are paired right away, and the others are
+    only compared to the element at the same position and to those that share
+    one of their blocks(x) keys.
+    """
     el1 = list(enumerate(l1))
     el2 = list(enumerate(l2))
+    mapping = {}
+    # Avoid matching the same element twice
+    matched = set()
+    if blocks is None or len(l1) * len(l2) <= quadratic_limit:
+        candidates = itertools.product(el1, el2)
+    else:
+        if exact is not None:
+            by_exact = {}
+            for i2, x2 in reversed(el2):
+                by_exact.setdefault(exact(x2), []).append(i2)
+            for i1, x1 in el1:
+                if (k := exact(x1)) and (same := by_exact.get(k)):
+                    i2 = same.pop()
+                    mapping[i1] = l2[i2]
+                    matched.add(i2)
+        by_block = {}
+        for i2, x2 in el2:
+            if i2 not in matched:
+                for k in blocks(x2):
+                    by_block.setdefault(k, []).append(i2)
+        pairs = set()
+        for i1, x1 in el1:
+            if i1 not in mapping:
+                if i1 < len(l2) and i1 not in matched:
+                    pairs.add((i1, i1))
+                for k in blocks(x1):
+                    pairs.update((i1, i2) for i2 in by_block.get(k, ()))
+        candidates = ((el1[i1], el2[i2]) for i1, i2 in sorted(pairs))
     sims = [
         (value, i1, i2)
-        for (i1, x1), (i2, x2) in itertools.product(el1, el2)
+        for (i1, x1), (i2, x2) in candidates
         if (value := key(x1, x2)) > threshold
     ]
     sims.sort(key=lambda tup: -tup[0])
-    mapping = {}
     n = len(l1)
-    # Avoid matching the same element twice
-    matched = set()
     for _, i1, i2 in sims:
         if i1 not in mapping and i2 not in matched:
             mapping[i1] = l2[i2]
@@ -212,30 +258,119 @@ def associate(l1, l2, key, threshold=0):
     return [(x1, mapping.get(i1, None)) for i1, x1 in el1]
 
 
+@normalization_cache
 def normalize_institution(institution: str) -> str:
     return unidecode(institution).lower()
 
 
+@normalization_cache
 def normalize_name(name: str) -> str:
     return unidecode(name).lower()
 
 
+@normalization_cache
 def normalize_title(title: str) -> str:
     return plainify(title).replace(" ", "")
 
 
+@normalization_cache
 def normalize_venue(venue: str) -> str:
     return unidecode(venue).lower()
 
 
+@normalization_cache
 def normalize_topic(topic: str) -> str:
     return unidecode(topic).lower()
 
 
+def normalization_cache_info():
+    """Return the cache statistics (hits, misses, size) of each normalization
+    function."""
+    return {
+        fn.__name__: fn.cache_info()
+        for fn in (
+            plainify,
+            normalize_institution,
+            normalize_name,
+            normalize_title,
+            normalize_venue,
+            normalize_topic,
+        )
+    }
+
+
 def split_institution(name: str) -> list[str]:
     return re.split(r" *(?:[,;/-]|\band\b) *", name)
 
 
+class AhoCorasick:
+    """Find all the occurrences of many patterns in a text in a single pass.
+
+    The patterns are mapped to values, which are returned along with the
+    positions of the matches.
+    """
+
+    def __init__(self, patterns: dict[str, object]):
+        # Trie of the patterns: transitions, failure links and, for each node,
+        # the (length, value) of the patterns that end there
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern, value in patterns.items():
+            if not pattern:
+                continue
+            node = 0
+            for c in pattern:
+                if (nxt := self._goto[node].get(c)) is None:
+                    nxt = self._goto[node][c] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((len(pattern), value))
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and c not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = f = self._goto[f].get(c, 0)
+                # Nodes are visited by depth, so the output of f is complete
+                self._out[child] = self._out[child] + self._out[f]
+
+    def find(self, text: str):
+        """Yield (start, end, value) for every occurrence of a pattern."""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, c in enumerate(text):
+            while node and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            for length, value in out[node]:
+                yield (i + 1 - length, i + 1, value)
+
+    def find_words(self, text: str) -> list[tuple[int, int, object]]:
+        """Return the occurrences of patterns as whole words in the text.
+
+        Overlapping occurrences are resolved by keeping the leftmost, then
+        the longest one.
+        """
+        results = []
+        last = 0
+        for start, end, value in sorted(self.find(text), key=lambda m: (m[0], -m[1])):
+            if (
+                start >= last
+                and (start == 0 or not text[start - 1].isalnum())
+                and (end == len(text) or not text[end].isalnum())
+            ):
+                results.append((start, end, value))
+                last = end
+        return results
+
+
 def quick_author_similarity(names1, names2):
     lasts1 = {normalize_name(n.split()[-1]) for n in names1 if n}
     lasts2 = {normalize_name(n.split()[-1]) for n in names2 if n}
@@ -296,9 +431,14 @@ class soft_fail:
         pass
 
     def __exit__(self, exc_type, exc_value, traceback):
-        # Don't suppress KeyboardInterrupt, GeneratorExit or SystemExit - these
-        # must propagate
-        if exc_type in (KeyboardInterrupt, GeneratorExit, SystemExit):
+        # Don't suppress KeyboardInterrupt, GeneratorExit, SystemExit or
+        # CancelledError - these must propagate
+        if exc_type in (
+            KeyboardInterrupt,
+            GeneratorExit,
+            SystemExit,
+            asyncio.CancelledError,
+        ):
             return None
         if exc_type is not None:
             dt = dyntrace(traceback)
@@ -237,6 +237,35 @@ async function fetchOperateResults(operation, searchParams, offset = 0, mode = '
     return await response.json();
 }
 
+async function waitForJob(jobId, onProgress) {
+    while (true) {
+        const response = await fetch(`/api/v1/operate/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error(`${response.status} ${response.statusText}`);
+        }
+        const job = await response.json();
+        if (job.status === 'failed') {
+            const err = new Error(job.error);
+            err.detail = job.error;
+            throw err;
+        }
+        onProgress(job);
+        if (job.status === 'done') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+function displayJobProgress(job, verb) {
+    setResults(html`
+        <div class="operate-apply-success">
+            ${verb}: ${job.processed} / ${job.total} papers processed...
+        </div>
+    `);
+    updateCountsInFooter(job.matched, job.unmatched, job.total);
+}
+
 function createOperateItem(paperDiff) {
     const current = paperDiff.current;
     const paperNew = paperDiff.new;
@@ -572,12 +601,15 @@ export async function operatePapers() {
             displayLoading();
             applyBtn.disabled = true;
             try {
-                const data = await fetchOperateResults(
+                const { job: jobId } = await fetchOperateResults(
                     operation,
                     getSearchParams(),
                     0,
                     'apply',
                 );
+                const data = await waitForJob(
+                    jobId, job => displayJobProgress(job, 'Applying'),
+                );
                 setResults(html`
                     <div class="operate-apply-success">
                         Applied: ${data.matched} papers updated.
@@ -609,12 +641,15 @@ export async function operatePapers() {
             displayLoading();
             suggestBtn.disabled = true;
             try {
-                const data = await fetchOperateResults(
+                const { job: jobId } = await fetchOperateResults(
                     operation,
                     getSearchParams(),
                     0,
                     'suggest',
                 );
+                const data = await waitForJob(
+                    jobId, job => displayJobProgress(job, 'Suggesting'),
+                );
                 setResults(html`
                     <div class="operate-apply-success">
                         Suggested: ${data.matched} papers queued for review.
@@ -1,5 +1,6 @@
 import importlib.metadata
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from easy_oauth import OAuthManager
@@ -13,6 +14,7 @@ from starlette.middleware.base import BaseHTTPMiddleware
 import paperoni
 
 from ..config import config
+from ..get import clients
 from .openapi_schemas import apply_serieux_schemas
 
 app_logger = logging.getLogger(__name__)
@@ -60,8 +62,15 @@ use a different Paperoni instance.
 """
 
 
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await clients.aclose()
+
+
 def create_app():
     app = FastAPI(
+        lifespan=lifespan,
         title="Paperoni API",
         description=_DESCRIPTION,
         version=importlib.metadata.version(paperoni.__name__),
@@ -4,9 +4,12 @@ FastAPI routes for the operate functionality (UI and API).
 Only installed when config.server.enable_operate is True.
 """
 
+import asyncio
 import traceback
 from dataclasses import dataclass
+from datetime import datetime
 from typing import Literal
+from uuid import uuid4
 
 from fastapi import Depends, FastAPI, HTTPException, Request
 
@@ -22,6 +25,27 @@ from .restapi import DiffResponse, PaperDiff, SearchRequest
 class OperateResponse(DiffResponse):
     matched: int = 0
     unmatched: int = 0
+    # ID of the background job, for apply and suggest
+    job: str = None
+
+
+@dataclass
+class OperateJob:
+    """Progress of an operation applied in the background."""
+
+    id: str
+    mode: Literal["apply", "suggest"]
+    status: Literal["running", "done", "failed"] = "running"
+    # Number of papers matching the search when the job started
+    total: int = 0
+    # Number of papers the operation was run on so far
+    processed: int = 0
+    matched: int = 0
+    unmatched: int = 0
+    started: datetime = None
+    finished: datetime = None
+    # Traceback, if the job failed
+    error: str = None
 
 
 @dataclass(kw_only=True)
@@ -41,6 +65,23 @@ def install_operate(app: FastAPI) -> FastAPI:
     hascap = app.auth.get_email_capability
     prefix = "/api/v1"
 
+    jobs: dict[str, OperateJob] = {}
+    # Keep references to the running tasks so that they are not garbage collected
+    tasks = set()
+
+    def _prune_jobs():
+        # Forget the jobs that finished too long ago, and the oldest finished
+        # jobs beyond the maximum
+        now = datetime.now()
+        finished = sorted(
+            (job for job in jobs.values() if job.finished is not None),
+            key=lambda job: job.finished,
+        )
+        excess = len(finished) - config.server.operate_jobs_max
+        for i, job in enumerate(finished):
+            if i < excess or now - job.finished > config.server.operate_jobs_ttl:
+                del jobs[job.id]
+
     @app.get("/operate", include_in_schema=False)
     async def operate_page(
         request: Request,
@@ -62,6 +103,68 @@ def install_operate(app: FastAPI) -> FastAPI:
             )
         return results
 
+    async def _commit(mode, diffs, coll):
+        if mode == "apply":
+            edits = [
+                d.new
+                for d in diffs
+                if d.matched and d.new and "mark:delete" not in d.new.flags
+            ]
+            deletions = [
+                d.current.id
+                for d in diffs
+                if d.matched and d.new and "mark:delete" in d.new.flags
+            ]
+            await coll.collection.add_papers(edits, force=True, ignore_exclusions=True)
+            await coll.collection.delete_ids(deletions)
+        else:
+            edits = [d.new for d in diffs if d.matched]
+            await config.suggestions.add_papers(edits, force=True, ignore_exclusions=True)
+
+    async def _run_job(job: OperateJob, operation_obj, request: OperateRequest, coll):
+        # Papers are streamed from the search and committed in chunks, so memory
+        # use is bounded by the chunk size. An edit may move a paper further
+        # along the search order, so skip the papers that were already seen.
+        seen = set()
+        chunk = []
+
+        async def flush():
+            diffs = await _run_operate(operation_obj, chunk)
+            await _commit(job.mode, diffs, coll)
+            job.processed += len(diffs)
+            job.matched += sum(d.matched for d in diffs)
+            job.unmatched += sum(not d.matched for d in diffs)
+            chunk.clear()
+
+        try:
+            async for p in coll.collection.search(**request.search_options()):
+                if p.id in seen:
+                    continue
+                seen.add(p.id)
+                chunk.append(p)
+                if len(chunk) >= config.server.operate_chunk_size:
+                    await flush()
+            await flush()
+            job.status = "done"
+        except Exception:
+            job.status = "failed"
+            job.error = traceback.format_exc()
+        finally:
+            job.finished = datetime.now()
+
+    @app.get(
+        f"{prefix}/operate/jobs/{{job_id}}",
+        response_model=OperateJob,
+        dependencies=[Depends(hascap("admin"))],
+        tags=["Advanced"],
+    )
+    async def operate_job(job_id: str):
+        """Get the progress of an apply or suggest operation."""
+        _prune_jobs()
+        if job_id not in jobs:
+            raise HTTPException(status_code=404, detail=f"No such job: {job_id}")
+        return jobs[job_id]
+
     @app.post(
         f"{prefix}/operate",
         response_model=OperateResponse,
@@ -88,42 +191,51 @@ def install_operate(app: FastAPI) -> FastAPI:
                     unmatched = sum(not r.matched for r in results)
 
                 case "simulate":
-                    limit = request.limit
-                    offset = request.offset
-                    request.limit = request.offset = 0
-                    all_matches = await request.run(coll)
-                    results = await _run_operate(operation_obj, all_matches)
-                    matched = sum(r.matched for r in results)
-                    unmatched = sum(not r.matched for r in results)
-                    results = results[offset : offset + limit]
+                    # Preview the operation on a sample of the matching papers,
+                    # starting at the offset, until a page of them is matched
+                    examined = 0
+                    async for p in coll.collection.search(
+                        **request.search_options(), offset=request.offset
+                    ):
+                        [diff] = await _run_operate(operation_obj, [p])
+                        examined += 1
+                        if diff.matched:
+                            matched += 1
+                            results.append(diff)
+                        else:
+                            unmatched += 1
+                        if (
+                            len(results) >= request.limit
+                            or examined >= config.server.operate_sample_size
+                        ):
+                            break
+                    return OperateResponse(
+                        results=results,
+                        next_offset=request.offset + examined,
+                        total=await request.count(coll),
+                        matched=matched,
+                        unmatched=unmatched,
+                    )
 
                 case "apply" | "suggest":
-                    request.limit = request.offset = 0
-                    all_matches = await request.run(coll)
-                    diffs = await _run_operate(operation_obj, all_matches)
-                    matched = sum(r.matched for r in diffs)
-                    unmatched = sum(not r.matched for r in diffs)
-                    if request.mode == "apply":
-                        edits = [
-                            d.new
-                            for d in diffs
-                            if d.matched and d.new and "mark:delete" not in d.new.flags
-                        ]
-                        deletions = [
-                            d.current.id
-                            for d in diffs
-                            if d.matched and d.new and "mark:delete" in d.new.flags
-                        ]
-                        await coll.collection.add_papers(
-                            edits, force=True, ignore_exclusions=True
-                        )
-                        await coll.collection.delete_ids(deletions)
-                    else:
-                        edits = [d.new for d in diffs if d.matched]
-                        await config.suggestions.add_papers(
-                            edits, force=True, ignore_exclusions=True
-                        )
-                    results = []
+                    job = OperateJob(
+                        id=str(uuid4()),
+                        mode=request.mode,
+                        total=await request.count(coll),
+                        started=datetime.now(),
+                    )
+                    _prune_jobs()
+                    jobs[job.id] = job
+                    task = asyncio.create_task(
+                        _run_job(job, operation_obj, request, coll)
+                    )
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    return OperateResponse(
+                        results=[],
+                        total=job.total,
+                        job=job.id,
+                    )
 
             return OperateResponse(
                 results=results,
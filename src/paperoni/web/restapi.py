@@ -13,6 +13,7 @@ from fastapi.responses import StreamingResponse
 from serieux import CommentRec, auto_singleton, deserialize, serialize
 
 from ..__main__ import Coll, Focus, Formatter, Fulltext, Work, expand_paper_links
+from ..collection.abc import ChangeEvent, ChangeFeedExpired
 from ..config import config
 from ..fulltext.locate import URL
 from ..fulltext.pdf import PDF
@@ -423,6 +424,16 @@ class RemoveExclusionsResponse:
     count: int
 
 
+@dataclass
+class ChangesResponse:
+    """Response model for the change feed."""
+
+    # Changes in order; pass the last one's seq as `since` in the next request
+    results: list[ChangeEvent]
+    # Sequence number of the latest change in the collection
+    last_seq: int
+
+
 def install_api(app) -> FastAPI:
     prefix = "/api/v1"
 
@@ -902,6 +913,35 @@ def install_api(app) -> FastAPI:
             count=removed,
         )
 
+    @app.get(
+        f"{prefix}/changes",
+        response_model=ChangesResponse,
+        dependencies=[Depends(hascap("search"))],
+        tags=["Advanced"],
+    )
+    async def list_changes(since: int = 0, timeout: float = 0, limit: int = 1000):
+        """Long-poll the collection's change feed.
+
+        Returns up to `limit` changes made after sequence number `since`,
+        waiting up to `timeout` seconds (at most 60) for one to happen. With
+        `limit=0`, only `last_seq` is returned. Responds with 410 if the
+        requested changes are no longer retained, in which case the client
+        must reload the whole collection.
+        """
+        coll = Coll(command=None)
+        results = []
+        if limit > 0:
+            try:
+                async for event in coll.collection.changes(
+                    since=since, timeout=min(timeout, 60)
+                ):
+                    results.append(event)
+                    if len(results) >= limit:
+                        break
+            except ChangeFeedExpired as exc:
+                raise HTTPException(status_code=410, detail=str(exc))
+        return ChangesResponse(results=results, last_seq=await coll.collection.last_seq())
+
     # Document requests from their serieux schemas (which carry the field
     # descriptions from the inline comments) instead of the pydantic inference.
     use_query_schema(f"{prefix}/search", "get", SearchRequest)
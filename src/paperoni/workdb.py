@@ -0,0 +1,369 @@
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from serieux import CommentRec, deserialize, serialize
+
+from .model.focus import Scored, Top
+from .model.merge import PaperWorkingSet
+from .sqlite import Transaction, connect
+
+WorkEntry = Scored[CommentRec[PaperWorkingSet, float]]
+
+_schema = """
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS worksets (
+    id INTEGER PRIMARY KEY,
+    key TEXT,
+    score REAL NOT NULL,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expiry REAL
+);
+CREATE INDEX IF NOT EXISTS worksets_score ON worksets (score DESC);
+CREATE INDEX IF NOT EXISTS worksets_key ON worksets (key);
+"""
+
+
+def encode_entry(entry: WorkEntry) -> str:
+    return json.dumps(serialize(WorkEntry, entry), sort_keys=True)
+
+
+def decode_entry(data: str) -> WorkEntry:
+    return deserialize(WorkEntry, json.loads(data))
+
+
+@dataclass
+class WorkRow:
+    # Row id in the database
+    id: int
+    # Incremented on every write, to detect concurrent modifications
+    version: int
+    # Serialized entry, as stored
+    data: str
+    # Deserialized entry
+    entry: WorkEntry
+
+
+@dataclass
+class WorkDB:
+    """Workset stored in a SQLite database, one row per working set.
+
+    The database is opened in WAL mode, so that readers do not block the
+    writer. Each row holds the score and key of its working set, so that the
+    best entries can be queried without deserializing the others, and a
+    version number, so that a write based on a stale read can be detected.
+
+    Processes that refine entries claim them first: a claim leases the best
+    unclaimed rows to an owner for some time, so that several processes can
+    work on different entries at once. A lease that is not released expires,
+    in case its owner died.
+    """
+
+    # Database file
+    file: Path
+    # Seconds to wait for another process to finish writing
+    timeout: float = 30.0
+
+    # Suffixes of work files that are stored as a database
+    suffixes = (".db", ".sqlite", ".sqlite3")
+
+    def __post_init__(self):
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Transactions are started explicitly, see transaction()
+            self._conn = connect(self.file, _schema, timeout=self.timeout)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def transaction(self):
+        """Start a write transaction.
+
+        BEGIN IMMEDIATE takes the write lock right away, so that a transaction
+        that reads before writing cannot fail halfway because another process
+        wrote in between.
+        """
+        return Transaction(self.conn)
+
+    def _get_meta(self, name, default=None):
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE name = ?", (name,)
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def _set_meta(self, name, value):
+        self.conn.execute(
+            "INSERT INTO meta (name, value) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (name, json.dumps(value)),
+        )
+
+    @property
+    def configured(self) -> bool:
+        return self.file.exists() and self._get_meta("n") is not None
+
+    @property
+    def n(self) -> int:
+        return self._get_meta("n")
+
+    @property
+    def drop_zero(self) -> bool:
+        return self._get_meta("drop_zero", True)
+
+    def configure(self, n: int, drop_zero: bool = True, clear: bool = False):
+        with self.transaction():
+            self._set_meta("n", n)
+            self._set_meta("drop_zero", drop_zero)
+            if clear:
+                self.conn.execute("DELETE FROM worksets")
+            else:
+                self._trim(n)
+
+    def _trim(self, n: int):
+        self.conn.execute(
+            "DELETE FROM worksets WHERE id IN"
+            " (SELECT id FROM worksets ORDER BY score DESC, id LIMIT -1 OFFSET ?)",
+            (n,),
+        )
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM worksets").fetchone()[0]
+
+    def _rows(self, query: str, params=()) -> list[WorkRow]:
+        return [
+            WorkRow(id=i, version=v, data=d, entry=decode_entry(d))
+            for i, v, d in self.conn.execute(query, params)
+        ]
+
+    def top(self, n: int = None, offset: int = 0) -> list[WorkRow]:
+        """Return the rows with the highest scores, best first."""
+        return self._rows(
+            "SELECT id, version, data FROM worksets"
+            " ORDER BY score DESC, id LIMIT ? OFFSET ?",
+            (-1 if n is None else n, offset),
+        )
+
+    def get(self, id: int) -> WorkRow | None:
+        rows = self._rows("SELECT id, version, data FROM worksets WHERE id = ?", (id,))
+        return rows[0] if rows else None
+
+    def find_key(self, key: str) -> list[WorkRow]:
+        return self._rows("SELECT id, version, data FROM worksets WHERE key = ?", (key,))
+
+    def _is_zero(self, entry: WorkEntry):
+        return self.drop_zero and Top._is_zero(entry)
+
+    def insert(self, entry: WorkEntry) -> int | None:
+        """Insert an entry, if its score is high enough to be in the top n.
+
+        Returns the id of the new row, or None if the entry was not inserted.
+        """
+        if self._is_zero(entry):
+            return None
+        with self.transaction():
+            return self._insert(entry, encode_entry(entry))
+
+    def _insert(self, entry: WorkEntry, data: str) -> int | None:
+        n = self.n
+        if n is not None and len(self) >= n:
+            (lowest,) = self.conn.execute("SELECT MIN(score) FROM worksets").fetchone()
+            if lowest is not None and entry.score <= lowest:
+                return None
+        cursor = self.conn.execute(
+            "INSERT INTO worksets (key, score, data) VALUES (?, ?, ?)",
+            (entry.value.current.key, entry.score, data),
+        )
+        if n is not None:
+            self._trim(n)
+        return cursor.lastrowid
+
+    def update(self, id: int, entry: WorkEntry, version: int = None) -> bool:
+        """Write the new state of a row.
+
+        If version is given, the row is only written if it was not modified
+        since that version. Returns whether the row was written. An entry
+        whose score dropped to zero is deleted.
+        """
+        with self.transaction():
+            return self._update(id, entry, encode_entry(entry), version)
+
+    def _update(self, id: int, entry: WorkEntry, data: str, version: int = None):
+        if self._is_zero(entry):
+            query = "DELETE FROM worksets WHERE id = ?"
+            params = (id,)
+        else:
+            query = (
+                "UPDATE worksets SET key = ?, score = ?, data = ?, version = version + 1"
+                " WHERE id = ?"
+            )
+            params = (entry.value.current.key, entry.score, data, id)
+        if version is not None:
+            query += " AND version = ?"
+            params += (version,)
+        return self.conn.execute(query, params).rowcount > 0
+
+    def _delete(self, id: int, version: int, owner: str = None) -> bool:
+        # Only delete the row if it was not modified since version, and if it is
+        # not leased to another owner, who would otherwise lose their work
+        return (
+            self.conn.execute(
+                "DELETE FROM worksets WHERE id = ? AND version = ?"
+                " AND (lease_owner IS NULL OR lease_owner = ? OR lease_expiry < ?)",
+                (id, version, owner, time.time()),
+            ).rowcount
+            > 0
+        )
+
+    def remove(self, ids: list[int]):
+        with self.transaction():
+            self.conn.executemany(
+                "DELETE FROM worksets WHERE id = ?", [(i,) for i in ids]
+            )
+
+    def claim(self, n: int, owner: str, lease: float) -> list[WorkRow]:
+        """Lease the n best rows that are not leased to someone else.
+
+        The rows are leased to owner for lease seconds, or until release() is
+        called. Rows whose lease expired can be claimed again.
+        """
+        now = time.time()
+        with self.transaction():
+            ids = [
+                i
+                for (i,) in self.conn.execute(
+                    "SELECT id FROM worksets"
+                    " WHERE lease_owner IS NULL OR lease_owner = ? OR lease_expiry < ?"
+                    " ORDER BY score DESC, id LIMIT ?",
+                    (owner, now, n),
+                )
+            ]
+            self.conn.executemany(
+                "UPDATE worksets SET lease_owner = ?, lease_expiry = ? WHERE id = ?",
+                [(owner, now + lease, i) for i in ids],
+            )
+        rows = {row.id: row for row in self._rows_by_id(ids)}
+        return [rows[i] for i in ids if i in rows]
+
+    def _rows_by_id(self, ids: list[int]) -> list[WorkRow]:
+        marks = ", ".join("?" * len(ids))
+        return self._rows(
+            f"SELECT id, version, data FROM worksets WHERE id IN ({marks})", ids
+        )
+
+    def release(self, ids: list[int], owner: str):
+        """Release the leases owner holds on the rows."""
+        with self.transaction():
+            self._release(ids, owner)
+
+    def _release(self, ids: list[int], owner: str):
+        self.conn.executemany(
+            "UPDATE worksets SET lease_owner = NULL, lease_expiry = NULL"
+            " WHERE id = ? AND lease_owner = ?",
+            [(i, owner) for i in ids],
+        )
+
+    def leased(self) -> dict[int, str]:
+        """Return the owner of each row under an unexpired lease."""
+        return dict(
+            self.conn.execute(
+                "SELECT id, lease_owner FROM worksets"
+                " WHERE lease_owner IS NOT NULL AND lease_expiry >= ?",
+                (time.time(),),
+            )
+        )
+
+
+class WorkDBTop(Top):
+    """Top list over rows of a WorkDB.
+
+    The commands that work on a Top can be used unchanged: the rows are
+    loaded as entries, and save() writes back only the rows whose entry
+    changed, inserts the new entries and deletes those that were removed.
+
+    A row that was modified by another process since it was loaded is not
+    overwritten. The papers collected here are added to the stored working
+    set instead, which is then rescored. Likewise, a removed entry is not
+    deleted if its row was modified or is leased by another process since
+    it was loaded; the ids of these rows are listed in conflicts.
+    """
+
+    def __init__(
+        self,
+        db: WorkDB,
+        rows: list[WorkRow] = None,
+        owner: str = None,
+        rescore: Callable = None,
+    ):
+        self.db = db
+        # Leases held on the rows, released on save
+        self.owner = owner
+        # Function to compute the score of a working set after a merge
+        self.rescore = rescore
+        # Ids of the rows that the last save() could not delete
+        self.conflicts = []
+        rows = db.top() if rows is None else rows
+        self._rows = {id(row.entry): row for row in rows}
+        super().__init__(
+            n=db.n, entries=[row.entry for row in rows], drop_zero=db.drop_zero
+        )
+
+    def save(self, release: bool = True):
+        current = {id(e) for e in self.entries}
+        rows = {}
+        self.conflicts = []
+        with self.db.transaction():
+            for key, row in self._rows.items():
+                if key not in current and not self.db._delete(
+                    row.id, row.version, self.owner
+                ):
+                    self.conflicts.append(row.id)
+            for entry in self.entries:
+                data = encode_entry(entry)
+                row = self._rows.get(id(entry))
+                if row is None:
+                    if (i := self.db._insert(entry, data)) is not None:
+                        row = WorkRow(id=i, version=0, data=data, entry=entry)
+                elif data == row.data:
+                    pass
+                elif self.db._update(row.id, entry, data, row.version):
+                    row = WorkRow(row.id, row.version + 1, data, entry)
+                else:
+                    row = self._merge_into(row, entry)
+                if row is not None:
+                    rows[id(entry)] = row
+            if release and self.owner is not None:
+                self.db._release([row.id for row in self._rows.values()], self.owner)
+        self._rows = rows
+
+    def _merge_into(self, row: WorkRow, entry: WorkEntry) -> WorkRow | None:
+        # Someone else wrote the row since we loaded it
+        fresh = self.db.get(row.id)
+        if fresh is None:
+            # The row was removed, e.g. included in the collection
+            return None
+        ws = fresh.entry.value
+        for paper in entry.value.collected:
+            ws.add(paper)
+        score = self.rescore(ws) if self.rescore else max(entry.score, fresh.entry.score)
+        if ws.current is not None:
+            ws.current.score = score
+        # Adopt the merged state, so that this entry stays in sync with its row
+        entry.score = score
+        entry.value = ws
+        data = encode_entry(entry)
+        self.db._update(fresh.id, entry, data)
+        return WorkRow(fresh.id, fresh.version + 1, data, entry)
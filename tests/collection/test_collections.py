@@ -1,5 +1,7 @@
+import asyncio
 import copy
-from contextlib import contextmanager
+import time
+from contextlib import aclosing, contextmanager
 from dataclasses import replace
 from functools import partial
 from pathlib import Path
@@ -11,9 +13,15 @@ import pytest
 from easy_oauth.testing.utils import AppTester
 from ovld import ovld
 
-from paperoni.collection.abc import PaperCollection, _id_types
+from paperoni.collection.abc import (
+    ChangeFeedExpired,
+    OperateCheckpoint,
+    PaperCollection,
+    _id_types,
+)
 from paperoni.collection.filecoll import FileCollection
 from paperoni.collection.memcoll import MemCollection
+from paperoni.collection.mirrorcoll import MirrorCollection
 from paperoni.collection.mongocoll import MongoCollection
 from paperoni.collection.remotecoll import RemoteCollection
 from paperoni.discovery.jmlr import JMLR
@@ -607,6 +615,39 @@ async def test_file_collection_is_persistent(tmp_path: Path, sample_papers: list
     assert [p async for p in collection.search()] == [p async for p in reloaded.search()]
 
 
+async def test_mongo_search_batched(
+    tmp_path: Path, sample_papers: list[Paper], monkeypatch
+):
+    collection = await make_collection(MongoCollection, tmp_path)
+    await collection.add_papers(sample_papers)
+
+    unbatched = [p async for p in collection.search()]
+    unbatched_page = [p.id async for p in collection.search(limit=5, offset=2)]
+
+    collection.search_batch_size = 3
+    batched = [p async for p in collection.search()]
+    assert eq(sort_title(batched), sample_papers)
+    assert [p.id for p in batched] == [p.id for p in unbatched]
+    assert [p.id async for p in collection.search(limit=5, offset=2)] == unbatched_page
+
+    # Stopping early must not leave a dangling fetch behind
+    cursors = []
+    find = collection._collection.find
+
+    def spy_find(*args, **kwargs):
+        cursors.append(cursor := find(*args, **kwargs))
+        return cursor
+
+    monkeypatch.setattr(collection._collection, "find", spy_find)
+    async with aclosing(collection.search()) as papers:
+        async for _ in papers:
+            break
+    (cursor,) = cursors
+    assert not cursor.alive
+    others = asyncio.all_tasks() - {asyncio.current_task()}
+    assert all(task.done() for task in others)
+
+
 @operation
 def capitalize(paper):
     return replace(paper, title=paper.title.upper())
@@ -624,6 +665,36 @@ async def test_operations(collection: PaperCollection, sample_papers: list[Paper
     assert all(p.title == p.title.upper() for p in results)
 
 
+@pytest.mark.parametrize("jobs", [0, 2])
+async def test_operate_chunked(collection: PaperCollection, jobs: int):
+    await collection.add_papers([Paper(title=f"Paper {i}") for i in range(7)])
+
+    results = await collection.operate_chunked(capitalize, jobs=jobs, chunk_size=3)
+    assert len(results) == 7
+    assert all(
+        p.title.startswith("PAPER") for p in [p async for p in collection.search()]
+    )
+
+
+async def test_operate_chunked_resume(tmp_path: Path):
+    collection = MemCollection()
+    ids = await collection.add_papers([Paper(title=f"Paper {i}") for i in range(4)])
+
+    # Simulate a run that was interrupted after committing the first chunk
+    checkpoint = tmp_path / "checkpoint.json"
+    OperateCheckpoint(chunks=[ids[:2], ids[2:]], done={0}).save(checkpoint)
+
+    results = await collection.operate_chunked(capitalize, checkpoint=checkpoint)
+    assert sorted(results) == sorted(ids[2:])
+    assert [(await collection.find_by_id(i)).title for i in ids] == [
+        "Paper 0",
+        "Paper 1",
+        "PAPER 2",
+        "PAPER 3",
+    ]
+    assert not checkpoint.exists()
+
+
 async def test_prepare(collection: PaperCollection, sample_papers: list[Paper]):
     collection = replace(collection, operations=[capitalize])
 
@@ -631,3 +702,125 @@ async def test_prepare(collection: PaperCollection, sample_papers: list[Paper]):
 
     results = [p async for p in collection.search()]
     assert all(p.title == p.title.upper() for p in results)
+
+
+async def test_changes(collection: PaperCollection):
+    assert await collection.last_seq() == 0
+    assert [e async for e in collection.changes()] == []
+
+    paper = Paper(title="Change Feed", links=[Link(type="doi", link="10.1/feed")])
+    [pid] = await collection.add_papers([paper])
+    paper = await collection.find_by_id(pid)
+    await collection.edit_paper(paper)
+    await collection.add_exclusions(["doi:10.1/other"])
+    await collection.delete_ids([pid])
+
+    events = [e async for e in collection.changes()]
+    assert [(e.op, e.paper_id) for e in events] == [
+        ("add", pid),
+        ("update", pid),
+        ("exclude", "doi:10.1/other"),
+        ("delete", pid),
+    ]
+    assert [e.seq for e in events] == [1, 2, 3, 4]
+    assert events[1].version is not None
+    assert await collection.last_seq() == 4
+
+    since = [e.seq async for e in collection.changes(since=2)]
+    assert since == [3, 4]
+
+    # Exclusions that do not change anything are not recorded
+    await collection.add_exclusions(["doi:10.1/other", "doi:10.1/new"])
+    await collection.remove_exclusions(["doi:10.1/absent"])
+    assert [(e.op, e.paper_id) async for e in collection.changes(since=4)] == [
+        ("exclude", "doi:10.1/new")
+    ]
+
+
+async def test_mongo_changes_gap(tmp_path: Path):
+    collection = await make_collection(MongoCollection, tmp_path)
+    await collection.add_papers([Paper(title="Gap Paper")])
+    await collection._ensure_changes()
+    # Event 2 was allocated by a writer that has not inserted it yet
+    await collection._counters.update_one(
+        {"_id": collection.changes_collection}, {"$inc": {"seq": 2}}
+    )
+    await collection._changes.insert_one(
+        {"_id": 3, "op": "add", "paper_id": None, "version": None, "time": time.time()}
+    )
+    assert [e.seq async for e in collection.changes()] == [1]
+    assert [e.seq async for e in collection.changes(since=1)] == []
+
+    # A hole that stays for too long is skipped
+    collection.changes_gap_timeout = 0
+    assert [e.seq async for e in collection.changes(since=1)] == [3]
+
+
+async def test_changes_long_poll(collection: PaperCollection):
+    async def add_later():
+        await asyncio.sleep(0.1)
+        await collection.add_papers([Paper(title="Late Paper")])
+
+    task = asyncio.create_task(add_later())
+    events = [e async for e in collection.changes(since=0, timeout=5)]
+    await task
+    assert [e.op for e in events] == ["add"]
+
+    # Times out without changes
+    assert [e async for e in collection.changes(since=1, timeout=0.1)] == []
+
+
+async def test_changes_expired():
+    collection = MemCollection(journal_size=2)
+    await collection.add_papers([Paper(title=f"Paper {i}") for i in range(4)])
+
+    assert [e.seq async for e in collection.changes(since=2)] == [3, 4]
+    with pytest.raises(ChangeFeedExpired):
+        [e async for e in collection.changes(since=1)]
+
+
+async def test_changes_persistent(tmp_path: Path):
+    collection = FileCollection(file=tmp_path / "collection.json")
+    await collection.add_papers([Paper(title="Persisted Paper")])
+
+    reloaded = FileCollection(file=tmp_path / "collection.json")
+    assert await reloaded.last_seq() == 1
+    assert [e.op async for e in reloaded.changes()] == ["add"]
+
+
+async def test_mirror(collection: PaperCollection):
+    papers = [Paper(title=f"Mirrored Paper {i}") for i in range(4)]
+    await collection.add_papers(papers[:2])
+    mirror = MirrorCollection(primary=collection, sync_interval=3600)
+
+    def titles(results):
+        return sorted(p.title for p in results)
+
+    # Initial load
+    assert titles([p async for p in mirror.search()]) == titles(papers[:2])
+
+    # Writes through the mirror are visible right away
+    ids = await mirror.add_papers(papers[2:])
+    assert titles([p async for p in mirror.search()]) == titles(papers)
+    assert (await mirror.find_by_id(ids[0])).title == papers[2].title
+
+    # Writes to the primary are only visible after a sync
+    await collection.delete_ids(ids)
+    await collection.add_exclusions(["doi:10.1/mirror"])
+    assert await mirror.count() == 4
+    await mirror.sync()
+    assert titles([p async for p in mirror.search()]) == titles(papers[:2])
+    assert await mirror.is_excluded("doi:10.1/mirror")
+
+
+async def test_mirror_expired():
+    primary = MemCollection(journal_size=1)
+    mirror = MirrorCollection(primary=primary, sync_interval=0)
+    assert await mirror.count() == 0
+
+    # More changes than the primary retains, so the mirror reloads
+    await primary.add_papers([Paper(title=f"Paper {i}") for i in range(3)])
+    assert await mirror.count() == 3
+
+    await primary.drop()
+    assert await mirror.count() == 0
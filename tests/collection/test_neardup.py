@@ -0,0 +1,78 @@
+import pytest
+
+from paperoni.collection.neardup import NearDuplicateIndex, minhash, title_shingles
+from paperoni.model.classes import Author, Paper, PaperAuthor
+
+
+def _paper(title, authors=("John Smith", "Jane Doe")):
+    return Paper(
+        title=title,
+        authors=[PaperAuthor(display_name=a, author=Author(name=a)) for a in authors],
+    )
+
+
+def test_minhash_estimates_similarity():
+    a = title_shingles("Attention is all you need")
+    b = title_shingles("Atention is all you need")
+    c = title_shingles("Deep residual learning for image recognition")
+
+    sa, sb, sc = (minhash(s, 64) for s in (a, b, c))
+    assert sa == minhash(title_shingles("ATTENTION IS ALL YOU NEED!"), 64)
+    assert sum(x == y for x, y in zip(sa, sb)) > 40
+    assert sum(x == y for x, y in zip(sa, sc)) < 10
+
+
+@pytest.mark.parametrize(
+    "title",
+    [
+        "Atention is all you need",
+        "Attention is all you need!",
+        "Attention: is all you need",
+        "Attention is all you need: a study of transformers",
+    ],
+)
+def test_near_duplicates(title):
+    index = NearDuplicateIndex()
+    original = _paper("Attention is all you need")
+    index.add(original)
+    index.add(_paper("Deep residual learning for image recognition"))
+
+    assert index.find(_paper(title)) == [original]
+
+
+def test_near_duplicates_different_authors():
+    index = NearDuplicateIndex()
+    index.add(_paper("Attention is all you need"))
+
+    assert not index.find(_paper("Attention is all you need", ["Bob Jones", "Xu Yi"]))
+
+
+def test_clusters():
+    index = NearDuplicateIndex()
+    papers = [
+        _paper("Attention is all you need"),
+        _paper("Graph neural networks for molecules"),
+        _paper("Atention is all you need"),
+        _paper("Deep residual learning for image recognition"),
+        _paper("Graph neural networks - for molecules"),
+        _paper("Attention is all you need."),
+    ]
+    index.add_all(papers)
+
+    assert index.clusters() == [
+        [papers[0], papers[2], papers[5]],
+        [papers[1], papers[4]],
+    ]
+
+
+def test_clusters_strict():
+    index = NearDuplicateIndex()
+    # a matches b and b matches c, but a does not match c
+    a = _paper("Attention is all you need", ["John Smith", "Jane Doe"])
+    b = _paper("Attention is all you need", ["Jane Doe", "Bob Brown"])
+    c = _paper("Attention is all you need", ["Bob Brown", "Al White"])
+    d = _paper("Attention is all you need", ["Al White", "Bob Brown"])
+    index.add_all([a, b, c, d])
+
+    assert index.clusters() == [[a, b, c, d]]
+    assert index.clusters(strict=True) == [[a, b], [c, d]]
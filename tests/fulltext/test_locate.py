@@ -0,0 +1,127 @@
+import asyncio
+import time
+from contextlib import aclosing
+from datetime import timedelta
+from pathlib import Path
+from typing import Literal
+
+import gifnoc
+import pytest
+
+from paperoni.fulltext.locate import (
+    URL,
+    find_download_links,
+    locate_all,
+    locate_concurrently,
+)
+from paperoni.fulltext.locatecache import LocatorCache
+
+calls = []
+
+
+@find_download_links.register
+async def cachetest_links(typ: Literal["cachetest"], link: str):
+    calls.append(link)
+    if link.startswith("error"):
+        raise Exception("locator failed")
+    if link.startswith("none"):
+        return
+    yield URL(url=f"https://example.org/{link}.pdf", info="cachetest")
+    if link.startswith("two"):
+        yield URL(url=f"https://example.org/{link}-2.pdf", info="cachetest")
+
+
+@pytest.fixture
+def locator_cache(tmp_path: Path):
+    calls.clear()
+    file = tmp_path / "locate.db"
+    with gifnoc.overlay({"paperoni.fulltext.locator_cache": {"file": str(file)}}):
+        yield LocatorCache(file)
+
+
+async def test_locator_cache(locator_cache):
+    refs = ["cachetest:a", "cachetest:none", "cachetest:error"]
+    found, exceptions = await locate_concurrently(refs)
+    assert [url.url for _, url in found] == ["https://example.org/a.pdf"]
+    assert len(exceptions) == 1
+    assert sorted(calls) == ["a", "error", "none"]
+
+    # Found and not found lookups are cached, but failed lookups are
+    # incomplete, so they are looked up again
+    found2, exceptions2 = await locate_concurrently(refs)
+    assert found2 == found
+    assert len(exceptions2) == 1
+    assert sorted(calls) == ["a", "error", "error", "none"]
+    assert [url async for url in locate_all("cachetest:a")] == [found[0][1]]
+    assert len(calls) == 4
+
+    # A refresh skips the cache
+    await locate_concurrently(["cachetest:a"], refresh=True)
+    assert len(calls) == 5
+
+
+async def test_locate_all_uses_cache(locator_cache):
+    urls = [url async for url in locate_all("cachetest:b")]
+    assert [url async for url in locate_all("cachetest:b")] == urls
+    assert calls == ["b"]
+    assert locator_cache.get("cachetest:b") == urls
+
+
+async def test_locate_all_caches_partial_consumption(locator_cache):
+    async with aclosing(locate_all("cachetest:two")) as urls:
+        async for url in urls:
+            break
+    assert len(locator_cache.get("cachetest:two")) == 2
+
+
+async def test_locate_all_errors(locator_cache):
+    with pytest.raises(Exception, match="locator failed"):
+        [url async for url in locate_all("cachetest:error")]
+    assert locator_cache.get("cachetest:error") is None
+
+
+def test_locator_cache_ttl(tmp_path: Path):
+    cache = LocatorCache(
+        tmp_path / "locate.db",
+        ttl=timedelta(days=1),
+        not_found_ttl=timedelta(hours=1),
+    )
+    url = URL(url="https://example.org/a.pdf", info="test")
+    cache.put("x:found", [url])
+    cache.put("x:none", [])
+    cache.put("x:error", [], errors=["Exception: oops"])
+    assert cache.get("x:found") == [url]
+    assert cache.get("x:none") == []
+    assert cache.get("x:error") is None
+    assert cache.get("x:missing") is None
+
+    cache.conn.execute("UPDATE locations SET timestamp = ?", (time.time() - 7200,))
+    assert cache.get("x:found") == [url]
+    assert cache.get("x:none") is None
+    assert cache.get("x:error") is None
+    assert cache.purge() == 2
+    assert len(cache) == 1
+
+    cache.record(url.url, "x:found", False, "HTTPStatusError: 404")
+    assert cache.outcome(url.url) == (False, "HTTPStatusError: 404")
+    assert cache.outcome("https://example.org/other.pdf") is None
+
+    # Expired entries and outcomes are removed when the cache is opened again
+    cache.conn.execute("UPDATE locations SET timestamp = ?", (time.time() - 2 * 86400,))
+    cache.conn.execute("UPDATE outcomes SET timestamp = ?", (time.time() - 2 * 86400,))
+    cache.close()
+    assert len(cache) == 0
+    assert cache.outcome(url.url) is None
+
+
+async def test_locator_cache_threads(tmp_path: Path):
+    cache = LocatorCache(tmp_path / "locate.db")
+    url = URL(url="https://example.org/a.pdf", info="test")
+
+    async def use(i):
+        await asyncio.to_thread(cache.put, f"x:{i}", [url])
+        await asyncio.to_thread(cache.record, url.url, f"x:{i}", True)
+        return await asyncio.to_thread(cache.get, f"x:{i}")
+
+    assert await asyncio.gather(*[use(i) for i in range(20)]) == [[url]] * 20
+    assert len(cache) == 20
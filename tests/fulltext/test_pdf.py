@@ -1,6 +1,14 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Literal
+
+import gifnoc
 import pytest
 
-from paperoni.fulltext.pdf import CachePolicies, get_pdf
+from paperoni.config import config
+from paperoni.fulltext.locate import URL, find_download_links
+from paperoni.fulltext.pdf import PDF, CachePolicies, get_pdf, rank, source_stats
 
 
 async def test_get_pdf(file_regression):
@@ -33,3 +41,90 @@ async def test_get_best_pdf():
 
     p_use = await get_pdf(refs, CachePolicies.USE)
     assert p_use == p_best
+
+
+class PDFHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    served = []
+
+    def do_GET(self):
+        type(self).served.append(self.path)
+        if self.path.startswith("/dead"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/slow"):
+            time.sleep(1)
+        body = b"%PDF-1.4 " + self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def pdf_server(tmp_path):
+    PDFHandler.served = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PDFHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    overlay = {
+        "paperoni.data_path": str(tmp_path),
+        "paperoni.fetch": {"$class": "RulesFetcher", "simultaneous": {"*": 10}},
+        "paperoni.fulltext": {
+            "preference": {"racetest.best": 2, "racetest.good": 1},
+            "race": 2,
+            "stagger": "200ms",
+        },
+    }
+    with gifnoc.overlay(overlay):
+        yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _locate_from(base, paths):
+    @find_download_links.register
+    async def racetest_links(typ: Literal["racetest"], link: str):
+        for path, info in paths[link]:
+            yield URL(url=f"{base}/{path}", info=f"racetest.{info}")
+
+
+async def test_get_pdf_race(pdf_server):
+    _locate_from(
+        pdf_server,
+        {
+            "a": [("dead.pdf", "best"), ("slow.pdf", "good"), ("fast.pdf", "other")],
+            "b": [("fast2.pdf", "good")],
+        },
+    )
+    start = time.monotonic()
+    p = await get_pdf(["racetest:a", "racetest:b"], CachePolicies.USE_BEST)
+    # dead.pdf fails right away, and slow.pdf is still running after the
+    # stagger delay, so fast2.pdf is started and wins
+    assert p.source.url.endswith("/fast2.pdf")
+    assert p.pdf_path.read_bytes().startswith(b"%PDF-")
+    assert time.monotonic() - start < 1
+    assert PDFHandler.served[:2] == ["/dead.pdf", "/slow.pdf"]
+    assert "/fast.pdf" not in PDFHandler.served
+
+    stats = source_stats()
+    assert stats.counts["racetest.best"] == [0, 1]
+    assert stats.counts["racetest.good"] == [1, 1]
+    assert stats.success_rate("racetest.best") < stats.success_rate("racetest.good")
+
+
+async def test_rank_demotes_failed_links(pdf_server, tmp_path):
+    file = tmp_path / "locate.db"
+    with gifnoc.overlay({"paperoni.fulltext.locator_cache": {"file": str(file)}}):
+        a, b = [
+            PDF(URL(url=f"{pdf_server}/{name}.pdf", info="racetest.good"))
+            for name in "ab"
+        ]
+        assert await rank([a, b]) == [a, b]
+        config.fulltext.locator_cache.record(a.source.url, None, False, "oops")
+        assert await rank([a, b]) == [b, a]
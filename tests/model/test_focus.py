@@ -1,15 +1,17 @@
+import random
 from contextlib import contextmanager
 from dataclasses import replace
 from pathlib import Path
 
 import gifnoc
 from pytest_regressions.data_regression import DataRegressionFixture
-from serieux import CommentRec, deserialize, dump, serialize
+from serieux import CommentRec, deserialize, dump, load, serialize
 
-from paperoni.__main__ import Work
+from paperoni.__main__ import Focus as FocusCommand, Work
+from paperoni.collection.filecoll import FileCollection
 from paperoni.discovery.semantic_scholar import SemanticScholar
 from paperoni.model.classes import Author, Institution, Paper, PaperAuthor
-from paperoni.model.focus import Focus, Focuses, Scored, Top
+from paperoni.model.focus import Focus, Focuses, FocusIndex, Scored, Top
 from paperoni.model.merge import PaperWorkingSet
 from tests.test_work import work
 
@@ -135,6 +137,160 @@ def test_focuses_normalization():
         assert config.focuses.score(author) == 1.0
 
 
+def test_focuses_institution_substring():
+    focuses = Focuses(
+        main=[
+            Focus("institution", "Mila", 10.0),
+            Focus("institution", "Université de Montréal", 1.0),
+        ]
+    )
+
+    def score(*affiliations):
+        author = PaperAuthor(
+            display_name="Alice Smith",
+            author=Author(name="Alice Smith"),
+            affiliations=[Institution(name=aff) for aff in affiliations],
+        )
+        return focuses.score(author)
+
+    assert score("Montreal Institute for Learning Algorithms (MILA)") == 10.0
+    assert score("Mila & DIRO, Université de Montréal, Canada") == 11.0
+    assert score("Mila Mila") == 10.0
+    assert score("Similarity Labs") == 0.0
+    assert score("Université de Montréal", "Mila") == 11.0
+
+
+def test_focuses_score_cache():
+    focuses = Focuses(main=[Focus("author", "Alice Smith", 1.0)])
+    paper = Paper(
+        title="Test Paper",
+        authors=[PaperAuthor(display_name="Alice Smith", author=None)],
+    )
+    assert focuses.score(paper) == 1.0
+    assert len(focuses._paper_scores) == 1
+    assert focuses.score(replace(paper, key="xyz")) == 1.0
+    assert len(focuses._paper_scores) == 1
+
+    paper.authors.append(PaperAuthor(display_name="Bob Jones", author=None))
+    focuses.main.append(Focus("author", "Bob Jones", 0.5))
+    assert focuses.score(paper) == 1.0
+    focuses.compile()
+    assert focuses.score(paper) == 1.5
+
+
+def _paper(title, *authors):
+    return Paper(
+        title=title,
+        authors=[
+            PaperAuthor(
+                display_name=name,
+                author=Author(name=name),
+                affiliations=[Institution(name=aff) for aff in affs],
+            )
+            for name, *affs in authors
+        ],
+    )
+
+
+def test_focuses_diff():
+    before = Focuses(
+        main=[
+            Focus("author", "Alice Smith", 1.0),
+            Focus("author", "Bob Jones", 0.5),
+            Focus("institution", "Mila", 10.0),
+        ]
+    )
+    after = Focuses(
+        main=[
+            Focus("author", "ALICE SMITH", 1.0, drive_discovery=True),
+            Focus("author", "Charlie Brown", 2.0),
+            Focus("institution", "Mila", 5.0),
+        ]
+    )
+    diff = before.diff(after)
+    assert diff.added == [Focus("author", "Charlie Brown", 2.0)]
+    assert diff.removed == [Focus("author", "Bob Jones", 0.5)]
+    assert [new.name for _, new in diff.changed] == ["ALICE SMITH", "Mila"]
+    assert diff.keys() == {
+        ("author", "charlie brown"),
+        ("author", "bob jones"),
+        ("institution", "mila"),
+    }
+    assert not before.diff(before)
+
+
+def test_focus_index_affected():
+    papers = {
+        "1": _paper("A", ("Alice Smith", "MIT")),
+        "2": _paper("B", ("Bob Jones", "Mila, Université de Montréal")),
+        "3": _paper("C", ("Charlie Brown", "Similarity Labs")),
+        "4": _paper("D", ("Dan Li",)),
+    }
+    index = FocusIndex()
+    for key, paper in papers.items():
+        index.add(key, paper)
+
+    before = Focuses(main=[Focus("author", "Alice Smith", 1.0)])
+    after = Focuses(
+        main=[
+            Focus("author", "Alice Smith", 2.0),
+            Focus("institution", "Université de Montréal", 1.0),
+            Focus("institution", "Mila", 1.0),
+        ]
+    )
+    assert index.affected(before.diff(after)) == {"1", "2"}
+    assert index.affected(after.diff(after)) == set()
+
+
+async def test_focus_rescore(tmp_path: Path, monkeypatch):
+    coll = FileCollection(file=tmp_path / "collection.yaml")
+    await coll.add_papers(
+        [
+            _paper("A", ("Alice Smith", "MIT")),
+            _paper("B", ("Bob Jones", "Mila")),
+            _paper("C", ("Charlie Brown",)),
+        ]
+    )
+    previous = tmp_path / "previous.yaml"
+    dump(Focuses, Focuses(main=[Focus("author", "Alice Smith", 1.0)]), dest=previous)
+    focuses = Focuses(
+        main=[Focus("author", "Alice Smith", 1.0), Focus("institution", "Mila", 3.0)]
+    )
+    versions = {p.title: p.version async for p in coll.search()}
+    work_file = tmp_path / "work.yaml"
+    top = Top(10, drop_zero=False)
+    for p in [_paper("D", ("Alice Smith", "Mila")), _paper("E", ("Dan Li", "MIT"))]:
+        top.add(Scored(1.0, PaperWorkingSet.make(replace(p, score=1.0))))
+    dump(Top[Scored[CommentRec[PaperWorkingSet, float]]], top, dest=work_file)
+
+    searches = []
+    search = FileCollection.search
+
+    def spy(self, **kwargs):
+        searches.append(kwargs)
+        return search(self, **kwargs)
+
+    monkeypatch.setattr(FileCollection, "search", spy)
+    with gifnoc.overlay({"paperoni.work_file": str(tmp_path / "work.yaml")}):
+        await FocusCommand(
+            command=FocusCommand.Rescore(previous=previous),
+            focuses=focuses,
+            collection_file=tmp_path / "collection.yaml",
+        ).run()
+    # Only the papers that match the changed focuses are queried
+    assert searches == [{"institution": "mila"}]
+
+    coll = FileCollection(file=tmp_path / "collection.yaml")
+    papers = {p.title: p async for p in coll.search()}
+    assert {t: p.score for t, p in papers.items()} == {"A": 0.0, "B": 3.0, "C": 0.0}
+    # Only the affected paper is written
+    assert papers["A"].version == versions["A"]
+    assert papers["B"].version != versions["B"]
+
+    top = load(Top[Scored[CommentRec[PaperWorkingSet, float]]], work_file)
+    assert {s.value.current.title: s.score for s in top} == {"D": 4.0, "E": 1.0}
+
+
 def test_score_non_ascii_title():
     focuses = Focuses(
         main=[
@@ -343,3 +499,30 @@ def test_serialization():
     deser = deserialize(Top[Scored[str]], expected)
     assert isinstance(deser, Top)
     assert deser == t
+
+
+def test_top_update_discard():
+    rng = random.Random(0)
+    entries = [Scored(rng.random(), i) for i in range(200)]
+    t = Top(50, entries)
+    kept = list(t)
+    for _ in range(500):
+        x = rng.choice(kept)
+        match rng.randrange(3):
+            case 0:
+                x.score = 0 if rng.random() < 0.1 else rng.random()
+                if not t.update(x):
+                    kept.remove(x)
+            case 1:
+                t.discard(x)
+                kept.remove(x)
+            case 2:
+                y = Scored(rng.random(), -1)
+                if t.add(y):
+                    kept.append(y)
+                    kept = sorted(kept, reverse=True)[: t.n]
+        expected = sorted(kept, reverse=True)
+        assert [e.score for e in t] == [e.score for e in expected]
+        assert all(e in t for e in kept)
+        for i, e in enumerate(t.entries):
+            assert i == 0 or not e < t.entries[(i - 1) // 2]
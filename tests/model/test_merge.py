@@ -1,4 +1,6 @@
+import random
 from dataclasses import dataclass
+from datetime import date
 
 import pytest
 from serieux import deserialize, serialize
@@ -7,12 +9,26 @@ from serieux.features.comment import CommentRec
 from paperoni.model import Paper
 from paperoni.model.classes import (
     Author,
+    DatePrecision,
     Institution,
     InstitutionCategory,
     Link,
     PaperAuthor,
+    Release,
+    Topic,
+    Venue,
+    VenueType,
 )
-from paperoni.model.merge import merge, merge_all, qual, similarity
+from paperoni.model.merge import (
+    association_blocks,
+    association_key,
+    generic_merge,
+    merge,
+    merge_all,
+    qual,
+    similarity,
+)
+from paperoni.utils import associate
 
 
 @dataclass
@@ -171,6 +187,47 @@ def test_merge_author_lists_similarity():
     ]
 
 
+def _authors(names):
+    return [PaperAuthor(display_name=n, author=Author(name=n)) for n in names]
+
+
+def test_associate_large_author_lists():
+    names = [f"{first} {last}" for first in ["Alice", "Bob", "Carol"] for last in [
+        "Tremblay", "Gagnon", "Roy", "Cote", "Bouchard", "Gauthier", "Morin",
+        "Lavoie", "Fortin", "Gelinas", "Bengio", "Courville", "Pineau", "Precup",
+        "Larochelle", "Vincent", "Hjelm", "Bacon", "Dinh", "Cho", "Mitliagkas",
+        "Lacoste", "Rish", "Paull", "Oberman", "Rabbany", "Hamilton", "Reddy",
+        "Lajoie", "Charlin", "Liu", "Wolf", "Bellemare", "Dauphin", "Ballas",
+    ]]  # fmt: skip
+    l1 = _authors(names)
+    variants = {
+        "Alice Tremblay": "A. Tremblay",
+        "Bob Roy": "Bob Roi",
+        "Carol Cho": "C Cho",
+    }
+    l2 = _authors([variants.get(n, n) for n in reversed(names)])
+    assert len(l1) * len(l2) > 10_000
+
+    def run(limit):
+        return associate(
+            l1,
+            l2,
+            key=similarity,
+            threshold=0.5,
+            exact=association_key,
+            blocks=association_blocks,
+            quadratic_limit=limit,
+        )
+
+    results = run(10_000)
+    assert results == run(float("inf"))
+    pairs = {a.display_name: b and b.display_name for a, b in results}
+    assert pairs["Alice Tremblay"] == "A. Tremblay"
+    assert pairs["Bob Roy"] == "Bob Roi"
+    assert pairs["Carol Cho"] == "C Cho"
+    assert pairs["Bob Gagnon"] == "Bob Gagnon"
+
+
 def test_merge_institution_lists():
     i1 = Institution(name="MIT")
     i2 = qual(Institution(name="MIT", category=InstitutionCategory.academia), 2)
@@ -296,3 +353,84 @@ def test_merge_authors(other_paper: Paper):
         {author.display_name for author in paper.authors}
         | {author.display_name for author in other_paper.authors}
     )
+
+
+def _random_paper(rng: random.Random):
+    def maybe(value, p=0.3):
+        # Sometimes missing, sometimes with a quality
+        r = rng.random()
+        return (
+            None
+            if r < p
+            else qual(value, rng.choice([-10, -1, 1, 2, 10]))
+            if r > 0.9
+            else value
+        )
+
+    def some(make, n=3):
+        return [maybe(make(), 0) for _ in range(rng.randint(0, n))]
+
+    def name():
+        return rng.choice(["John Smith", "J. Smith", "Jane Doe", "Xu Yi", "Bob Jones"])
+
+    def link():
+        return Link(type=rng.choice(["doi", "arxiv"]), link=rng.choice("abc"))
+
+    def institution():
+        return Institution(
+            name=rng.choice(["Mila", "MIT", "Université de Montréal"]),
+            category=rng.choice(list(InstitutionCategory)),
+            country=maybe("Canada", 0.5),
+        )
+
+    def author():
+        n = name()
+        return PaperAuthor(
+            display_name=n,
+            author=Author(name=n, links=some(link), aliases=some(name, 2)),
+            affiliations=some(institution, 2),
+        )
+
+    def release():
+        return Release(
+            venue=Venue(
+                type=rng.choice([VenueType.conference, VenueType.preprint]),
+                name=rng.choice(["NeurIPS", "arXiv"]),
+                series=maybe("NeurIPS", 0),
+                date=date(rng.choice([2020, 2021]), 1, 1),
+                date_precision=rng.choice(list(DatePrecision)),
+                volume=maybe("1"),
+                links=some(link),
+            ),
+            status=rng.choice(["published", "preprint"]),
+            pages=maybe("1-10"),
+        )
+
+    return Paper(
+        title=maybe(rng.choice(["A paper", "A Paper"]), 0),
+        abstract=maybe("Abstract"),
+        authors=some(author, 4),
+        releases=some(release, 2),
+        topics=some(lambda: Topic(name=rng.choice(["ml", "ai"])), 2),
+        links=some(link),
+        flags=set(rng.sample(["valid", "invalid", "x"], rng.randint(0, 2))),
+        key=rng.choice(["n/a", "a", "b"]),
+        info=rng.choice([{}, {"a": [1]}, {"a": [2], "b": {"c": 3}}]),
+        score=rng.choice([0.0, 1.5]),
+        id=maybe("123"),
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_merge_specialized_matches_generic(seed):
+    rng = random.Random(seed)
+    for _ in range(10):
+        x = _random_paper(rng)
+        y = _random_paper(rng)
+        qx, qy = rng.choice([(0, 0), (1, 0), (0, 1), (-1, 1)])
+        if rng.random() < 0.3:
+            x, y = qual(x, qx), qual(y, qy)
+        expected = generic_merge(x, y)
+        result = merge(x, y)
+        assert result == expected
+        assert serialize(Paper, result) == serialize(Paper, expected)
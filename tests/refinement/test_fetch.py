@@ -1,10 +1,36 @@
+import asyncio
+import time
+from contextlib import aclosing
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Literal
+from urllib.parse import unquote
+
+import httpx
 import pytest
 import requests
 
+from paperoni.get import parse
+from paperoni.model.classes import Paper
+from paperoni.refinement import (
+    aggregators as aggregators_module,
+    doi as doi_module,
+    pubmed as pubmed_module,
+)
+from paperoni.refinement.aggregators import semantic_scholar
 from paperoni.refinement.dblp import dblp
 from paperoni.refinement.doi import crossref, datacite, unpaywall
-from paperoni.refinement.fetch import _test_tags
+from paperoni.refinement.fetch import (
+    _test_tags,
+    fetch_all,
+    register_batch_fetch,
+    register_fetch,
+)
+from paperoni.refinement.pubmed import pubmed
+from paperoni.refinement.schedule import RefineScheduler
 from paperoni.refinement.title import arxiv_title, crossref_title, openalex_title
+from paperoni.refinestore import MISSING, RefineStore
 
 
 @pytest.mark.parametrize(
@@ -145,3 +171,345 @@ async def test_ignored_links(func, link):
     typ, link = link.split(":")
     result = await func(typ, link)
     assert result is None
+
+
+store_calls = []
+
+
+@register_fetch(tags={"storetest"})
+async def storetest(typ: Literal["storetest"], link: str):
+    store_calls.append(link)
+    return None if link == "nothing" else Paper(title=f"Paper {link}", authors=[])
+
+
+async def test_fetch_all_store(tmp_path):
+    store = RefineStore(file=tmp_path / "refine.db")
+    links = [("storetest", "a"), ("storetest", "nothing")]
+
+    async def titles(**kwargs):
+        results = fetch_all(links, tags={"storetest"}, store=store, **kwargs)
+        return sorted([p.title async for p in results])
+
+    store_calls.clear()
+    assert await titles() == ["Paper a"]
+    assert sorted(store_calls) == ["a", "nothing"]
+    # Both the result and the absence of result are reused
+    assert await titles() == ["Paper a"]
+    assert len(store_calls) == 2
+    assert await titles(refresh=True) == ["Paper a"]
+    assert len(store_calls) == 4
+
+
+@register_fetch(tags={"grouptest"})
+async def grouptest(refs: list):
+    if not all(typ == "grouptest" for typ, _ in refs):
+        return None
+    store_calls.append(refs)
+    return Paper(title=" ".join(link for _, link in refs), authors=[])
+
+
+async def test_fetch_all_store_group(tmp_path):
+    store = RefineStore(file=tmp_path / "refine.db")
+
+    async def titles(links):
+        results = fetch_all(links, tags={"grouptest"}, store=store)
+        return [p.title async for p in results]
+
+    store_calls.clear()
+    assert await titles([("grouptest", "a")]) == ["a"]
+    # Another set of links does not get the result stored for the first one
+    assert await titles([("grouptest", "b"), ("grouptest", "c")]) == ["b c"]
+    assert await titles([("grouptest", "c"), ("grouptest", "b")]) == ["b c"]
+    assert len(store_calls) == 2
+
+
+def test_refine_store_ttl(tmp_path):
+    store = RefineStore(
+        file=tmp_path / "refine.db",
+        ttl={"old": timedelta(0)},
+        not_found_ttl=timedelta(0),
+    )
+    paper = Paper(title="A", authors=[])
+    store.put("fresh", "doi:1", 1, paper)
+    store.put("fresh", "doi:2", 1, None)
+    store.put("old", "doi:1", 1, paper)
+
+    assert store.get("fresh", "doi:1", 1) == paper
+    assert store.get("fresh", "doi:1", 2) is MISSING
+    assert store.get("fresh", "doi:3", 1) is MISSING
+    assert store.get("fresh", "doi:2", 1) is MISSING
+    assert store.get("old", "doi:1", 1) is MISSING
+
+    assert store.purge() == 2
+    assert len(store) == 1
+
+    # The absence of a result is reused for a day by default
+    store = RefineStore(file=tmp_path / "refine2.db")
+    store.put("fresh", "doi:2", 1, None)
+    store.conn.execute("UPDATE results SET timestamp = ?", (time.time() - 2 * 86400,))
+    assert store.get("fresh", "doi:2", 1) is MISSING
+
+
+delays = {"fast": 0, "medium": 0.05, "slow": 0.2, "hang": 10}
+finished = []
+
+
+@register_fetch(tags={"delaytest"})
+async def delaytest(typ: Literal["delaytest"], link: str):
+    await asyncio.sleep(delays[link])
+    finished.append(link)
+    return Paper(title=link, authors=[])
+
+
+async def test_fetch_all_yields_as_completed():
+    links = [("delaytest", x) for x in ("slow", "fast", "medium", "hang")]
+    # fetch_all replaces an empty statuses dict with its own
+    statuses = {"x": "pending"}
+    results = fetch_all(links, tags={"delaytest"}, statuses=statuses, timeout=0.5)
+    assert [p.title async for p in results] == ["fast", "medium", "slow"]
+    assert statuses["delaytest/delaytest:hang"] == "timeout"
+
+
+async def test_fetch_all_cancels_stragglers(caplog):
+    links = [("delaytest", x) for x in ("slow", "fast", "medium")]
+    statuses = {"x": "pending"}
+    finished.clear()
+    async with aclosing(fetch_all(links, tags={"delaytest"}, statuses=statuses)) as it:
+        async for p in it:
+            if p.title == "fast":
+                break
+    # The cancelled refiners are finished, and are not reported as failures
+    assert asyncio.all_tasks() == {asyncio.current_task()}
+    assert not caplog.records
+    await asyncio.sleep(0.3)
+    assert finished == ["fast"]
+    # The cancelled refiners can run again later
+    assert set(statuses) == {"x", "delaytest/delaytest:fast"}
+
+
+running = []
+peaks = []
+
+
+@register_fetch(tags={"schedtest"})
+async def schedtest(typ: Literal["schedtest"], link: str):
+    running.append(link)
+    peaks.append(len(running))
+    await asyncio.sleep(0.01)
+    running.remove(link)
+    return Paper(title=link, authors=[])
+
+
+async def test_fetch_all_scheduler_limits():
+    scheduler = RefineScheduler(simultaneous={"schedtest": 2})
+    links = [("schedtest", str(i)) for i in range(6)]
+    peaks.clear()
+    results = fetch_all(links, tags={"schedtest"}, scheduler=scheduler)
+    assert len([p async for p in results]) == 6
+    assert max(peaks) == 2
+    assert scheduler.requests == 6
+
+
+async def test_fetch_all_scheduler_budget():
+    scheduler = RefineScheduler(request_budget=3)
+    statuses = {"x": "pending"}
+    links = [("schedtest", str(i)) for i in range(6)]
+    results = fetch_all(links, tags={"schedtest"}, scheduler=scheduler, statuses=statuses)
+    assert len([p async for p in results]) == 3
+    assert scheduler.exhausted
+    # The refiners that did not run are not marked as done
+    assert len(statuses) == 4
+
+
+async def test_scheduler_map_in_order():
+    scheduler = RefineScheduler(papers=2, request_budget=4)
+    started = []
+
+    async def refine(x):
+        started.append(x)
+        async with scheduler.slot(set()):
+            await asyncio.sleep(0.01 * (5 - x))
+
+    await scheduler.map(refine, range(5))
+    assert started == [0, 1, 2, 3]
+
+
+batches = []
+
+
+@register_batch_fetch(tags={"batchtest"}, size=3, window=0.01)
+async def batchtest(typ: Literal["batchtest"], links: list[str]):
+    batches.append(links)
+    if "error" in links:
+        raise Exception("oops")
+    results = {link: Paper(title=link, authors=[]) for link in links if link != "missing"}
+    if "bad" in links:
+        results["bad"] = ValueError("bad link")
+    return results
+
+
+async def test_batch_fetch():
+    batches.clear()
+    links = [("batchtest", x) for x in ("a", "b", "c", "d", "missing")]
+    results = fetch_all(links, tags={"batchtest"})
+    assert sorted([p.title async for p in results]) == ["a", "b", "c", "d"]
+    assert sorted(map(sorted, batches)) == [["a", "b", "c"], ["d", "missing"]]
+
+    # The registered refiner takes one link at a time
+    assert (await batchtest("batchtest", "x")).title == "x"
+    assert await batchtest("batchtest", "missing") is None
+
+
+async def test_batch_fetch_error():
+    batches.clear()
+    results = await asyncio.gather(
+        batchtest("batchtest", "a"),
+        batchtest("batchtest", "error"),
+        return_exceptions=True,
+    )
+    assert batches == [["a", "error"]]
+    assert all(isinstance(r, Exception) for r in results)
+
+
+async def test_batch_fetch_error_one_link():
+    batches.clear()
+    results = await asyncio.gather(
+        batchtest("batchtest", "a"),
+        batchtest("batchtest", "bad"),
+        return_exceptions=True,
+    )
+    assert batches == [["a", "bad"]]
+    assert results[0].title == "a"
+    assert isinstance(results[1], ValueError)
+
+
+async def test_crossref_rejected_batch(monkeypatch):
+    requests_made = []
+
+    async def read_retry(url, params=None, format=None):
+        requests_made.append((url, params and params["filter"]))
+        if "bad" in url or (params and "bad" in params["filter"]):
+            request = httpx.Request("GET", url)
+            raise httpx.HTTPStatusError(
+                "Bad Request",
+                request=request,
+                response=httpx.Response(400, request=request),
+            )
+        if params:
+            dois = [f.removeprefix("doi:") for f in params["filter"].split(",")]
+            items = [{"DOI": doi} for doi in dois]
+            return {"status": "ok", "message": {"items": items}}
+        return {"status": "ok", "message": {"DOI": unquote(url.split("/works/", 1)[1])}}
+
+    async def paper_from_crossref(data):
+        return Paper(title=data.DOI, authors=[])
+
+    monkeypatch.setattr(
+        doi_module,
+        "config",
+        SimpleNamespace(fetch=SimpleNamespace(read_retry=read_retry)),
+    )
+    monkeypatch.setattr(doi_module, "paper_from_crossref", paper_from_crossref)
+
+    # A DOI with a comma cannot go in the filter and is fetched on its own
+    results = await crossref.batcher.func("doi", ["10.1234/a", "10.1234/b,c"])
+    assert {k: v.title for k, v in results.items()} == {
+        "10.1234/a": "10.1234/a",
+        "10.1234/b,c": "10.1234/b,c",
+    }
+    assert requests_made[0][1] == "doi:10.1234/a"
+
+    # A rejected batch is retried one DOI at a time, and only the rejected DOI
+    # fails
+    requests_made.clear()
+    results = await crossref.batcher.func("doi", ["10.1234/a", "10.1234/bad"])
+    assert results["10.1234/a"].title == "10.1234/a"
+    assert isinstance(results["10.1234/bad"], httpx.HTTPStatusError)
+    assert len(requests_made) == 3
+
+
+async def test_semantic_scholar_rejected_batch(monkeypatch):
+    requests_made = []
+
+    def error(status):
+        request = httpx.Request("GET", "https://api.semanticscholar.org")
+        return httpx.HTTPStatusError(
+            "Error", request=request, response=httpx.Response(status, request=request)
+        )
+
+    class FakeSemanticScholar:
+        async def papers(self, paper_ids):
+            requests_made.append(list(paper_ids))
+            if any("bad" in paper_id for paper_id in paper_ids):
+                raise error(400)
+            return [Paper(title=paper_id, authors=[]) for paper_id in paper_ids]
+
+        async def paper(self, paper_id):
+            requests_made.append(paper_id)
+            if "bad" in paper_id:
+                raise error(400)
+            elif "missing" in paper_id:
+                raise error(404)
+            return Paper(title=paper_id, authors=[])
+
+    monkeypatch.setattr(aggregators_module, "SemanticScholar", FakeSemanticScholar)
+
+    results = await semantic_scholar.batcher.func("semantic_scholar", ["a", "b"])
+    assert {k: v.title for k, v in results.items()} == {"a": "a", "b": "b"}
+    assert requests_made == [["a", "b"]]
+
+    # A rejected batch is retried one ID at a time, and only the rejected ID
+    # fails
+    requests_made.clear()
+    results = await semantic_scholar.batcher.func(
+        "semantic_scholar", ["a", "bad", "missing"]
+    )
+    assert results["a"].title == "a"
+    assert isinstance(results["bad"], httpx.HTTPStatusError)
+    assert results["missing"] is None
+    assert requests_made == [["a", "bad", "missing"], "a", "bad", "missing"]
+
+
+async def test_pubmed_efetch(monkeypatch):
+    content = (Path(__file__).parent / "data" / "pubmed" / "efetch.xml").read_text()
+    requests_made = []
+
+    async def read_retry(url, params=None, format=None):
+        requests_made.append(params)
+        return parse(content, format)
+
+    monkeypatch.setattr(
+        pubmed_module,
+        "config",
+        SimpleNamespace(fetch=SimpleNamespace(read_retry=read_retry)),
+    )
+
+    results = await pubmed.batcher.func("pmc", ["PMC8900797", "11551764", "PMC99999999"])
+    assert requests_made == [
+        {"db": "pmc", "id": "8900797,11551764,99999999", "retmode": "xml"}
+    ]
+    assert set(results) == {"PMC8900797", "11551764"}
+
+    paper = results["PMC8900797"]
+    assert paper.title == "Learning representations of cell populations"
+    assert [a.display_name for a in paper.authors] == ["Marie Tremblay", "Louis Gagnon"]
+    assert [i.name for i in paper.authors[1].affiliations] == [
+        "Mila - Quebec AI Institute",
+        "Université de Montréal",
+    ]
+    assert paper.abstract == (
+        "We learn representations of cell populations.\n\n"
+        "They transfer across experiments."
+    )
+    assert [(lnk.type, lnk.link) for lnk in paper.links] == [("pmc", "PMC8900797")]
+    (release,) = paper.releases
+    assert release.venue.name == "Scientific Reports"
+    assert release.venue.publisher == "Nature Publishing Group UK"
+    assert str(release.venue.date) == "2022-03-07"
+
+    paper = results["11551764"]
+    assert paper.title == "Models of protein folding"
+    assert [i.name for i in paper.authors[0].affiliations] == [
+        "McGill University, Montreal, Canada"
+    ]
+    assert str(paper.releases[0].venue.date) == "2024-11-01"
@@ -0,0 +1,439 @@
+import asyncio
+import gc
+import hashlib
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from paperoni.get import (
+    DownloadLimiter,
+    Fetcher,
+    HTTPXFetcher,
+    IncompleteDownload,
+    RequestsFetcher,
+    RulesFetcher,
+    clients,
+)
+from paperoni.ratelimit import HostUnavailable, RateLimit, retry_delay
+
+
+@dataclass
+class FakeResponse:
+    text: str
+    status_code: int = 200
+    headers: dict = field(default_factory=dict)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"Status {self.status_code}")
+
+
+@dataclass
+class FakeFetcher(Fetcher):
+    delay: float = 0.01
+    calls: list = field(default_factory=list)
+
+    async def generic(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        await asyncio.sleep(self.delay)
+        if "error" in url:
+            return FakeResponse(text="", status_code=500)
+        return FakeResponse(text=f'{{"url": "{url}"}}')
+
+
+async def test_coalesce_identical_reads():
+    fetcher = FakeFetcher()
+    results = await asyncio.gather(
+        fetcher.read("https://a.org", format="json"),
+        fetcher.read("https://a.org", format="json"),
+        fetcher.read("https://a.org", format="txt"),
+        fetcher.read("https://a.org", format="json", params={"x": 1}),
+        fetcher.read("https://b.org", format="json"),
+    )
+    assert results[0] == results[1] == {"url": "https://a.org"}
+    # Each caller gets its own parsed copy
+    assert results[0] is not results[1]
+    assert results[2] == '{"url": "https://a.org"}'
+    assert len(fetcher.calls) == 3
+    assert fetcher.stats == {"requests": 3, "coalesced": 2}
+
+    # Requests that are not concurrent are not coalesced
+    await fetcher.read("https://a.org", format="json")
+    assert len(fetcher.calls) == 4
+
+
+async def test_coalesce_ignores_none_headers():
+    fetcher = FakeFetcher()
+    await asyncio.gather(
+        fetcher.read("https://a.org", format="txt", headers={"x-api-key": None}),
+        fetcher.read("https://a.org", format="txt", headers={}),
+        fetcher.read("https://a.org", format="txt", headers={"x-api-key": "secret"}),
+    )
+    assert len(fetcher.calls) == 2
+
+
+async def test_coalesce_errors_and_cancellation():
+    fetcher = FakeFetcher()
+    results = await asyncio.gather(
+        fetcher.read("https://error.org", format="txt"),
+        fetcher.read("https://error.org", format="txt"),
+        return_exceptions=True,
+    )
+    assert all(isinstance(r, Exception) for r in results)
+    assert len(fetcher.calls) == 1
+
+    # Cancelling the first caller does not cancel the request for the second
+    first = asyncio.create_task(fetcher.read("https://a.org", format="json"))
+    second = asyncio.create_task(fetcher.read("https://a.org", format="json"))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == {"url": "https://a.org"}
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+async def test_head_not_coalesced():
+    fetcher = FakeFetcher()
+    first, second = await asyncio.gather(
+        fetcher.head("https://a.org"), fetcher.head("https://a.org")
+    )
+    # Each caller gets its own response object
+    assert first is not second
+    assert len(fetcher.calls) == 2
+
+
+async def test_coalesce_error_with_no_caller_left():
+    loop = asyncio.get_running_loop()
+    errors = []
+    loop.set_exception_handler(lambda loop, context: errors.append(context))
+    try:
+        fetcher = FakeFetcher()
+        caller = asyncio.create_task(fetcher.read("https://error.org", format="txt"))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.sleep(0.05)
+        del caller
+        gc.collect()
+        assert errors == []
+    finally:
+        loop.set_exception_handler(None)
+
+
+@dataclass
+class ScriptedFetcher(Fetcher):
+    # Responses to give, in order, the last one being repeated
+    responses: list = field(default_factory=list)
+    times: list = field(default_factory=list)
+
+    async def generic(self, method, url, **kwargs):
+        self.times.append(time.monotonic())
+        if len(self.responses) > 1:
+            return self.responses.pop(0)
+        return self.responses[0]
+
+
+def _rules(fetcher, **kwargs):
+    return RulesFetcher(
+        rules={re.compile("."): "scripted"}, fetchers={"scripted": fetcher}, **kwargs
+    )
+
+
+def test_retry_delay():
+    assert retry_delay({}) is None
+    assert retry_delay({"retry-after": "3"}) == 3
+    assert 58 < retry_delay({"retry-after": formatdate(time.time() + 60)}) <= 60
+    assert retry_delay({"x-ratelimit-remaining": "2", "x-ratelimit-reset": "5"}) is None
+    assert retry_delay({"x-ratelimit-remaining": "0", "x-ratelimit-reset": "5"}) == 5
+    reset = str(int(time.time()) + 10)
+    assert 8 < retry_delay({"x-ratelimit-remaining": "0", "x-ratelimit-reset": reset})
+
+
+async def test_rate_limit():
+    fetcher = ScriptedFetcher(responses=[FakeResponse("ok")])
+    rules = _rules(fetcher, rates={"*": RateLimit(rate=50, burst=2)})
+    for _ in range(6):
+        await rules.read("https://a.org", format="txt")
+    # Two requests in a burst, then one every 20ms
+    assert fetcher.times[-1] - fetcher.times[0] >= 0.07
+
+
+async def test_rate_limit_retry_after():
+    fetcher = ScriptedFetcher(
+        responses=[
+            FakeResponse("", status_code=429, headers={"retry-after": "0.2"}),
+            FakeResponse("ok"),
+        ]
+    )
+    rules = _rules(fetcher, rates={"a.org": RateLimit(rate=100, burst=5)})
+    with pytest.raises(Exception, match="429"):
+        await rules.read("https://a.org", format="txt")
+    assert rules._buckets["a.org"].rate == 50
+    await rules.read("https://a.org", format="txt")
+    assert fetcher.times[1] - fetcher.times[0] >= 0.2
+    assert rules._buckets["a.org"].rate > 50
+
+
+async def test_circuit_breaker():
+    fetcher = ScriptedFetcher(responses=[FakeResponse("", status_code=500)])
+    rules = _rules(fetcher, breaker_threshold=2, breaker_cooldown=timedelta(seconds=0.1))
+    for _ in range(2):
+        with pytest.raises(Exception, match="500"):
+            await rules.read("https://a.org", format="txt")
+    with pytest.raises(HostUnavailable):
+        await rules.read("https://a.org", format="txt")
+    assert len(fetcher.times) == 2
+
+    # Other hosts are not affected
+    with pytest.raises(Exception, match="500"):
+        await rules.read("https://b.org", format="txt")
+
+    # The host is tried again after the cooldown
+    await asyncio.sleep(0.1)
+    fetcher.responses = [FakeResponse("ok")]
+    assert await rules.read("https://a.org", format="txt") == "ok"
+    assert rules._circuits["a.org"].failures == 0
+
+
+async def test_long_retry_after_fails_fast():
+    fetcher = ScriptedFetcher(
+        responses=[
+            FakeResponse("", status_code=429, headers={"retry-after": "86400"}),
+            FakeResponse("ok"),
+        ]
+    )
+    rules = _rules(fetcher, rates={"a.org": RateLimit(rate=100, burst=5)})
+    start = time.monotonic()
+    with pytest.raises(Exception, match="429"):
+        await rules.read("https://a.org", format="txt")
+    # The host is skipped instead of paused for a day
+    with pytest.raises(HostUnavailable):
+        await rules.read("https://a.org", format="txt")
+    assert time.monotonic() - start < 1
+    assert len(fetcher.times) == 1
+    assert rules._buckets["a.org"].paused_until < time.monotonic() + 1
+
+
+async def test_retry_after_beyond_budget():
+    request = httpx.Request("GET", "https://a.org")
+    error = httpx.HTTPStatusError(
+        "Too Many Requests",
+        request=request,
+        response=httpx.Response(429, headers={"retry-after": "60"}, request=request),
+    )
+    fetcher = ScriptedFetcher(responses=[error])
+
+    async def generic(method, url, **kwargs):
+        fetcher.times.append(time.monotonic())
+        raise error
+
+    fetcher.generic = generic
+    with pytest.raises(HostUnavailable):
+        await fetcher.read_retry("https://a.org", format="txt")
+    assert len(fetcher.times) == 1
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    # Keep connections alive
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(0.1)
+        body = threading.current_thread().name.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def slow_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+async def test_requests_fetcher_does_not_block(slow_server):
+    fetcher = RequestsFetcher(threads=8)
+    start = time.monotonic()
+    await asyncio.gather(
+        *[fetcher.read(f"{slow_server}/{i}", format="txt") for i in range(8)]
+    )
+    assert time.monotonic() - start < 0.5
+
+    # Each thread keeps its own session
+    def session():
+        time.sleep(0.01)
+        return fetcher.session
+
+    sessions = set(await asyncio.gather(*[fetcher._run(session) for _ in range(32)]))
+    assert 1 < len(sessions) <= 8
+
+
+async def test_httpx_clients_are_shared(slow_server):
+    a, b = HTTPXFetcher(), HTTPXFetcher(user_agent="firefox")
+    assert a.client is b.client
+    assert HTTPXFetcher(max_connections=5).client is not a.client
+
+    before = dict(clients.stats)
+    for fetcher in (a, b, a):
+        await fetcher.read(slow_server, format="txt")
+    assert clients.stats["requests"] - before["requests"] == 3
+    assert clients.stats["connections"] - before["connections"] == 1
+
+    client = a.client
+    await clients.aclose()
+    assert client.is_closed
+    assert a.client is not client
+
+
+DATA = bytes(range(256)) * 2000
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Whether to honor Range headers, and whether to cut the next response
+    ranges = True
+    truncate = False
+    requests = []
+    # Version of the file, which If-Range must match for a range to be sent
+    etag = '"v1"'
+
+    def do_GET(self):
+        start = 0
+        if (
+            self.ranges
+            and (rng := self.headers.get("Range"))
+            and self.headers.get("If-Range", self.etag) == self.etag
+        ):
+            start = int(rng.removeprefix("bytes=").removesuffix("-"))
+        body = DATA[start:]
+        type(self).requests.append(self.headers.get("Range"))
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.etag)
+        if start:
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(DATA) - 1}/{len(DATA)}"
+            )
+        self.end_headers()
+        if type(self).truncate:
+            type(self).truncate = False
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def range_server():
+    RangeHandler.ranges = True
+    RangeHandler.truncate = False
+    RangeHandler.requests = []
+    RangeHandler.etag = '"v1"'
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/file.pdf"
+    server.shutdown()
+    server.server_close()
+
+
+async def test_download(range_server, tmp_path):
+    dest = tmp_path / "file.pdf"
+    checksum = "sha256:" + hashlib.sha256(DATA).hexdigest()
+    await HTTPXFetcher().download(range_server, dest, checksum=checksum)
+    assert dest.read_bytes() == DATA
+    assert not (tmp_path / "file.pdf.part").exists()
+
+
+async def test_download_resume(range_server, tmp_path):
+    dest = tmp_path / "file.pdf"
+    part = tmp_path / "file.pdf.part"
+    RangeHandler.truncate = True
+    with pytest.raises((IncompleteDownload, httpx.TransportError)):
+        await HTTPXFetcher().download(range_server, dest)
+    # The partial data is kept for later, but not at the destination
+    assert not dest.exists()
+    size = part.stat().st_size
+    assert 0 < size < len(DATA)
+
+    await HTTPXFetcher().download(range_server, dest)
+    assert dest.read_bytes() == DATA
+    assert RangeHandler.requests == [None, f"bytes={size}-"]
+    assert not (tmp_path / "file.pdf.part.json").exists()
+
+
+async def test_download_resume_changed_file(range_server, tmp_path):
+    dest = tmp_path / "file.pdf"
+    RangeHandler.truncate = True
+    with pytest.raises((IncompleteDownload, httpx.TransportError)):
+        await HTTPXFetcher().download(range_server, dest)
+
+    # The file changed on the server, so it is downloaded again in full
+    RangeHandler.etag = '"v2"'
+    await HTTPXFetcher().download(range_server, dest)
+    assert dest.read_bytes() == DATA
+    assert RangeHandler.requests[1] is not None
+
+
+async def test_download_resume_without_validator(range_server, tmp_path):
+    dest = tmp_path / "file.pdf"
+    (tmp_path / "file.pdf.part").write_bytes(DATA[:100])
+    await HTTPXFetcher().download(range_server, dest)
+    assert dest.read_bytes() == DATA
+    assert RangeHandler.requests == [None]
+
+
+async def test_download_same_file(range_server, tmp_path):
+    dest = tmp_path / "file.pdf"
+    await asyncio.gather(*[HTTPXFetcher().download(range_server, dest) for _ in range(3)])
+    assert dest.read_bytes() == DATA
+    assert not (tmp_path / "file.pdf.part").exists()
+
+
+async def test_download_without_range_support(range_server, tmp_path):
+    RangeHandler.ranges = False
+    dest = tmp_path / "file.pdf"
+    (tmp_path / "file.pdf.part").write_bytes(b"garbage")
+    await RequestsFetcher().download(range_server, dest)
+    assert dest.read_bytes() == DATA
+
+
+async def test_download_checksum_mismatch(range_server, tmp_path):
+    dest = tmp_path / "file.pdf"
+    with pytest.raises(IOError, match="Checksum mismatch"):
+        await HTTPXFetcher().download(range_server, dest, checksum="sha256:1234")
+    assert not dest.exists()
+    assert not (tmp_path / "file.pdf.part").exists()
+
+
+async def test_download_limiter(slow_server, tmp_path):
+    limiter = DownloadLimiter(simultaneous=1)
+    start = time.monotonic()
+    await asyncio.gather(
+        *[
+            HTTPXFetcher().download(
+                f"{slow_server}/{i}", tmp_path / str(i), limiter=limiter
+            )
+            for i in range(3)
+        ]
+    )
+    assert time.monotonic() - start >= 0.3
@@ -0,0 +1,173 @@
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import cached_property
+from pathlib import Path
+
+import httpx
+import pytest
+
+from paperoni.get import CachedFetcher, HTTPXFetcher
+from paperoni.httpcache import ResponseCache, cache_lifetime
+
+pytest.importorskip("compression.zstd")
+
+
+def _put(cache, key, content, **kwargs):
+    cache.put(
+        key,
+        url=f"https://{key}.org",
+        status=200,
+        headers={"content-type": "text/plain"},
+        content=content,
+        **kwargs,
+    )
+
+
+def test_cache_roundtrip(tmp_path: Path):
+    cache = ResponseCache(tmp_path / "cache.db")
+    assert cache.get("a") is None
+    _put(cache, "a", b"hello" * 1000)
+
+    response = cache.get("a")
+    assert response.content == b"hello" * 1000
+    assert response.status == 200
+    assert response.headers == {"content-type": "text/plain"}
+    assert response.url == "https://a.org"
+
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 1
+    assert cache.stats["bytes_saved"] == 5000
+    assert cache.hit_ratio == 0.5
+    usage = cache.usage()
+    assert usage["size"] == 5000
+    assert usage["stored"] < 5000
+
+
+def test_cache_deduplicates_bodies(tmp_path: Path):
+    cache = ResponseCache(tmp_path / "cache.db")
+    _put(cache, "a", b"same body")
+    _put(cache, "b", b"same body")
+    _put(cache, "c", b"other body")
+    assert cache.stats["deduplicated"] == 1
+    assert cache.usage()["entries"] == 3
+    assert cache.usage()["blobs"] == 2
+
+    # Replacing the only entry that points to a body removes the body
+    _put(cache, "c", b"same body")
+    assert cache.usage()["blobs"] == 1
+    assert cache.get("c").content == b"same body"
+
+
+def test_cache_expiry(tmp_path: Path):
+    cache = ResponseCache(tmp_path / "cache.db", expire_after=timedelta(days=1))
+    _put(cache, "a", b"a")
+    _put(cache, "b", b"b", ttl=timedelta(seconds=-1))
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.purge() == 1
+    assert len(cache) == 1
+    assert cache.usage()["blobs"] == 1
+
+
+def test_cache_lru_eviction(tmp_path: Path):
+    cache = ResponseCache(tmp_path / "cache.db", max_size=10**6, level=1)
+    bodies = {key: bytes(range(256)) * 100 + key.encode() for key in "abcd"}
+    for key in "abc":
+        _put(cache, key, bodies[key])
+    stored = cache.usage()["stored"]
+    cache.max_size = stored
+    # Using a makes b the least recently used
+    cache.get("a")
+    _put(cache, "d", bodies["d"])
+    assert cache.get("b") is None
+    assert [cache.get(k).content for k in "acd"] == [bodies[k] for k in "acd"]
+    assert cache.stats["evicted"] == 1
+    assert cache.usage()["stored"] <= stored
+    # The size of the bodies is kept up to date instead of counted on each put
+    assert cache._stored == cache.usage()["stored"]
+    _put(cache, "a", bodies["b"])
+    assert cache._stored == cache.usage()["stored"]
+    cache.purge()
+    assert cache._stored == cache.usage()["stored"]
+
+
+@dataclass
+class CountingFetcher(CachedFetcher):
+    calls: int = 0
+
+    @cached_property
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.respond))
+
+    def respond(self, request):
+        self.calls += 1
+        if "missing" in str(request.url):
+            return httpx.Response(404)
+        headers = {}
+        if cache_control := request.url.params.get("cache-control"):
+            headers["cache-control"] = cache_control
+        return httpx.Response(200, json={"url": str(request.url)}, headers=headers)
+
+
+async def test_cached_fetcher(tmp_path: Path):
+    fetcher = CountingFetcher(
+        cache_path=tmp_path / "requests", expire_after=timedelta(days=1)
+    )
+    assert isinstance(fetcher, HTTPXFetcher)
+    url = "https://example.org/x"
+    assert await fetcher.read(url, format="json") == {"url": url}
+    assert await fetcher.read(url, format="json") == {"url": url}
+    assert await fetcher.read(url, format="json", params={"y": 1}) == {
+        "url": url + "?y=1"
+    }
+    assert fetcher.calls == 2
+    assert fetcher.cache.stats["hits"] == 1
+
+    # Failures are not cached
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            await fetcher.read("https://example.org/missing", format="json")
+    assert fetcher.calls == 4
+
+
+@pytest.mark.parametrize(
+    ["cache_control", "expire_after", "ttl"],
+    [
+        (None, None, None),
+        (None, timedelta(days=1), timedelta(days=1)),
+        ("max-age=60", None, timedelta(seconds=60)),
+        ("public, max-age=60", timedelta(days=1), timedelta(seconds=60)),
+        ("max-age=172800", timedelta(days=1), timedelta(days=1)),
+        ("no-store", timedelta(days=1), None),
+        ("no-cache", None, None),
+    ],
+)
+async def test_cached_fetcher_cache_control(tmp_path, cache_control, expire_after, ttl):
+    fetcher = CountingFetcher(cache_path=tmp_path / "requests", expire_after=expire_after)
+    params = {"cache-control": cache_control} if cache_control else {}
+    for _ in range(2):
+        await fetcher.read("https://example.org/x", format="json", params=params)
+    if ttl is None:
+        assert fetcher.calls == 2
+        assert len(fetcher.cache) == 0
+    else:
+        assert fetcher.calls == 1
+        (stored,) = fetcher.cache.conn.execute("SELECT ttl FROM entries").fetchone()
+        assert stored == ttl.total_seconds()
+
+
+def test_cache_lifetime():
+    assert cache_lifetime({}) is None
+    assert cache_lifetime({"cache-control": "private, max-age=30"}) == 30
+    assert cache_lifetime({"cache-control": "no-store, max-age=30"}) == 0
+    assert cache_lifetime({"cache-control": "max-age=oops"}) == 0
+    assert (
+        cache_lifetime(
+            {
+                "date": "Wed, 21 Oct 2015 07:28:00 GMT",
+                "expires": "Wed, 21 Oct 2015 08:28:00 GMT",
+            }
+        )
+        == 3600
+    )
+    assert cache_lifetime({"expires": "0"}) == 0
@@ -3,7 +3,15 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from paperoni.model import Link
-from paperoni.utils import asciiify, expand_links_dict, mostly_latin, soft_fail
+from paperoni.utils import (
+    AhoCorasick,
+    asciiify,
+    expand_links_dict,
+    mostly_latin,
+    normalization_cache_info,
+    normalize_name,
+    soft_fail,
+)
 
 
 @pytest.mark.parametrize(
@@ -228,3 +236,23 @@ def test_generator_exit_propagates():
     gen = gen_func()
     next(gen)
     gen.close()
+
+
+def test_normalization_cache():
+    normalize_name.cache_clear()
+    assert normalize_name("Jean-François Côté") == "jean-francois cote"
+    assert normalize_name("Jean-François Côté") == "jean-francois cote"
+    info = normalization_cache_info()["normalize_name"]
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_aho_corasick():
+    ac = AhoCorasick({"he": 1, "she": 2, "his": 3, "hers": 4})
+    assert sorted(ac.find("ushers")) == [(1, 4, 2), (2, 4, 1), (2, 6, 4)]
+    assert ac.find_words("he said hers, she said his") == [
+        (0, 2, 1),
+        (8, 12, 4),
+        (14, 17, 2),
+        (23, 26, 3),
+    ]
+    assert ac.find_words("ushers") == []
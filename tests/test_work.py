@@ -1,6 +1,9 @@
-from datetime import datetime
+import asyncio
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
 from time import sleep
+from typing import Literal
 
 from serieux import CommentRec, dump, load
 
@@ -8,9 +11,10 @@ from paperoni.__main__ import Work
 from paperoni.collection.filecoll import FileCollection
 from paperoni.collection.memcoll import MemCollection
 from paperoni.discovery.semantic_scholar import SemanticScholar
-from paperoni.model.classes import Paper
-from paperoni.model.focus import Scored, Top
+from paperoni.model.classes import Author, Institution, Link, Paper, PaperAuthor
+from paperoni.model.focus import Focus, Focuses, Scored, Top
 from paperoni.model.merge import PaperWorkingSet
+from paperoni.refinement.fetch import register_fetch
 
 
 async def work(command, **kwargs):
@@ -145,3 +149,73 @@ async def test_work_updates_collection_papers(tmp_path: Path):
     mem_col._index = col._index
     await mem_col.add_papers([scored.value.current for scored in state])
     assert await mem_col.find_paper(paper_to_update) is not None
+
+
+@register_fetch(tags={"worktest"})
+async def worktest(typ: Literal["worktest"], link: str):
+    if link == "slow":
+        await asyncio.sleep(10)
+    author = PaperAuthor(
+        display_name="Alice Smith",
+        author=Author(name="Alice Smith"),
+        affiliations=[Institution(name="Mila")],
+    )
+    return Paper(title="A", authors=[author], key=f"worktest:{link}")
+
+
+async def test_work_refine_stops_when_enough(tmp_path: Path):
+    work_file = tmp_path / "state.json"
+    await Work(command=Work.Configure(n=10), work_file=work_file).run()
+    paper = Paper(
+        title="A",
+        authors=[
+            PaperAuthor(display_name="Alice Smith", author=Author(name="Alice Smith"))
+        ],
+        links=[Link(type="worktest", link="fast"), Link(type="worktest", link="slow")],
+        key="orig:A",
+    )
+    top = load(Top[Scored[CommentRec[PaperWorkingSet, float]]], work_file)
+    top.add(Scored(1.0, PaperWorkingSet.make(paper)))
+    dump(Top[Scored[CommentRec[PaperWorkingSet, float]]], top, dest=work_file)
+
+    work = Work(
+        command=Work.Refine(tags={"worktest"}, enough=5.0, checkpoint=timedelta(0)),
+        work_file=work_file,
+    )
+    work.focuses = Focuses(main=[Focus("institution", "Mila", 5.0)])
+    t0 = time.monotonic()
+    await work.run()
+    assert time.monotonic() - t0 < 5
+
+    (sws,) = load(Top[Scored[CommentRec[PaperWorkingSet, float]]], work_file)
+    assert sws.score == 5.0
+    assert [p.key for p in sws.value.collected] == [
+        "orig:A",
+        "worktest/worktest:fast",
+    ]
+
+
+async def test_work_refine_n_zero_refines_all(tmp_path: Path):
+    work_file = tmp_path / "state.json"
+    await Work(command=Work.Configure(n=10), work_file=work_file).run()
+    top = load(Top[Scored[CommentRec[PaperWorkingSet, float]]], work_file)
+    for title in ["A", "B"]:
+        paper = Paper(
+            title=title,
+            authors=[],
+            links=[Link(type="worktest", link=title)],
+            key=f"orig:{title}",
+        )
+        top.add(Scored(1.0, PaperWorkingSet.make(paper)))
+    dump(Top[Scored[CommentRec[PaperWorkingSet, float]]], top, dest=work_file)
+
+    # -n 0 means to refine all the entries
+    work = Work(
+        command=Work.Refine(tags={"worktest"}, n=0, checkpoint=timedelta(0)),
+        work_file=work_file,
+    )
+    work.focuses = Focuses(main=[Focus("institution", "Mila", 5.0)])
+    await work.run()
+
+    top = load(Top[Scored[CommentRec[PaperWorkingSet, float]]], work_file)
+    assert sorted(len(sws.value.collected) for sws in top) == [2, 2]
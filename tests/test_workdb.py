@@ -0,0 +1,178 @@
+from pathlib import Path
+
+from paperoni.__main__ import Work
+from paperoni.model.classes import Author, Paper, PaperAuthor
+from paperoni.model.focus import Focus, Focuses, Scored
+from paperoni.model.merge import PaperWorkingSet
+from paperoni.workdb import WorkDB, WorkDBTop
+
+
+def _entry(title, score, key=None):
+    paper = Paper(
+        title=title,
+        authors=[
+            PaperAuthor(display_name="Alice Smith", author=Author(name="Alice Smith"))
+        ],
+        key=key or f"test:{title}",
+        score=score,
+    )
+    return Scored(score, PaperWorkingSet.make(paper))
+
+
+def _db(tmp_path: Path, n=3):
+    db = WorkDB(tmp_path / "work.db")
+    db.configure(n)
+    return db
+
+
+def _titles(rows):
+    return [row.entry.value.current.title for row in rows]
+
+
+def test_workdb_top_n(tmp_path: Path):
+    db = _db(tmp_path)
+    for title, score in [("A", 1.0), ("B", 4.0), ("C", 2.0), ("D", 3.0)]:
+        db.insert(_entry(title, score))
+    assert db.insert(_entry("E", 0.5)) is None
+    assert db.insert(_entry("Z", 0.0)) is None
+
+    assert len(db) == 3
+    assert _titles(db.top()) == ["B", "D", "C"]
+    assert _titles(db.top(2, offset=1)) == ["D", "C"]
+    assert db.conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+    db.configure(2)
+    assert _titles(db.top()) == ["B", "D"]
+
+
+def test_workdb_update_version(tmp_path: Path):
+    db = _db(tmp_path)
+    i = db.insert(_entry("A", 1.0))
+    (row,) = db.find_key("test:A")
+    assert row.id == i
+
+    assert db.update(i, _entry("A", 5.0), version=row.version)
+    # The row was modified since it was read
+    assert not db.update(i, _entry("A", 6.0), version=row.version)
+    assert db.get(i).entry.score == 5.0
+    assert db.get(i).version == row.version + 1
+
+    # Entries whose score dropped to zero are removed
+    assert db.update(i, _entry("A", 0.0))
+    assert db.get(i) is None
+
+
+def test_workdb_claim(tmp_path: Path):
+    db = _db(tmp_path, n=10)
+    for title, score in [("A", 1.0), ("B", 4.0), ("C", 2.0), ("D", 3.0)]:
+        db.insert(_entry(title, score))
+
+    assert _titles(db.claim(2, "p1", lease=60)) == ["B", "D"]
+    assert _titles(db.claim(3, "p2", lease=60)) == ["C", "A"]
+    assert db.claim(1, "p3", lease=60) == []
+    assert sorted(db.leased().values()) == ["p1", "p1", "p2", "p2"]
+
+    db.release([row.id for row in db.find_key("test:B")], "p1")
+    assert _titles(db.claim(5, "p3", lease=60)) == ["B"]
+
+    # Expired leases can be claimed again
+    assert _titles(db.claim(5, "p4", lease=-1)) == []
+    db.conn.execute("UPDATE worksets SET lease_expiry = 0")
+    assert _titles(db.claim(5, "p4", lease=60)) == ["B", "D", "C", "A"]
+
+
+def test_workdb_top_save(tmp_path: Path):
+    db = _db(tmp_path, n=10)
+    for title, score in [("A", 1.0), ("B", 4.0), ("C", 2.0)]:
+        db.insert(_entry(title, score))
+    versions = {row.entry.value.current.title: row.version for row in db.top()}
+
+    top = WorkDBTop(db)
+    entries = {e.value.current.title: e for e in top}
+    a, c = entries["A"], entries["C"]
+    a.score = 5.0
+    top.update(a)
+    top.discard(c)
+    top.add(_entry("D", 3.0))
+    top.save()
+
+    rows = db.top()
+    assert [(e.value.current.title, e.score) for e in (r.entry for r in rows)] == [
+        ("A", 5.0),
+        ("B", 4.0),
+        ("D", 3.0),
+    ]
+    # Unchanged rows are not rewritten
+    assert {r.entry.value.current.title: r.version for r in rows}["B"] == versions["B"]
+
+
+def test_workdb_concurrent_changes_are_merged(tmp_path: Path):
+    db = _db(tmp_path, n=10)
+    db.insert(_entry("A", 1.0))
+
+    top1 = WorkDBTop(db)
+    top2 = WorkDBTop(WorkDB(db.file))
+    (e1,) = top1
+    (e2,) = top2
+    extra = Paper(
+        title="A",
+        authors=[PaperAuthor(display_name="Bob Jones", author=Author(name="Bob Jones"))],
+        key="test:A2",
+    )
+    e1.value.add(extra)
+    e1.score = 2.0
+    top1.save()
+
+    e2.score = 3.0
+    e2.value.add(Paper(title="A", authors=[], key="test:A3"))
+    top2.save()
+
+    (row,) = db.top()
+    assert {p.key for p in row.entry.value.collected} == {"test:A", "test:A2", "test:A3"}
+    assert row.entry.score == 3.0
+    # The entry that was saved last now holds the merged working set
+    assert len(e2.value.collected) == 3
+
+
+def test_workdb_top_save_does_not_delete_claimed_rows(tmp_path: Path):
+    db = _db(tmp_path, n=10)
+    for title, score in [("A", 1.0), ("B", 2.0)]:
+        db.insert(_entry(title, score))
+
+    top = WorkDBTop(db)
+    (a_row,) = db.find_key("test:A")
+    claimed = db.claim(1, "refiner", lease=60)
+    assert _titles(claimed) == ["B"]
+    # Another process modifies A
+    db.update(a_row.id, _entry("A", 1.5))
+
+    for entry in list(top):
+        top.discard(entry)
+    top.save()
+
+    assert sorted(_titles(db.top())) == ["A", "B"]
+    assert sorted(top.conflicts) == sorted([a_row.id, claimed[0].id])
+
+
+async def test_work_with_database(tmp_path: Path):
+    work_file = tmp_path / "work.db"
+    await Work(command=Work.Configure(n=5), work_file=work_file).run()
+    db = WorkDB(work_file)
+    assert db.configured and db.n == 5
+    for title, score in [("A", 1.0), ("B", 4.0), ("C", 2.0)]:
+        db.insert(_entry(title, score))
+
+    work = Work(command=Work.View(what="title"), work_file=work_file)
+    assert [e.value.current.title for e in work.top] == ["B", "C", "A"]
+
+    work = Work(command=None, work_file=work_file)
+    work.focuses = Focuses(main=[Focus("author", "Alice Smith", 1.0)])
+    claimed = work.claim(2)
+    assert [e.value.current.title for e in claimed] == ["B", "C"]
+    assert len(db.leased()) == 2
+    for e in claimed:
+        e.score = work.focuses.score(e.value)
+        claimed.update(e)
+    work.save(claimed)
+    assert db.leased() == {}
+    assert [r.entry.score for r in db.top()] == [1.0, 1.0, 1.0]
@@ -52,6 +52,28 @@ def wr_app(oauth_mock, cfg_src, tmp_path):
         yield appt
 
 
+@pytest.fixture(scope="function")
+def operate_app(oauth_mock, cfg_src, tmp_path):
+    from paperoni.web import create_app
+
+    src_collfile = here / ".." / "data" / "papers.yaml"
+    collfile = tmp_path / "papers.yaml"
+    shutil.copy(str(src_collfile), str(collfile))
+
+    overlay = {
+        "paperoni.server.enable_operate": True,
+        "paperoni.server.operate_chunk_size": 3,
+        "paperoni.server.operate_jobs_max": 1,
+    }
+    with gifnoc.use(*cfg_src, overlay):
+        app = create_app()
+
+    with AppTester(
+        app, oauth_mock, wrap=partial(_wrap, [*cfg_src, overlay], collfile)
+    ) as appt:
+        yield appt
+
+
 @pytest.fixture
 def app_factory(oauth_mock, cfg_src):
     from paperoni.web import create_app
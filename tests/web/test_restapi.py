@@ -1,3 +1,4 @@
+import time
 from dataclasses import replace
 from datetime import date
 
@@ -308,3 +309,55 @@ def test_delete_papers_endpoint(wr_app):
     assert response.status_code == 200
     data = response.json()
     assert data["count"] == 0
+
+
+CAPITALIZE = "return replace(paper, title=paper.title.upper())"
+
+
+def test_operate_simulate_endpoint(operate_app):
+    """Test that simulate previews a page of matched papers."""
+    admin = operate_app.client("admin@website.web")
+
+    response = admin.post(
+        "/api/v1/operate",
+        operation='return paper.title.startswith("A")',
+        mode="simulate",
+        limit=1,
+    )
+    data = response.json()
+    assert data["total"] == 10
+    assert data["count"] == 1
+    assert data["matched"] == 1
+    assert data["results"][0]["current"]["title"].startswith("A")
+    assert data["next_offset"] == data["matched"] + data["unmatched"]
+
+
+def test_operate_apply_endpoint(operate_app):
+    """Test that apply runs in the background and reports its progress."""
+    admin = operate_app.client("admin@website.web")
+
+    def run_job():
+        response = admin.post("/api/v1/operate", operation=CAPITALIZE, mode="apply")
+        data = response.json()
+        assert data["total"] == 10
+        assert data["job"]
+        for _ in range(100):
+            job = admin.get(f"/api/v1/operate/jobs/{data['job']}").json()
+            if job["status"] != "running":
+                break
+            time.sleep(0.1)
+        return job
+
+    job = run_job()
+    assert job["status"] == "done"
+    assert job["processed"] == job["matched"] == 10
+
+    titles = [p["title"] for p in admin.get("/api/v1/search").json()["results"]]
+    assert all(t == t.upper() for t in titles)
+
+    admin.get("/api/v1/operate/jobs/nope", expect=404)
+
+    # Only the most recent finished job is kept
+    job2 = run_job()
+    assert job2["status"] == "done"
+    admin.get(f"/api/v1/operate/jobs/{job['id']}", expect=404)